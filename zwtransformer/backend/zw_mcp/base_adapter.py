@@ -1,37 +1,324 @@
 # backend/zw_mcp/base_adapter.py
-from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+import asyncio
+import functools
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, FrozenSet, Iterable, Tuple, Protocol, ClassVar, Sequence
 
 
-class BaseEngineAdapter(ABC):
+# Max number of distinct parsed_zw key layouts remembered per adapter
+SUPPORTED_BLOCKS_CACHE_SIZE = 128
+
+# Entries kept in each adapter's can_process inline cache
+INLINE_CACHE_SIZE = 3
+
+# Lowercase block type -> single-bit mask; adapters OR these into a capability mask
+BLOCK_TYPE_BIT: Dict[str, int] = {}
+
+
+def _register_block_type(block_type: str) -> int:
+    """Assign the next free bit to a lowercase block type (idempotent)."""
+    bit = BLOCK_TYPE_BIT.get(block_type)
+    if bit is None:
+        bit = BLOCK_TYPE_BIT[block_type] = 1 << len(BLOCK_TYPE_BIT)
+    return bit
+
+
+for _block_type in ("mesh", "scene", "material", "light", "camera", "animation", "compose"):
+    _register_block_type(_block_type)
+
+
+def _build_capability_lookup(capabilities: Iterable[str]) -> Tuple[FrozenSet[str], int]:
+    """Return the lowercase, interned capability set and its BLOCK_TYPE_BIT mask."""
+    caps_lower = frozenset(sys.intern(cap.lower()) for cap in capabilities)
+    mask = 0
+    for cap in caps_lower:
+        mask |= _register_block_type(cap)
+    return caps_lower, mask
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_block_type(key: str) -> Optional[str]:
+    """
+    Map a top-level ZW key to its interned lowercase block type
+    (e.g., "ZW-MESH" -> "mesh"), or None if it is not a ZW block key.
+    Memoized: ZW keys come from a small vocabulary that recurs across documents.
+    """
+    if len(key) >= 3 and key[0] in 'Zz' and key[1] in 'Ww' and key[2] == '-':
+        return sys.intern(key[3:].lower())
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def _capability_trie(caps: FrozenSet[str]) -> Optional[Dict[Optional[str], Any]]:
+    """
+    Build a trie over the dot-separated segments of hierarchical capabilities
+    (e.g., "mesh.skinned"), or None if no capability is hierarchical.
+    A None key marks a node that ends a capability.
+    """
+    if not any('.' in cap for cap in caps):
+        return None
+    trie: Dict[Optional[str], Any] = {}
+    for cap in caps:
+        node = trie
+        for segment in cap.split('.'):
+            node = node.setdefault(segment, {})
+        node[None] = True
+    return trie
+
+
+def _matches_capability_prefix(caps: FrozenSet[str], block_type: str) -> bool:
+    """
+    Hierarchical fallback for exact-match misses: True if some capability is
+    a dotted prefix of block_type (capability "mesh.skinned" covers
+    "mesh.skinned.cloth"). Only adapters with dotted capabilities take part.
+    """
+    if '.' not in block_type:
+        return False
+    trie = _capability_trie(caps)
+    if trie is None:
+        return False
+    node = trie
+    for segment in block_type.split('.'):
+        node = node.get(segment)
+        if node is None:
+            return False
+        if None in node:
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=64)
+def _block_key_pattern(caps: FrozenSet[str]) -> Optional["re.Pattern[str]"]:
+    """
+    Compile one case-insensitive pattern matching "ZW-<capability>" keys for a
+    capability set. Cached per set, so adapters sharing capabilities share it.
+    When a capability is dotted, any capability may also be followed by
+    ".<anything>", which is the same rule _matches_capability_prefix applies.
+    """
+    if not caps:
+        return None
+    # Longest first so no alternative shadows a longer capability
+    alternatives = '|'.join(re.escape(cap) for cap in sorted(caps, key=len, reverse=True))
+    if _capability_trie(caps) is not None:
+        alternatives = r'(?:' + alternatives + r')(?:\..*)?'
+    return re.compile(r'ZW-(' + alternatives + r')', re.IGNORECASE | re.DOTALL)
+
+
+def _filter_supported_blocks(parsed_zw: Dict[str, Any], caps: FrozenSet[str]) -> List[str]:
+    """
+    Return the interned block types of the top-level ZW keys found in caps.
+    Kept free of adapter state so the hot loop can be swapped for a compiled
+    implementation without touching the adapter classes.
+    """
+    pattern = _block_key_pattern(caps)
+    if pattern is None:
+        return []
+    match = pattern.fullmatch
+    intern = sys.intern
+
+    # Check top-level ZW blocks (e.g., "ZW-MESH" -> "mesh", or "ZW-MESH.SKINNED.CLOTH"
+    # under capability "mesh.skinned") in a single C-level regex match per key
+    return [intern(m.group(1).lower()) for key in parsed_zw if (m := match(key))]
+
+
+class _CapabilityList(list):
+    """
+    List of capabilities that invalidates its owner's lookup cache on mutation.
+    Lets subclasses keep using ``self.capabilities.append(...)`` and friends.
+    """
+
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner: "BaseEngineAdapter", iterable: Iterable[str] = ()):
+        super().__init__(iterable)
+        self._owner = owner
+
+    def _invalidate(self):
+        self._owner._invalidate_capability_cache()
+
+    def append(self, item):
+        super().append(item)
+        self._invalidate()
+
+    def extend(self, iterable):
+        super().extend(iterable)
+        self._invalidate()
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._invalidate()
+
+    def remove(self, item):
+        super().remove(item)
+        self._invalidate()
+
+    def pop(self, *args):
+        item = super().pop(*args)
+        self._invalidate()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._invalidate()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._invalidate()
+
+    def __iadd__(self, other):
+        result = super().__iadd__(other)
+        self._invalidate()
+        return result
+
+
+class EngineAdapterProtocol(Protocol):
+    """
+    Structural interface the EngineRouter relies on. Adapters do not have to
+    inherit from BaseEngineAdapter as long as they provide these members.
+    """
+
+    name: str
+
+    def get_capabilities(self) -> Tuple[str, ...]: ...
+
+    def process_zw_data(self, zw_data: str, parsed_zw: Dict[str, Any],
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]: ...
+
+    def get_status(self) -> Dict[str, Any]: ...
+
+    def can_process(self, zw_block_type: str) -> bool: ...
+
+    def can_process_normalized(self, zw_block_type: str) -> bool: ...
+
+    def can_process_many(self, zw_block_types: Sequence[str]) -> List[bool]: ...
+
+    def initialize(self) -> bool: ...
+
+    def ensure_initialized(self) -> bool: ...
+
+    async def initialize_async(self) -> bool: ...
+
+    def shutdown(self) -> bool: ...
+
+
+class BaseEngineAdapter:
     """
-    Abstract base class for all engine adapters in the ZW Multi-Engine Router system.
+    Base class for all engine adapters in the ZW Multi-Engine Router system.
     Each engine (Blender, Godot, Unity, etc.) implements this interface.
+    Subclasses must override process_zw_data; this is a
+    plain class rather than an ABC so instantiation and isinstance checks
+    skip the ABCMeta machinery.
+
+    Instances use __slots__; subclasses should declare their own __slots__
+    (an empty tuple if they add no attributes) to keep instances dict-free.
+
+    Subclasses with a fixed capability set should declare it as the class
+    attribute CAPABILITIES; its lookup set is then built once per class and
+    shared by every instance that does not modify its capabilities.
+
+    MAX_CONCURRENCY caps how many packets the router hands the adapter at
+    once; None lets the router pick its default. Adapters whose work must
+    stay on the calling thread report runs_inline, and the router then skips
+    their worker pool.
     """
-    
+
+    CAPABILITIES: ClassVar[Tuple[str, ...]] = ()
+    MAX_CONCURRENCY: ClassVar[Optional[int]] = None
+    _CAPS_LOWER: ClassVar[FrozenSet[str]] = frozenset()
+    _CAPS_MASK: ClassVar[int] = 0
+
+    __slots__ = ('name', 'version', '_capabilities', 'status',
+                 '_caps_lower', '_supported_cache', '_status_template', '_pic', '_caps_generation',
+                 '_caps_mask', '_initialized', '_init_lock', '_repr_prefix', '_capabilities_tuple')
+
     def __init__(self, name: str, version: str = "1.0.0"):
         self.name = name.lower()
         self.version = version
-        self.capabilities: List[str] = []
+        self._caps_lower: Optional[FrozenSet[str]] = None
+        self._caps_mask = 0
+        self._capabilities_tuple: Optional[Tuple[str, ...]] = None
+        self._supported_cache: "OrderedDict[Tuple[str, ...], List[str]]" = OrderedDict()
+        self._status_template: Optional[Dict[str, Any]] = None
+        # Bumped on every capability change; tags the can_process inline cache
+        self._caps_generation = 0
+        # (generation, recent (raw block type, result) pairs); replaced whole, never mutated
+        self._pic: Tuple[int, Tuple[Tuple[str, bool], ...]] = (0, ())
+        self._initialized = False
+        # Serializes initialize(): async warm-up and lazy dispatch may both ask for it
+        self._init_lock = threading.Lock()
+        self.capabilities: List[str] = list(self.CAPABILITIES)
         self.status = "inactive"
+        # Only status changes after construction; splice it in at repr time
+        self._repr_prefix = f"<{self.__class__.__name__}(name='{self.name}', version='{self.version}', status='"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'CAPABILITIES' in cls.__dict__:
+            cls._CAPS_LOWER, cls._CAPS_MASK = _build_capability_lookup(cls.CAPABILITIES)
+
+    @property
+    def capabilities(self) -> List[str]:
+        return self._capabilities
+
+    @capabilities.setter
+    def capabilities(self, value: Iterable[str]):
+        self._capabilities = _CapabilityList(self, value)
+        self._invalidate_capability_cache()
+
+    def _invalidate_capability_cache(self):
+        """Drop cached capability lookups. Called whenever capabilities change."""
+        self._caps_lower = None
+        self._caps_mask = 0
+        self._capabilities_tuple = None
+        self._supported_cache.clear()
+        self._status_template = None
+        self._caps_generation += 1
+        self._pic = (self._caps_generation, ())
+
+    def _build_caps_lower(self) -> FrozenSet[str]:
+        """
+        Build (once) the lowercase, interned capability set used by can_process,
+        along with the matching BLOCK_TYPE_BIT mask. Reuses the class-level
+        lookup while the instance still has the declared CAPABILITIES.
+        """
+        cls = type(self)
+        if tuple(self._capabilities) == cls.CAPABILITIES:
+            self._caps_lower, self._caps_mask = cls._CAPS_LOWER, cls._CAPS_MASK
+        else:
+            self._caps_lower, self._caps_mask = _build_capability_lookup(self._capabilities)
+        return self._caps_lower
         
-    @abstractmethod
-    def get_capabilities(self) -> List[str]:
+    def get_capabilities(self) -> Tuple[str, ...]:
         """
-        Returns a list of ZW block types this engine can process.
-        Example: ["mesh", "scene", "material", "light", "camera"]
+        Returns the ZW block types this engine can process as an immutable
+        tuple, built once and reused until capabilities change.
+        Example: ("mesh", "scene", "material", "light", "camera")
         """
-        pass
+        caps = self._capabilities_tuple
+        if caps is None:
+            cls = type(self)
+            caps = tuple(self._capabilities)
+            if caps == cls.CAPABILITIES:
+                caps = cls.CAPABILITIES
+            self._capabilities_tuple = caps
+        return caps
     
-    @abstractmethod
-    def process_zw_data(self, zw_data: str, parsed_zw: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+    def process_zw_data(self, zw_data: str, parsed_zw: Dict[str, Any],
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Process ZW data using this engine.
         
         Args:
             zw_data: Raw ZW string
             parsed_zw: Parsed ZW dictionary
-            **kwargs: Additional engine-specific parameters
+            options: Additional engine-specific parameters (None when there are none)
             
         Returns:
             Dictionary with processing results:
@@ -43,12 +330,21 @@ class BaseEngineAdapter(ABC):
                 "stderr": "...",   # Optional stderr capture
             }
         """
-        pass
+        raise NotImplementedError(f"{type(self).__name__} must implement process_zw_data()")
+    
+    @property
+    def runs_inline(self) -> bool:
+        """True if the router must call this adapter on the routing thread."""
+        return False
     
-    @abstractmethod
     def get_status(self) -> Dict[str, Any]:
         """
         Returns current engine status information.
+
+        The static fields are built once into a template; each call only
+        refreshes the volatile "status" field and returns a copy whose
+        "capabilities" list and "additional_info" dict are fresh too, so
+        subclasses and callers may mutate the returned dict freely.
         
         Returns:
             {
@@ -59,7 +355,21 @@ class BaseEngineAdapter(ABC):
                 "additional_info": {...}
             }
         """
-        pass
+        template = self._status_template
+        if template is None:
+            template = self._status_template = {
+                "name": self.name,
+                "version": self.version,
+                "capabilities": list(self._capabilities),
+                "status": self.status,
+                "additional_info": {}
+            }
+        return {
+            **template,
+            "capabilities": list(template["capabilities"]),
+            "status": self.status,
+            "additional_info": dict(template["additional_info"]),
+        }
     
     def can_process(self, zw_block_type: str) -> bool:
         """
@@ -71,17 +381,102 @@ class BaseEngineAdapter(ABC):
         Returns:
             True if this engine can process the block type
         """
-        return zw_block_type.lower() in [cap.lower() for cap in self.capabilities]
+        # Small inline cache of recent raw block types; call sites are
+        # almost always monomorphic, so the first entry usually hits. Entries
+        # are tagged with the capability generation they were computed under,
+        # so a result that races a capability change is never served.
+        current = self._caps_generation
+        generation, entries = self._pic
+        if generation == current:
+            for cached_type, cached_result in entries:
+                if cached_type == zw_block_type:
+                    return cached_result
+        else:
+            entries = ()
+
+        result = self.can_process_normalized(zw_block_type.lower())
+
+        self._pic = (current, ((zw_block_type, result),) + entries[:INLINE_CACHE_SIZE - 1])
+        return result
+
+    def can_process_normalized(self, zw_block_type: str) -> bool:
+        """
+        Fast path of can_process for callers that already lowercased the
+        block type (e.g., values from canonical_block_type).
+        
+        Args:
+            zw_block_type: Lowercase ZW block type
+            
+        Returns:
+            True if this engine can process the block type
+        """
+        if self._caps_lower is None:
+            self._build_caps_lower()
+        # Every capability is registered when the mask is built, so an
+        # unregistered block type cannot be one of ours.
+        bit = BLOCK_TYPE_BIT.get(zw_block_type)
+        if bit is not None and (self._caps_mask & bit) != 0:
+            return True
+        return _matches_capability_prefix(self._caps_lower, zw_block_type)
+
+    def can_process_many(self, zw_block_types: Sequence[str]) -> List[bool]:
+        """
+        Batch form of can_process; prefer it when checking several block types.
+        
+        Args:
+            zw_block_types: ZW block types to check
+            
+        Returns:
+            One flag per input block type, in order
+        """
+        caps = self._caps_lower
+        if caps is None:
+            caps = self._build_caps_lower()
+        return [
+            (block_type := raw_type.lower()) in caps
+            or _matches_capability_prefix(caps, block_type)
+            for raw_type in zw_block_types
+        ]
     
     def initialize(self) -> bool:
         """
         Initialize the engine adapter. Override if needed.
+
+        Heavy setup (model loading, connections, ...) belongs here rather than
+        in __init__, so routers can defer it until first use. Keep
+        get_capabilities() cheap: can_process works before initialization.
         
         Returns:
             True if initialization successful, False otherwise
         """
+        self._supported_cache.clear()
         self.status = "active"
         return True
+
+    def ensure_initialized(self) -> bool:
+        """
+        Run initialize() once, on first use. A failed attempt is retried on
+        the next call. Thread-safe: concurrent callers wait for the one
+        running initialize() instead of starting another.
+
+        Returns:
+            True if the adapter is initialized
+        """
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialized = bool(self.initialize())
+        return self._initialized
+
+    async def initialize_async(self) -> bool:
+        """
+        Initialize without blocking the event loop. The default runs
+        ensure_initialized() on a worker thread; override for native async setup.
+
+        Returns:
+            True if initialization successful, False otherwise
+        """
+        return await asyncio.to_thread(self.ensure_initialized)
     
     def shutdown(self) -> bool:
         """
@@ -90,6 +485,8 @@ class BaseEngineAdapter(ABC):
         Returns:
             True if shutdown successful, False otherwise
         """
+        self._supported_cache.clear()
+        self._initialized = False
         self.status = "inactive"
         return True
     
@@ -115,17 +512,24 @@ class BaseEngineAdapter(ABC):
         Returns:
             List of ZW block types this engine can process
         """
-        supported_blocks = []
-        
-        # Check top-level ZW blocks
-        for key in parsed_zw.keys():
-            if key.upper().startswith('ZW-'):
-                # Extract block type (e.g., "ZW-MESH" -> "mesh")
-                block_type = key.upper().replace('ZW-', '').lower()
-                if self.can_process(block_type):
-                    supported_blocks.append(block_type)
-        
-        return supported_blocks
+        # The result depends only on the (ordered) top-level keys, so documents
+        # with the same layout share a cache entry.
+        cache_key = tuple(parsed_zw)
+        cached = self._supported_cache.get(cache_key)
+        if cached is not None:
+            self._supported_cache.move_to_end(cache_key)
+            return list(cached)
+
+        caps = self._caps_lower
+        if caps is None:
+            caps = self._build_caps_lower()
+        supported_blocks = _filter_supported_blocks(parsed_zw, caps)
+
+        self._supported_cache[cache_key] = supported_blocks
+        if len(self._supported_cache) > SUPPORTED_BLOCKS_CACHE_SIZE:
+            self._supported_cache.popitem(last=False)
+
+        return list(supported_blocks)
     
     def __repr__(self) -> str:
-        return f"<{self.__class__.__name__}(name='{self.name}', version='{self.version}', status='{self.status}')>"
+        return self._repr_prefix + self.status + "')>"
@@ -1,18 +1,30 @@
 # zw_mcp/blender_adapter.py
 import sys
+import ast
+import re
+import contextlib
+import functools
+import logging
+import os
 import json # For potential pretty printing if needed, not directly for to_zw
 from pathlib import Path
 import argparse
-import math # Added for math.radians
+import math # math.pi for DEG_TO_RAD
+import numpy as np # Bundled with Blender; used for bulk keyframe buffers
+try:
+    import numba # Optional; JIT-compiles the keyframe buffer kernel when installed
+except ImportError:
+    numba = None
 from pathlib import Path # Ensure Path is imported for handle_zw_compose_block
-from mathutils import Vector, Euler # For ZW-COMPOSE transforms
 
 # Attempt to import bpy, handling the case where the script is not run within Blender
 try:
     import bpy
+    import bmesh
 except ImportError:
     print("[!] bpy module not found. This script must be run within Blender's Python environment.")
     bpy = None # Define bpy as None so parts of the script can still be tested if needed
+    bmesh = None
 
 # Try to import parse_zw from zw_mcp.zw_parser
 try:
@@ -29,97 +41,211 @@ except ImportError:
             return {}
         # sys.exit(1) # Or exit if critical
 
-# Try to import handle_zw_mesh_block from zw_mesh (relative, package, or direct)
-ZW_MESH_IMPORTED = False
-HANDLE_ZW_MESH_BLOCK_FUNC = None
-try:
-    from .zw_mesh import handle_zw_mesh_block as imported_handle_zw_mesh_block
-    HANDLE_ZW_MESH_BLOCK_FUNC = imported_handle_zw_mesh_block
-    ZW_MESH_IMPORTED = True
-    print("Successfully imported handle_zw_mesh_block from .zw_mesh (relative).")
-except ImportError:
-    # Fallback if relative import fails
-    try:
-        from zw_mcp.zw_mesh import handle_zw_mesh_block as pkg_imported_handle_zw_mesh_block
-        HANDLE_ZW_MESH_BLOCK_FUNC = pkg_imported_handle_zw_mesh_block
-        ZW_MESH_IMPORTED = True
-        print("Successfully imported handle_zw_mesh_block from zw_mcp.zw_mesh (package).")
-    except ImportError as e_pkg_mesh:
-        print(f"Failed package import of handle_zw_mesh_block from zw_mcp.zw_mesh: {e_pkg_mesh}")
-        try:
-            from zw_mesh import handle_zw_mesh_block as direct_imported_handle_zw_mesh_block
-            HANDLE_ZW_MESH_BLOCK_FUNC = direct_imported_handle_zw_mesh_block
-            ZW_MESH_IMPORTED = True
-            print("Successfully imported handle_zw_mesh_block (direct from script directory - fallback).")
-        except ImportError as e_direct_mesh:
-            print(f"All import attempts for handle_zw_mesh_block failed: {e_direct_mesh}")
-            def HANDLE_ZW_MESH_BLOCK_FUNC(mesh_def_dict, collection_context=None): # Ensure dummy has same signature
-                print("[Critical Error] zw_mesh.handle_zw_mesh_block was not imported. Cannot process ZW-MESH.")
-                return None
-
-# --- Imports for zw_mesh utilities needed by ZW-COMPOSE ---
-APPLY_ZW_MESH_MATERIAL_FUNC = None
-EXPORT_ZW_MESH_TO_GLB_FUNC = None
-ZW_MESH_UTILS_IMPORTED = False
-try:
-    from .zw_mesh import apply_material as imported_apply_material, export_to_glb as imported_export_glb
-    APPLY_ZW_MESH_MATERIAL_FUNC = imported_apply_material
-    EXPORT_ZW_MESH_TO_GLB_FUNC = imported_export_glb
-    ZW_MESH_UTILS_IMPORTED = True
-    print("Successfully imported apply_material, export_to_glb from .zw_mesh (relative).")
-except ImportError:
-    try:
-        from zw_mcp.zw_mesh import apply_material as pkg_imported_apply_material, export_to_glb as pkg_imported_export_glb
-        APPLY_ZW_MESH_MATERIAL_FUNC = pkg_imported_apply_material
-        EXPORT_ZW_MESH_TO_GLB_FUNC = pkg_imported_export_glb
-        ZW_MESH_UTILS_IMPORTED = True
-        print("Successfully imported apply_material, export_to_glb from zw_mcp.zw_mesh (package).")
-    except ImportError as e_pkg_utils:
-        print(f"Failed package import of zw_mesh utils: {e_pkg_utils}")
+# zw_mesh (handle_zw_mesh_block, apply_material, export_to_glb) is imported on first use
+# rather than at module load, so registering this script costs nothing when no ZW-MESH or
+# ZW-COMPOSE block is processed.
+_ZW_MESH_MODULE = None # zw_mesh module once imported; False if every import attempt failed
+
+# Warnings and errors always go to stdout (where the engine adapter collects them); per-object
+# progress chatter only with ZW_VERBOSE=1 or a non-zero Blender --debug-value, since printing it
+# dominates the run time of large scenes and stages.
+_log = logging.getLogger("zw_mcp.blender_adapter")
+if not _log.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout); _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(_log_handler); _log.setLevel(logging.DEBUG); _log.propagate = False
+_VERBOSE = os.environ.get("ZW_VERBOSE", "0") == "1"
+
+def _debug_print(msg: str):
+    """Progress/success output; emitted only when verbose (ZW_VERBOSE=1 or --debug-value N)."""
+    if _VERBOSE or (bpy and bpy.app.debug_value): _log.debug(msg)
+
+def _zw_mesh_func(func_name: str):
+    """
+    Returns zw_mesh.<func_name>, importing zw_mesh on the first call (relative,
+    package, then script-directory import). Returns None if zw_mesh can't be imported.
+    """
+    global _ZW_MESH_MODULE
+    if _ZW_MESH_MODULE is None:
         try:
-            from zw_mesh import apply_material as direct_imported_apply_material, export_to_glb as direct_imported_export_glb
-            APPLY_ZW_MESH_MATERIAL_FUNC = direct_imported_apply_material
-            EXPORT_ZW_MESH_TO_GLB_FUNC = direct_imported_export_glb
-            ZW_MESH_UTILS_IMPORTED = True
-            print("Successfully imported zw_mesh utils (direct from script directory - fallback).")
-        except ImportError as e_direct_utils:
-            print(f"All import attempts for zw_mesh utils (apply_material, export_to_glb) failed: {e_direct_utils}")
-            # Define dummies if import failed
-            def APPLY_ZW_MESH_MATERIAL_FUNC(obj, material_def):
-                print("[Critical Error] zw_mesh.apply_material was not imported. Cannot apply material override in ZW-COMPOSE.")
-            def EXPORT_ZW_MESH_TO_GLB_FUNC(blender_obj, export_filepath_str):
-                print("[Critical Error] zw_mesh.export_to_glb was not imported. Cannot export in ZW-COMPOSE.")
+            from . import zw_mesh
+            _debug_print("Successfully imported zw_mesh (relative).")
+        except ImportError:
+            try:
+                from zw_mcp import zw_mesh
+                _debug_print("Successfully imported zw_mesh from zw_mcp (package).")
+            except ImportError as e_pkg_mesh:
+                _debug_print(f"Failed package import of zw_mcp.zw_mesh: {e_pkg_mesh}")
+                try:
+                    import zw_mesh
+                    _debug_print("Successfully imported zw_mesh (direct from script directory - fallback).")
+                except ImportError as e_direct_mesh:
+                    _debug_print(f"All import attempts for zw_mesh failed: {e_direct_mesh}")
+                    zw_mesh = False
+        _ZW_MESH_MODULE = zw_mesh
+    return getattr(_ZW_MESH_MODULE, func_name, None) if _ZW_MESH_MODULE else None
 
 ZW_INPUT_FILE_PATH = Path("zw_mcp/prompts/blender_scene.zw")
 
+# Material name -> (material, Principled BSDF node, Material Output node) for the current scene build
+_MAT_CACHE = {}
+
+# (ID type, datablock name, action name) -> Action created by the animation handlers during the current scene build
+_ACTION_CACHE = {}
+
+# Object name -> frozenset of its slot materials, for SHADER_SWITCH membership checks; filled
+# lazily and cleared per ZW-STAGE (MATERIAL_OVERRIDE tracks drop the entry of the object they change)
+_SLOT_MATS_CACHE = {}
+
+# Canonical JSON of a ZW-COMPOSE MATERIAL_OVERRIDE definition -> the material built for it, so
+# attachments with identical overrides share one material instead of one copy each
+_OVERRIDE_MAT_CACHE = {}
+
+# Objects created with defer_active=True; once the scene build is done only the last one ends up
+# selected and active, as if each had been selected right after creation
+_PENDING_SELECTION = []
+
+def _reset_scene_caches():
+    """Forget cached material/node and action references; call once at the start of each scene build."""
+    _MAT_CACHE.clear()
+    _ACTION_CACHE.clear()
+    _PENDING_SELECTION.clear()
+    _SLOT_MATS_CACHE.clear()
+    _OVERRIDE_MAT_CACHE.clear()
+
+def _apply_deferred_selection():
+    """Leave only the last object queued by deferred handlers selected and active: the same final
+    state as deselecting and selecting after every creation, with one deselect for the whole build."""
+    if not _PENDING_SELECTION: return
+    bpy.ops.object.select_all(action='DESELECT')
+    last_obj = _PENDING_SELECTION[-1]
+    last_obj.select_set(True); bpy.context.view_layer.objects.active = last_obj
+    _PENDING_SELECTION.clear()
+
+def _action_for(target_obj, action_name: str):
+    """
+    Assigns the Action named action_name to target_obj and returns it, creating it
+    only once per scene build so several tracks on one object share a single Action
+    (actions.new() may also rename it, e.g. "Foo.001", so a name check alone would
+    keep allocating new ones).
+    """
+    # Objects and Light data may share a name, so the ID type is part of the key
+    key = (type(target_obj).__name__, target_obj.name, action_name)
+    action = _ACTION_CACHE.get(key)
+    if action is None:
+        action = bpy.data.actions.new(name=action_name); _ACTION_CACHE[key] = action
+    target_obj.animation_data.action = action
+    return action
+
+@functools.lru_cache(maxsize=256)
+def _parse_flat_literal(s: str):
+    """Parse a stripped plain number or flat tuple/list literal into a float or a tuple of floats,
+    or return None. Cached: scenes repeat the same literals a lot, and both results are immutable."""
+    try: return float(s)
+    except ValueError: pass
+    if s[:1] in "([" and s[-1:] in ")]":
+        try: return tuple(float(p) for p in s[1:-1].split(",") if p.strip())
+        except ValueError: pass
+    return None
+
+def _parse_vec(str_val: str):
+    """Parse a ZW number or vector literal like "5", "(0,0,1)" or "[1, 2, 3]".
+    Plain numbers and flat tuples/lists skip the compiler entirely (flat lists come back as
+    tuples of floats); anything else goes through ast.literal_eval, uncached, so callers never
+    share a mutable result."""
+    s = str_val.strip()
+    value = _parse_flat_literal(s)
+    return value if value is not None else ast.literal_eval(s)
+
+# Default transform literals used as .get() fallbacks throughout this file; answered without parsing
+_ZERO3 = (0.0, 0.0, 0.0)
+_ONE3 = (1.0, 1.0, 1.0)
+_WHITE = (1.0, 1.0, 1.0) # parse_color("#FFFFFF") as RGB; the light color used when COLOR is absent
+_DEFAULT_VECS = {"(0,0,0)": _ZERO3, "(1,1,1)": _ONE3, "(0,0,1)": (0.0, 0.0, 1.0)}
+
 def safe_eval(str_val, default_val):
+    vec = _DEFAULT_VECS.get(str_val) if str_val.__class__ is str else None
+    if vec is not None: return vec
+    if isinstance(str_val, (tuple, list)): # Already parsed (e.g. JSON-sourced blocks); skip the string round-trip
+        try: return tuple(float(c) for c in str_val)
+        except (TypeError, ValueError): return default_val
     if not isinstance(str_val, str): return default_val
-    try: return eval(str_val)
-    except (SyntaxError, NameError, TypeError, ValueError) as e:
-        print(f"    [!] Warning: Could not evaluate string '{str_val}' for attribute: {e}. Using default: {default_val}")
+    try: return _parse_vec(str_val)
+    except (SyntaxError, TypeError, ValueError, MemoryError, RecursionError) as e:
+        _log.warning(f"    [!] Warning: Could not evaluate string '{str_val}' for attribute: {e}. Using default: {default_val}")
         return default_val
 
+_NUM_PATTERN = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_NUM_RE = re.compile(_NUM_PATTERN)
+_FLAT_VEC_RE = re.compile(rf'\s*[(\[]?\s*(?:{_NUM_PATTERN}\s*,\s*)*{_NUM_PATTERN}\s*,?\s*[)\]]?\s*')
+
+@functools.lru_cache(maxsize=4096)
+def _parse_flat_vec(str_val: str):
+    """Floats of a flat numeric vector like "(1.0, 2, -3e2)" in one regex pass, or None if it isn't one."""
+    if _FLAT_VEC_RE.fullmatch(str_val): return tuple(float(n) for n in _NUM_RE.findall(str_val))
+    return None
+
+def _fast_tuple(str_val, default_val):
+    """
+    Parse a transform vector into a tuple of floats, going through safe_eval only for
+    literals _parse_flat_vec can't read. Always returns a tuple (a bare number becomes a
+    1-tuple), so callers can iterate the result.
+    """
+    if isinstance(str_val, str):
+        vec = _parse_flat_vec(str_val)
+        if vec: return vec
+    val = safe_eval(str_val, default_val)
+    return val if isinstance(val, tuple) else default_val
+
+def _fast_scale(str_val):
+    """SCALE via _fast_tuple; a single number (e.g. "2") means a uniform scale."""
+    vec = _fast_tuple(str_val, _ONE3)
+    return (vec[0], vec[0], vec[0]) if len(vec) == 1 else vec
+
 def get_or_create_collection(name: str, parent_collection=None):
     if not bpy: return None
     if parent_collection is None: parent_collection = bpy.context.scene.collection
     existing_collection = parent_collection.children.get(name)
     if existing_collection:
-        print(f"    Found existing collection: '{name}' in '{parent_collection.name}'")
+        _debug_print(f"    Found existing collection: '{name}' in '{parent_collection.name}'")
         return existing_collection
     else:
         new_collection = bpy.data.collections.new(name=name)
         parent_collection.children.link(new_collection)
-        print(f"    Created and linked new collection: '{name}' to '{parent_collection.name}'")
+        _debug_print(f"    Created and linked new collection: '{name}' to '{parent_collection.name}'")
         return new_collection
 
+def swap_collection(obj, target_collection):
+    """
+    Leaves obj linked to target_collection only. Already-correct links are kept, so the common
+    case (created straight into the right collection) costs no unlink/link at all.
+    """
+    users = obj.users_collection # Tuple snapshot; safe to unlink while iterating
+    if len(users) == 1 and users[0] == target_collection: return # bpy structs compare by pointer
+    in_target = False
+    for coll in users:
+        if coll == target_collection: in_target = True
+        else: coll.objects.unlink(obj)
+    if not in_target: target_collection.objects.link(obj)
+
+U8_TO_F = tuple(i / 255.0 for i in range(256)) # 0..255 channel byte -> 0.0..1.0
+
 def parse_color(color_str_val, default_color=(0.8, 0.8, 0.8, 1.0)):
-    if not isinstance(color_str_val, str): return default_color
+    if isinstance(color_str_val, str): return _parse_color_str(color_str_val, default_color)
+    if isinstance(color_str_val, (tuple, list)) and len(color_str_val) in (3, 4): # Already parsed (e.g. JSON-sourced blocks)
+        try: rgba = tuple(float(c) for c in color_str_val)
+        except (TypeError, ValueError): return default_color
+        return rgba if len(rgba) == 4 else rgba + (1.0,)
+    return default_color
+
+@functools.lru_cache(maxsize=512)
+def _parse_color_str(color_str_val: str, default_color):
+    """Cached body of parse_color; scenes reuse a handful of colors across objects and BSDF inputs."""
     s = color_str_val.strip()
     if s.startswith("#"):
         hex_color = s.lstrip("#")
         try:
-            if len(hex_color) == 6: r, g, b = (int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4)); return (r, g, b, 1.0)
-            elif len(hex_color) == 8: r, g, b, a = (int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4, 6)); return (r, g, b, a)
+            if len(hex_color) == 6: return (U8_TO_F[int(hex_color[0:2], 16)], U8_TO_F[int(hex_color[2:4], 16)], U8_TO_F[int(hex_color[4:6], 16)], 1.0)
+            elif len(hex_color) == 8: return tuple(U8_TO_F[int(hex_color[i:i+2], 16)] for i in (0, 2, 4, 6))
         except ValueError: return default_color
     elif s.startswith("(") and s.endswith(")"):
         try:
@@ -129,199 +255,337 @@ def parse_color(color_str_val, default_color=(0.8, 0.8, 0.8, 1.0)):
         except ValueError: return default_color
     return default_color
 
-def handle_zw_object_creation(obj_attributes: dict, parent_bpy_obj=None):
+def parse_color_rgb(color_val):
+    """parse_color without the alpha channel, as a 3-tuple (lights take RGB only)."""
+    if isinstance(color_val, str): return _parse_color_rgb_str(color_val)
+    c = parse_color(color_val); return (c[0], c[1], c[2])
+
+@functools.lru_cache(maxsize=256)
+def _parse_color_rgb_str(color_str_val: str):
+    c = parse_color(color_str_val); return (c[0], c[1], c[2])
+
+# Mesh primitives built straight into a BMesh (same default sizes as the primitive_*_add
+# operators), avoiding an operator call per object. Torus has no bmesh op and still uses bpy.ops.
+PRIMITIVE_BUILDERS = {
+    "cube": lambda bm: bmesh.ops.create_cube(bm, size=2.0, calc_uvs=True),
+    "sphere": lambda bm: bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, radius=1.0, calc_uvs=True),
+    "plane": lambda bm: bmesh.ops.create_grid(bm, x_segments=1, y_segments=1, size=1.0, calc_uvs=True),
+    "cone": lambda bm: bmesh.ops.create_cone(bm, cap_ends=True, segments=32, radius1=1.0, radius2=0.0, depth=2.0, calc_uvs=True),
+    "cylinder": lambda bm: bmesh.ops.create_cone(bm, cap_ends=True, segments=32, radius1=1.0, radius2=1.0, depth=2.0, calc_uvs=True),
+}
+
+def create_primitive_object(prim_type: str, name: str, location):
+    """Create a primitive mesh object through bpy.data + bmesh and link it to the active collection."""
+    bm = bmesh.new()
+    try:
+        bm.loops.layers.uv.verify() # calc_uvs needs a UV layer to write into
+        PRIMITIVE_BUILDERS[prim_type](bm)
+        me = bpy.data.meshes.new(name); bm.to_mesh(me)
+    finally: bm.free()
+    obj = bpy.data.objects.new(name, me); obj.location = location
+    bpy.context.collection.objects.link(obj)
+    return obj
+
+def world_matrix(obj):
+    """World matrix from basis/parent-inverse chains; valid before the depsgraph has updated matrix_world."""
+    if obj.parent is None: return obj.matrix_basis.copy()
+    return world_matrix(obj.parent) @ obj.matrix_parent_inverse @ obj.matrix_basis
+
+def handle_zw_object_creation(obj_attributes: dict, parent_bpy_obj=None, defer_active: bool = False):
     if not bpy: return None
     obj_type = obj_attributes.get("TYPE")
-    if not obj_type or not isinstance(obj_type, str): print(f"    [!] Warning: Missing or invalid 'TYPE' in ZW-OBJECT attributes. Skipping."); return None
+    if not obj_type or not isinstance(obj_type, str): _log.warning(f"    [!] Warning: Missing or invalid 'TYPE' in ZW-OBJECT attributes. Skipping."); return None
     obj_name = obj_attributes.get("NAME", obj_type)
-    loc_tuple = safe_eval(obj_attributes.get("LOCATION", "(0,0,0)"), (0,0,0))
+    loc_tuple = safe_eval(obj_attributes.get("LOCATION", "(0,0,0)"), _ZERO3)
     scale_str = obj_attributes.get("SCALE", "(1,1,1)")
     if isinstance(scale_str, (int, float)): scale_tuple = (float(scale_str), float(scale_str), float(scale_str))
-    elif isinstance(scale_str, str):
-        eval_scale = safe_eval(scale_str, (1,1,1))
+    elif isinstance(scale_str, (str, tuple, list)):
+        eval_scale = safe_eval(scale_str, _ONE3)
         if isinstance(eval_scale, (int, float)): scale_tuple = (float(eval_scale), float(eval_scale), float(eval_scale))
         elif isinstance(eval_scale, tuple) and len(eval_scale) == 3: scale_tuple = eval_scale
-        else: scale_tuple = (1,1,1); print(f"    [!] Warning: Invalid SCALE format '{scale_str}'. Defaulting to (1,1,1).")
-    else: scale_tuple = (1,1,1); print(f"    [!] Warning: Invalid SCALE type '{type(scale_str)}'. Defaulting to (1,1,1).")
-    print(f"[*] Creating Blender object: TYPE='{obj_type}', NAME='{obj_name}', LOC={loc_tuple}, SCALE={scale_tuple}")
+        else: scale_tuple = _ONE3; _log.warning(f"    [!] Warning: Invalid SCALE format '{scale_str}'. Defaulting to (1,1,1).")
+    else: scale_tuple = _ONE3; _log.warning(f"    [!] Warning: Invalid SCALE type '{type(scale_str)}'. Defaulting to (1,1,1).")
+    _debug_print(f"[*] Creating Blender object: TYPE='{obj_type}', NAME='{obj_name}', LOC={loc_tuple}, SCALE={scale_tuple}")
     obj_type_lower = obj_type.lower(); created_bpy_obj = None
     try:
-        if obj_type_lower == "sphere": bpy.ops.mesh.primitive_uv_sphere_add(location=loc_tuple)
-        elif obj_type_lower == "cube": bpy.ops.mesh.primitive_cube_add(location=loc_tuple)
-        # ... (other primitive types) ...
-        elif obj_type_lower == "plane": bpy.ops.mesh.primitive_plane_add(location=loc_tuple)
-        elif obj_type_lower == "cone": bpy.ops.mesh.primitive_cone_add(location=loc_tuple)
-        elif obj_type_lower == "cylinder": bpy.ops.mesh.primitive_cylinder_add(location=loc_tuple)
-        elif obj_type_lower == "torus": bpy.ops.mesh.primitive_torus_add(location=loc_tuple)
-        else: print(f"    [!] Warning: ZW object TYPE '{obj_type}' not recognized. Skipping."); return None
-        created_bpy_obj = bpy.context.object
+        if obj_type_lower in PRIMITIVE_BUILDERS: created_bpy_obj = create_primitive_object(obj_type_lower, obj_name, loc_tuple)
+        elif obj_type_lower == "torus": bpy.ops.mesh.primitive_torus_add(location=loc_tuple); created_bpy_obj = bpy.context.object
+        else: _log.warning(f"    [!] Warning: ZW object TYPE '{obj_type}' not recognized. Skipping."); return None
         if created_bpy_obj:
             created_bpy_obj.name = obj_name; created_bpy_obj.scale = scale_tuple
-            print(f"    ✅ Created and configured: {created_bpy_obj.name} (Type: {obj_type})")
+            _debug_print(f"    ✅ Created and configured: {created_bpy_obj.name} (Type: {obj_type})")
             if parent_bpy_obj:
-                bpy.ops.object.select_all(action='DESELECT'); created_bpy_obj.select_set(True); parent_bpy_obj.select_set(True)
-                bpy.context.view_layer.objects.active = parent_bpy_obj
-                try: bpy.ops.object.parent_set(type='OBJECT', keep_transform=True); print(f"    Parented '{created_bpy_obj.name}' to '{parent_bpy_obj.name}'")
-                except RuntimeError as e: print(f"    [Error] Parenting failed: {e}")
+                # Same result as parent_set(keep_transform=True) on a freshly created child
+                created_bpy_obj.parent = parent_bpy_obj
+                created_bpy_obj.matrix_parent_inverse = world_matrix(parent_bpy_obj).inverted()
+                _debug_print(f"    Parented '{created_bpy_obj.name}' to '{parent_bpy_obj.name}'")
             if hasattr(created_bpy_obj.data, 'materials'):
                 mat_name = obj_attributes.get("MATERIAL"); color_str = obj_attributes.get("COLOR")
                 shade_str = obj_attributes.get("SHADING", "Smooth").lower(); bsdf_data = obj_attributes.get("BSDF")
                 final_mat_name = mat_name or f"{created_bpy_obj.name}_Mat"
-                mat = bpy.data.materials.get(final_mat_name) or bpy.data.materials.new(name=final_mat_name)
-                if mat.name == final_mat_name and not bpy.data.materials.get(final_mat_name): print(f"    Created new material: {final_mat_name}") # Approx
-                else: print(f"    Using existing material: {final_mat_name}")
-                mat.use_nodes = True; nodes = mat.node_tree.nodes; links = mat.node_tree.links
-                bsdf = nodes.get("Principled BSDF") or nodes.new(type='ShaderNodeBsdfPrincipled')
-                out_node = nodes.get('Material Output') or nodes.new(type='ShaderNodeOutputMaterial')
-                if not any(link.from_node == bsdf and link.to_node == out_node for link in links): links.new(bsdf.outputs["BSDF"], out_node.inputs["Surface"])
+                cached_mat = _MAT_CACHE.get(final_mat_name)
+                if cached_mat: mat, bsdf, out_node = cached_mat; _debug_print(f"    Using existing material: {final_mat_name} (cached)")
+                else:
+                    mat = bpy.data.materials.get(final_mat_name)
+                    if mat is None: mat = bpy.data.materials.new(name=final_mat_name); _debug_print(f"    Created new material: {final_mat_name}")
+                    else: _debug_print(f"    Using existing material: {final_mat_name}")
+                    mat.use_nodes = True; nodes = mat.node_tree.nodes; links = mat.node_tree.links
+                    bsdf = nodes.get("Principled BSDF") or nodes.new(type='ShaderNodeBsdfPrincipled')
+                    out_node = nodes.get('Material Output') or nodes.new(type='ShaderNodeOutputMaterial')
+                    bsdf_out = bsdf.outputs["BSDF"] # Only this socket's links are scanned, not the whole tree
+                    if not (bsdf_out.is_linked and any(link.to_node == out_node for link in bsdf_out.links)): links.new(bsdf_out, out_node.inputs["Surface"])
+                    _MAT_CACHE[final_mat_name] = (mat, bsdf, out_node)
                 color_set_by_bsdf = False
                 if isinstance(bsdf_data, dict):
-                    print(f"    Applying BSDF properties: {bsdf_data}")
+                    _debug_print(f"    Applying BSDF properties: {bsdf_data}")
                     for k, v_any in bsdf_data.items():
                         bsdf_in_name = k.replace("_", " ").title();
                         if k.lower() == "alpha": bsdf_in_name = "Alpha"
                         if bsdf.inputs.get(bsdf_in_name):
                             try:
                                 if "Color" in bsdf_in_name and isinstance(v_any, (str, tuple, list)):
-                                    pc = parse_color(str(v_any)); bsdf.inputs[bsdf_in_name].default_value = pc
+                                    pc = parse_color(v_any); bsdf.inputs[bsdf_in_name].default_value = pc
                                     if bsdf_in_name == "Base Color": color_set_by_bsdf = True
-                                    print(f"      Set BSDF.{bsdf_in_name} to {pc}")
-                                else: bsdf.inputs[bsdf_in_name].default_value = float(v_any); print(f"      Set BSDF.{bsdf_in_name} to {float(v_any)}")
-                            except Exception as e_bsdf: print(f"      [Warning] Failed to set BSDF input {bsdf_in_name}: {e_bsdf}")
-                        else: print(f"      [Warning] BSDF input '{bsdf_in_name}' not found.")
+                                    _debug_print(f"      Set BSDF.{bsdf_in_name} to {pc}")
+                                else: bsdf.inputs[bsdf_in_name].default_value = float(v_any); _debug_print(f"      Set BSDF.{bsdf_in_name} to {float(v_any)}")
+                            except Exception as e_bsdf: _log.warning(f"      [Warning] Failed to set BSDF input {bsdf_in_name}: {e_bsdf}")
+                        else: _log.warning(f"      [Warning] BSDF input '{bsdf_in_name}' not found.")
                 if color_str and not color_set_by_bsdf:
                     pc_val = parse_color(color_str); bsdf.inputs["Base Color"].default_value = pc_val
-                    print(f"    Set Base Color to {pc_val} (from COLOR attribute)")
+                    _debug_print(f"    Set Base Color to {pc_val} (from COLOR attribute)")
                 if not created_bpy_obj.data.materials: created_bpy_obj.data.materials.append(mat)
                 else: created_bpy_obj.data.materials[0] = mat
-                print(f"    Assigned material '{final_mat_name}' to '{created_bpy_obj.name}'")
-                bpy.ops.object.select_all(action='DESELECT'); created_bpy_obj.select_set(True)
-                bpy.context.view_layer.objects.active = created_bpy_obj
-                if shade_str == "smooth": bpy.ops.object.shade_smooth(); print(f"    Set shading to Smooth.")
-                elif shade_str == "flat": bpy.ops.object.shade_flat(); print(f"    Set shading to Flat.")
-        else: print(f"    [!] Error: Object creation did not result in an active object."); return None
-    except Exception as e: print(f"    [!] Error creating Blender object '{obj_name}': {e}"); return None
+                _debug_print(f"    Assigned material '{final_mat_name}' to '{created_bpy_obj.name}'")
+                if defer_active: _PENDING_SELECTION.append(created_bpy_obj) # Applied once by _apply_deferred_selection()
+                else: bpy.ops.object.select_all(action='DESELECT'); created_bpy_obj.select_set(True); bpy.context.view_layer.objects.active = created_bpy_obj
+                if shade_str in ("smooth", "flat"): # Write the polygon flags directly; the shade ops rescan the whole selection
+                    me = created_bpy_obj.data
+                    me.polygons.foreach_set("use_smooth", np.full(len(me.polygons), shade_str == "smooth", dtype=bool)); me.update()
+                    _debug_print(f"    Set shading to {shade_str.title()}.")
+        else: _log.warning(f"    [!] Error: Object creation did not result in an active object."); return None
+    except Exception as e: _log.warning(f"    [!] Error creating Blender object '{obj_name}': {e}"); return None
     return created_bpy_obj
 
+# Geometry Nodes trees for ARRAY / DISPLACE_NOISE are built once per layout variant as hidden
+# template node groups (leading "." in the name) and then copied per target, patching only the
+# per-object inputs, instead of rebuilding every node and link for each target.
+def _gn_template(template_name: str, build_func):
+    """Returns the template node group, building it with build_func(tree) if it doesn't exist yet."""
+    tpl = bpy.data.node_groups.get(template_name)
+    if not tpl:
+        tpl = bpy.data.node_groups.new(name=template_name, type='GeometryNodeTree')
+        build_func(tpl); _debug_print(f"    Built GN template: {template_name}")
+    return tpl
+
+def _build_array_template(gn_tree, realize: bool):
+    nodes = gn_tree.nodes; links = gn_tree.links; nodes.clear()
+    inp = nodes.new(type='NodeGroupInput'); inp.location=(-400,0); outp = nodes.new(type='NodeGroupOutput'); outp.location=(400,0)
+    gn_tree.outputs.new('NodeSocketGeometry', 'Geometry') # Ensure output socket exists
+    obj_info = nodes.new('GeometryNodeObjectInfo'); obj_info.name = "ZW_ObjectInfo"; obj_info.location=(-200,200)
+    line = nodes.new('NodeGeometryMeshLine'); line.name = "ZW_Line"; line.location=(-200,-100); line.mode = 'OFFSET'
+    inst = nodes.new('GeometryNodeInstanceOnPoints'); inst.location=(0,0)
+    links.new(line.outputs['Mesh'], inst.inputs['Points']); links.new(obj_info.outputs['Geometry'], inst.inputs['Instance'])
+    if realize:
+        realize_node = nodes.new('GeometryNodeRealizeInstances'); realize_node.location=(200,0)
+        links.new(inst.outputs['Instances'],realize_node.inputs['Geometry']); links.new(realize_node.outputs['Geometry'],outp.inputs['Geometry'])
+    else: links.new(inst.outputs['Instances'],outp.inputs['Geometry'])
+
+DISPLACE_AXIS_SOCKETS = {"X": "X", "Y": "Y", "Z": "Z"} # DISPLACE_NOISE AXIS -> CombineXYZ input; anything else displaces along the normal
+
+def _build_displace_template(gn_tree, axis: str):
+    nodes=gn_tree.nodes; links=gn_tree.links; nodes.clear()
+    inp=nodes.new('NodeGroupInput'); inp.location=(-600,0); outp=nodes.new('NodeGroupOutput'); outp.location=(400,0)
+    gn_tree.inputs.new('NodeSocketGeometry','Geometry'); gn_tree.outputs.new('NodeSocketGeometry','Geometry')
+    set_pos=nodes.new('GeometryNodeSetPosition'); set_pos.location=(0,0)
+    noise=nodes.new('ShaderNodeTexNoise'); noise.name="ZW_Noise"; noise.location=(-400,-200); noise.noise_dimensions='3D'
+    norm=nodes.new('GeometryNodeInputNormal'); norm.location=(-400,0)
+    str_scale=nodes.new('ShaderNodeMath'); str_scale.name="ZW_Strength"; str_scale.operation='MULTIPLY'; str_scale.location=(-200,-200)
+    links.new(noise.outputs['Fac'],str_scale.inputs[0])
+    axis_socket = DISPLACE_AXIS_SOCKETS.get(axis)
+    if axis_socket:
+        comb_xyz=nodes.new('ShaderNodeCombineXYZ'); comb_xyz.location=(-200,200)
+        links.new(str_scale.outputs['Value'],comb_xyz.inputs[axis_socket])
+        offset_src_node=comb_xyz
+    else: # NORMAL
+        vec_mult=nodes.new('ShaderNodeVectorMath'); vec_mult.operation='MULTIPLY'; vec_mult.location=(-200,0)
+        links.new(norm.outputs['Normal'],vec_mult.inputs[0]); links.new(str_scale.outputs['Value'],vec_mult.inputs[1])
+        offset_src_node=vec_mult
+    links.new(offset_src_node.outputs['Vector'],set_pos.inputs['Offset'])
+    links.new(inp.outputs['Geometry'],set_pos.inputs['Geometry']); links.new(set_pos.outputs['Geometry'],outp.inputs['Geometry'])
+
 def apply_array_gn(source_obj: bpy.types.Object, params: dict):
-    if not bpy or not source_obj: print("[!] ARRAY: bpy or source_obj missing."); return
-    print(f"[*] Applying ARRAY GN to '{source_obj.name}' with {params}")
+    if not bpy or not source_obj: _log.warning("[!] ARRAY: bpy or source_obj missing."); return
+    _debug_print(f"[*] Applying ARRAY GN to '{source_obj.name}' with {params}")
     host_name = f"{source_obj.name}_ArrayHost"; host_obj = bpy.data.objects.new(host_name, None)
     src_coll = source_obj.users_collection[0] if source_obj.users_collection else bpy.context.scene.collection
-    src_coll.objects.link(host_obj); print(f"    Created ARRAY host '{host_name}' in '{src_coll.name}'")
+    src_coll.objects.link(host_obj); _debug_print(f"    Created ARRAY host '{host_name}' in '{src_coll.name}'")
     mod = host_obj.modifiers.new(name="ZW_Array", type='NODES')
     tree_name = f"ZW_Array_{source_obj.name}_GN"; gn_tree = bpy.data.node_groups.get(tree_name)
     if not gn_tree:
-        gn_tree = bpy.data.node_groups.new(name=tree_name, type='GeometryNodeTree'); print(f"    Created GN Tree: {tree_name}")
-        nodes = gn_tree.nodes; links = gn_tree.links; nodes.clear()
-        inp = nodes.new(type='NodeGroupInput'); inp.location=(-400,0); outp = nodes.new(type='NodeGroupOutput'); outp.location=(400,0)
-        gn_tree.outputs.new('NodeSocketGeometry', 'Geometry') # Ensure output socket exists
-        obj_info = nodes.new('GeometryNodeObjectInfo'); obj_info.location=(-200,200); obj_info.inputs['Object'].default_value=source_obj
-        line = nodes.new('NodeGeometryMeshLine'); line.location=(-200,-100)
-        line.mode = 'OFFSET'; line.inputs['Count'].default_value = int(params.get("COUNT",5))
+        realize = str(params.get("MODE","INSTANCE")).upper() == "REALIZE"
+        tpl = _gn_template(".ZW_Array_Template_Realize" if realize else ".ZW_Array_Template",
+                           lambda tree: _build_array_template(tree, realize))
+        gn_tree = tpl.copy(); gn_tree.name = tree_name; _debug_print(f"    Created GN Tree: {tree_name}")
+        nodes = gn_tree.nodes; line = nodes["ZW_Line"]
+        nodes["ZW_ObjectInfo"].inputs['Object'].default_value = source_obj
+        line.inputs['Count'].default_value = int(params.get("COUNT",5))
         line.inputs['Offset'].default_value = safe_eval(str(params.get("OFFSET","(0,0,1)")),(0,0,1))
-        inst = nodes.new('GeometryNodeInstanceOnPoints'); inst.location=(0,0)
-        links.new(line.outputs['Mesh'], inst.inputs['Points']); links.new(obj_info.outputs['Geometry'], inst.inputs['Instance'])
-        if str(params.get("MODE","INSTANCE")).upper() == "REALIZE":
-            realize = nodes.new('GeometryNodeRealizeInstances'); realize.location=(200,0)
-            links.new(inst.outputs['Instances'],realize.inputs['Geometry']); links.new(realize.outputs['Geometry'],outp.inputs['Geometry'])
-        else: links.new(inst.outputs['Instances'],outp.inputs['Geometry'])
-    else: print(f"    Reusing GN Tree: {tree_name}")
+    else: _debug_print(f"    Reusing GN Tree: {tree_name}")
     mod.node_group = gn_tree; bpy.context.view_layer.objects.active = host_obj; host_obj.select_set(True)
-    print(f"    Applied ARRAY to '{host_name}'")
+    _debug_print(f"    Applied ARRAY to '{host_name}'")
 
 def apply_displace_noise_gn(target_obj: bpy.types.Object, params: dict):
-    if not bpy or not target_obj or target_obj.type != 'MESH': print(f"[!] DISPLACE: Target '{target_obj.name if target_obj else 'None'}' not a MESH. Skipping."); return
-    print(f"[*] Applying DISPLACE_NOISE GN to '{target_obj.name}' with {params}")
+    if not bpy or not target_obj or target_obj.type != 'MESH': _log.warning(f"[!] DISPLACE: Target '{target_obj.name if target_obj else 'None'}' not a MESH. Skipping."); return
+    _debug_print(f"[*] Applying DISPLACE_NOISE GN to '{target_obj.name}' with {params}")
     mod = target_obj.modifiers.new(name="ZW_DisplaceNoise", type='NODES')
     tree_name = f"ZW_Displace_{target_obj.name}_GN"; gn_tree = bpy.data.node_groups.get(tree_name)
     if not gn_tree:
-        gn_tree = bpy.data.node_groups.new(name=tree_name, type='GeometryNodeTree'); print(f"    Created GN Tree: {tree_name}")
-        nodes=gn_tree.nodes; links=gn_tree.links; nodes.clear()
-        inp=nodes.new('NodeGroupInput'); inp.location=(-600,0); outp=nodes.new('NodeGroupOutput'); outp.location=(400,0)
-        gn_tree.inputs.new('NodeSocketGeometry','Geometry'); gn_tree.outputs.new('NodeSocketGeometry','Geometry')
-        set_pos=nodes.new('GeometryNodeSetPosition'); set_pos.location=(0,0)
-        noise=nodes.new('ShaderNodeTexNoise'); noise.location=(-400,-200); noise.noise_dimensions='3D'
+        axis = params.get("AXIS","NORMAL").upper()
+        if axis not in DISPLACE_AXIS_SOCKETS: axis = "NORMAL"; _debug_print("    Displacing along Normal.")
+        tpl = _gn_template(f".ZW_Displace_Template_{axis}", lambda tree: _build_displace_template(tree, axis))
+        gn_tree = tpl.copy(); gn_tree.name = tree_name; _debug_print(f"    Created GN Tree: {tree_name}")
+        nodes = gn_tree.nodes; noise = nodes["ZW_Noise"]
         noise.inputs['Scale'].default_value=float(params.get("SCALE",5.0)); noise.inputs['W'].default_value=float(params.get("SEED",0.0))
-        norm=nodes.new('GeometryNodeInputNormal'); norm.location=(-400,0)
-        str_scale=nodes.new('ShaderNodeMath'); str_scale.operation='MULTIPLY'; str_scale.location=(-200,-200)
-        str_scale.inputs[1].default_value=float(params.get("STRENGTH",0.5)); links.new(noise.outputs['Fac'],str_scale.inputs[0])
-        axis=params.get("AXIS","NORMAL").upper(); offset_src_node=None
-        if axis in ['X','Y','Z']:
-            comb_xyz=nodes.new('ShaderNodeCombineXYZ'); comb_xyz.location=(-200,200)
-            if axis=='X': links.new(str_scale.outputs['Value'],comb_xyz.inputs['X'])
-            elif axis=='Y': links.new(str_scale.outputs['Value'],comb_xyz.inputs['Y'])
-            else: links.new(str_scale.outputs['Value'],comb_xyz.inputs['Z'])
-            offset_src_node=comb_xyz
-        else: # NORMAL
-            vec_mult=nodes.new('ShaderNodeVectorMath'); vec_mult.operation='MULTIPLY'; vec_mult.location=(-200,0)
-            links.new(norm.outputs['Normal'],vec_mult.inputs[0]); links.new(str_scale.outputs['Value'],vec_mult.inputs[1])
-            offset_src_node=vec_mult; print("    Displacing along Normal.")
-        links.new(offset_src_node.outputs['Vector'],set_pos.inputs['Offset'])
-        links.new(inp.outputs['Geometry'],set_pos.inputs['Geometry']); links.new(set_pos.outputs['Geometry'],outp.inputs['Geometry'])
-    else: print(f"    Reusing GN Tree: {tree_name}")
+        nodes["ZW_Strength"].inputs[1].default_value=float(params.get("STRENGTH",0.5))
+    else: _debug_print(f"    Reusing GN Tree: {tree_name}")
     mod.node_group=gn_tree; bpy.context.view_layer.objects.active=target_obj; target_obj.select_set(True)
-    print(f"    Applied DISPLACE_NOISE to '{target_obj.name}'")
+    _debug_print(f"    Applied DISPLACE_NOISE to '{target_obj.name}'")
+
+# Keyframe interpolation name -> RNA enum value (as used by foreach_set), read from bl_rna at load
+_INTERP_CODES = {item.identifier: item.value for item in bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items} if bpy else {}
+_CONST_IPO = _INTERP_CODES.get("CONSTANT") # Switch/visibility keys are all CONSTANT
+
+def _interpolation_code(interp_str: str) -> int:
+    """Integer enum value of a keyframe interpolation name (as used by foreach_set)."""
+    code = _INTERP_CODES.get(interp_str)
+    if code is None:
+        _log.warning(f"    [Warning] Unknown INTERPOLATION '{interp_str}'. Using BEZIER.")
+        code = _INTERP_CODES["BEZIER"]
+    return code
+
+DEG_TO_RAD = math.pi / 180.0
+
+def _radians3(deg):
+    """Degrees -> radians for an XYZ rotation tuple by constant multiply (any other length works too)."""
+    if len(deg) == 3: return (deg[0] * DEG_TO_RAD, deg[1] * DEG_TO_RAD, deg[2] * DEG_TO_RAD)
+    return tuple(a * DEG_TO_RAD for a in deg)
+
+def _build_co_numpy(frames, values, to_rad):
+    """Interleaves frames/values into a float32 keyframe 'co' buffer, converting values from degrees if to_rad."""
+    co = np.empty(2 * frames.size, dtype=np.float32)
+    co[0::2] = frames
+    co[1::2] = values * DEG_TO_RAD if to_rad else values
+    return co
+
+if numba is not None:
+    @numba.njit(cache=True, fastmath=True) # cache=True keeps the compiled kernel on disk across Blender sessions
+    def _build_co(frames, values, to_rad):
+        n = frames.size
+        co = np.empty(2 * n, dtype=np.float32)
+        scale = DEG_TO_RAD if to_rad else 1.0
+        for i in range(n):
+            co[2 * i] = frames[i]
+            co[2 * i + 1] = values[i] * scale
+        return co
+else:
+    _build_co = _build_co_numpy
+
+@functools.lru_cache(maxsize=64)
+def _is_degrees_rotation(unit: str, data_path: str) -> bool:
+    """True if keyframe values for data_path are given in degrees and must be converted to radians."""
+    return unit == "degrees" and "rotation" in data_path.lower()
+
+def set_constant_interpolation(fc):
+    """Marks every key on an F-Curve CONSTANT with a single foreach_set (switch tracks step, never blend)."""
+    kps = fc.keyframe_points
+    kps.foreach_set("interpolation", np.full(len(kps), _CONST_IPO, dtype=np.int32))
+
+def insert_keyframes_bulk(action, data_path: str, index: int, group_name: str, frames, values, interp_str: str, to_rad: bool = False):
+    """
+    Keyframes one F-Curve from parallel frame/value sequences. A fresh F-Curve is
+    filled with keyframe_points.add() plus two foreach_set() calls instead of one
+    insert() (and one interpolation write) per point. If the F-Curve already has
+    keys, falls back to insert() so they are merged the usual way (with the FAST
+    option, handles are recalculated once at the end).
+    If to_rad is set, values are given in degrees and converted to radians.
+    """
+    fc = action.fcurves.find(data_path, index=index) or action.fcurves.new(data_path, index=index, action_group=group_name)
+    kps = fc.keyframe_points
+    if len(kps):
+        scale = DEG_TO_RAD if to_rad else 1.0; insert = kps.insert; fast = {'FAST'}
+        for frame, value in zip(frames, values): insert(frame, value * scale, options=fast).interpolation = interp_str
+        fc.update()
+        return fc
+    keyed = dict(zip(frames, values)) # insert() keeps the last value per frame; so do we
+    count = len(keyed)
+    co = _build_co(np.fromiter(keyed.keys(), np.float64, count), np.fromiter(keyed.values(), np.float64, count), to_rad)
+    kps.add(count)
+    kps.foreach_set("co", co)
+    kps.foreach_set("interpolation", np.full(count, _interpolation_code(interp_str), dtype=np.int32))
+    fc.update() # Sort points and recalculate handles
+    return fc
 
 def handle_zw_animation_block(anim_data: dict):
     if not bpy: return
     target_obj_name = anim_data.get("TARGET_OBJECT"); prop_path = anim_data.get("PROPERTY_PATH"); idx_str = anim_data.get("INDEX")
     unit = anim_data.get("UNIT","").lower(); interp_str = anim_data.get("INTERPOLATION","BEZIER").upper(); kf_list = anim_data.get("KEYFRAMES")
-    if not all([target_obj_name,prop_path,kf_list]): print(f"[!] ZW-ANIMATION '{anim_data.get('NAME','Unnamed')}' missing required fields. Skipping."); return
+    if not all([target_obj_name,prop_path,kf_list]): _log.warning(f"[!] ZW-ANIMATION '{anim_data.get('NAME','Unnamed')}' missing required fields. Skipping."); return
     target_obj = bpy.data.objects.get(target_obj_name)
-    if not target_obj: print(f"[!] ZW-ANIMATION target '{target_obj_name}' not found. Skipping."); return
+    if not target_obj: _log.warning(f"[!] ZW-ANIMATION target '{target_obj_name}' not found. Skipping."); return
     if not target_obj.animation_data: target_obj.animation_data_create()
     act_name = anim_data.get("NAME",f"{target_obj.name}_{prop_path}_Action")
     if not target_obj.animation_data.action or (target_obj.animation_data.action.name != act_name and anim_data.get("NAME")):
-        target_obj.animation_data.action = bpy.data.actions.new(name=act_name)
+        _action_for(target_obj, act_name)
     action = target_obj.animation_data.action; prop_idx = None
     if idx_str is not None:
         try: prop_idx = int(idx_str)
-        except ValueError: print(f"    [Warning] Invalid INDEX '{idx_str}'. Ignoring."); prop_idx = None
-    print(f"  Animating '{target_obj.name}.{prop_path}' (Idx:{prop_idx if prop_idx is not None else 'All'}) using {interp_str}")
+        except ValueError: _log.warning(f"    [Warning] Invalid INDEX '{idx_str}'. Ignoring."); prop_idx = None
+    _debug_print(f"  Animating '{target_obj.name}.{prop_path}' (Idx:{prop_idx if prop_idx is not None else 'All'}) using {interp_str}")
+    curve_keys = {} # F-Curve index -> ([frames], [values]), written in bulk after the loop
+    curve_for = curve_keys.setdefault; parse_value = safe_eval # Hoisted out of the keyframe loop
+    to_rad = _is_degrees_rotation(unit, prop_path) # Converted per F-Curve in insert_keyframes_bulk
     for kf in kf_list:
         frame = kf.get("FRAME"); val_in = kf.get("VALUE")
-        if frame is None or val_in is None: print(f"    [Warning] Keyframe missing FRAME/VALUE. Skipping: {kf}"); continue
+        if frame is None or val_in is None: _log.warning(f"    [Warning] Keyframe missing FRAME/VALUE. Skipping: {kf}"); continue
         frame = float(frame)
         if prop_idx is not None:
             try:
                 val = float(val_in)
-                if unit=="degrees" and "rotation" in prop_path.lower(): val = math.radians(val)
-                fc = action.fcurves.find(prop_path,index=prop_idx) or action.fcurves.new(prop_path,index=prop_idx,action_group=target_obj.name)
-                kp = fc.keyframe_points.insert(frame,val); kp.interpolation = interp_str
-            except ValueError: print(f"    [Warning] Invalid scalar VALUE '{val_in}'. Skipping KF.")
+                frames, values = curve_for(prop_idx, ([], [])); frames.append(frame); values.append(val)
+            except ValueError: _log.warning(f"    [Warning] Invalid scalar VALUE '{val_in}'. Skipping KF.")
         else:
-            pt = safe_eval(str(val_in),None)
+            pt = parse_value(val_in if isinstance(val_in, (str, tuple, list)) else str(val_in),None)
             if isinstance(pt,tuple) and (len(pt)==3 or len(pt)==4):
-                vals = [math.radians(c) if unit=="degrees" and "rotation" in prop_path.lower() else c for c in pt]
-                for i,comp_v in enumerate(vals):
-                    fc = action.fcurves.find(prop_path,index=i) or action.fcurves.new(prop_path,index=i,action_group=target_obj.name)
-                    kp = fc.keyframe_points.insert(frame,comp_v); kp.interpolation = interp_str
-            else: print(f"    [Warning] Invalid vector VALUE '{val_in}'. Skipping KF.")
-    print(f"    ✅ Finished animation: {act_name}")
+                for i,comp_v in enumerate(pt):
+                    frames, values = curve_for(i, ([], [])); frames.append(frame); values.append(comp_v)
+            else: _log.warning(f"    [Warning] Invalid vector VALUE '{val_in}'. Skipping KF.")
+    group_name = target_obj.name
+    for i, (frames, values) in curve_keys.items():
+        insert_keyframes_bulk(action, prop_path, i, group_name, frames, values, interp_str, to_rad)
+    _debug_print(f"    ✅ Finished animation: {act_name}")
 
 def handle_zw_driver_block(driver_data: dict):
     if not bpy: return
     src_name = driver_data.get("SOURCE_OBJECT"); src_prop = driver_data.get("SOURCE_PROPERTY")
     tgt_name = driver_data.get("TARGET_OBJECT"); tgt_prop = driver_data.get("TARGET_PROPERTY")
     expr = driver_data.get("EXPRESSION","var"); drv_name = driver_data.get("NAME",f"ZWDriver_{tgt_name}_{tgt_prop}")
-    if not all([src_name,src_prop,tgt_name,tgt_prop]): print(f"[!] ZW-DRIVER '{drv_name}': Missing required fields. Skipping."); return
-    src_obj = bpy.data.objects.get(src_name); tgt_obj = bpy.data.objects.get(tgt_name)
-    if not src_obj: print(f"[!] ZW-DRIVER '{drv_name}': Source obj '{src_name}' not found. Skipping."); return
-    if not tgt_obj: print(f"[!] ZW-DRIVER '{drv_name}': Target obj '{tgt_name}' not found. Skipping."); return
-    print(f"[*] Creating ZW-DRIVER '{drv_name}': {src_name}.{src_prop} -> {tgt_name}.{tgt_prop}")
+    if not all([src_name,src_prop,tgt_name,tgt_prop]): _log.warning(f"[!] ZW-DRIVER '{drv_name}': Missing required fields. Skipping."); return
+    objects_get = bpy.data.objects.get; src_obj = objects_get(src_name); tgt_obj = objects_get(tgt_name)
+    if not src_obj: _log.warning(f"[!] ZW-DRIVER '{drv_name}': Source obj '{src_name}' not found. Skipping."); return
+    if not tgt_obj: _log.warning(f"[!] ZW-DRIVER '{drv_name}': Target obj '{tgt_name}' not found. Skipping."); return
+    _debug_print(f"[*] Creating ZW-DRIVER '{drv_name}': {src_name}.{src_prop} -> {tgt_name}.{tgt_prop}")
     try:
         path = tgt_prop; idx = -1
         if '[' in tgt_prop and tgt_prop.endswith(']'):
             parts = tgt_prop.split('['); path=parts[0]
             try: idx = int(parts[1].rstrip(']'))
-            except ValueError: print(f"    [Error] Invalid index in TARGET_PROPERTY: {tgt_prop}. Skipping."); return
+            except ValueError: _log.error(f"    [Error] Invalid index in TARGET_PROPERTY: {tgt_prop}. Skipping."); return
         fc = tgt_obj.driver_add(path,idx) if idx!=-1 else tgt_obj.driver_add(path)
         drv = fc.driver; drv.type='SCRIPTED'; drv.expression=expr
         var = drv.variables.new(); var.name="var"; var.type='SINGLE_PROP'
         var.targets[0].id_type='OBJECT'; var.targets[0].id=src_obj; var.targets[0].data_path=src_prop
-        print(f"    ✅ Successfully created driver: '{drv_name}'")
-    except Exception as e: print(f"    [!] Error setting up driver '{drv_name}': {e}")
+        _debug_print(f"    ✅ Successfully created driver: '{drv_name}'")
+    except Exception as e: _log.warning(f"    [!] Error setting up driver '{drv_name}': {e}")
 
 def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
     """
@@ -330,7 +594,7 @@ def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
     """
     if not bpy: return
     if not target_obj:
-        print(f"    [!] PROPERTY_ANIM: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
+        _log.warning(f"    [!] PROPERTY_ANIM: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
         return
 
     property_path_str = track_data.get("PROPERTY_PATH")
@@ -340,11 +604,11 @@ def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
     interpolation_str = track_data.get("INTERPOLATION", "BEZIER").upper() # Optional
 
     if not all([property_path_str, keyframes_list]):
-        print(f"    [!] PROPERTY_ANIM for '{target_obj.name}': Missing PROPERTY_PATH or KEYFRAMES. Skipping.")
+        _log.warning(f"    [!] PROPERTY_ANIM for '{target_obj.name}': Missing PROPERTY_PATH or KEYFRAMES. Skipping.")
         return
 
     if not isinstance(keyframes_list, list):
-        print(f"    [!] PROPERTY_ANIM for '{target_obj.name}': KEYFRAMES is not a list. Skipping.")
+        _log.warning(f"    [!] PROPERTY_ANIM for '{target_obj.name}': KEYFRAMES is not a list. Skipping.")
         return
 
     # Ensure animation data and action exist
@@ -357,7 +621,7 @@ def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
     if not target_obj.animation_data.action or \
        (track_data.get("ACTION_NAME") and target_obj.animation_data.action.name != track_data.get("ACTION_NAME")):
         action_name_from_data = track_data.get("ACTION_NAME", action_name)
-        target_obj.animation_data.action = bpy.data.actions.new(name=action_name_from_data)
+        _action_for(target_obj, action_name_from_data)
 
     action = target_obj.animation_data.action
 
@@ -366,63 +630,54 @@ def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
         try:
             prop_idx = int(index_str)
         except ValueError:
-            print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Invalid INDEX '{index_str}'. Assuming non-indexed property.")
+            _log.warning(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Invalid INDEX '{index_str}'. Assuming non-indexed property.")
             prop_idx = None # Treat as if no index was provided
 
-    print(f"    Animating '{target_obj.name}.{property_path_str}' (Index: {prop_idx if prop_idx is not None else 'All Components'}) using {interpolation_str}")
+    _debug_print(f"    Animating '{target_obj.name}.{property_path_str}' (Index: {prop_idx if prop_idx is not None else 'All Components'}) using {interpolation_str}")
 
+    # (F-Curve index, degrees->radians) -> ([frames], [values]), written in bulk after the loop
+    curve_keys = {}
+    to_rad = _is_degrees_rotation(unit_str, property_path_str)
+    # Hoisted out of the keyframe loop
+    curve_for = curve_keys.setdefault; parse_value = safe_eval; obj_name = target_obj.name
     for kf_data in keyframes_list:
         if not isinstance(kf_data, dict):
-            print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Keyframe data is not a dictionary. Skipping KF: {kf_data}")
+            _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': Keyframe data is not a dictionary. Skipping KF: {kf_data}")
             continue
 
         frame_input = kf_data.get("FRAME")
         value_input = kf_data.get("VALUE")
 
         if frame_input is None or value_input is None:
-            print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Keyframe missing FRAME or VALUE. Skipping KF: {kf_data}")
+            _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': Keyframe missing FRAME or VALUE. Skipping KF: {kf_data}")
             continue
 
         try:
             frame = float(frame_input)
         except ValueError:
-            print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Invalid FRAME '{frame_input}'. Skipping KF.")
+            _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': Invalid FRAME '{frame_input}'. Skipping KF.")
             continue
 
         if prop_idx is not None: # Scalar or single component of a vector
             try:
                 current_value = float(value_input)
-                if unit_str == "degrees" and "rotation" in property_path_str.lower():
-                    current_value = math.radians(current_value)
-
-                fcurve = action.fcurves.find(property_path_str, index=prop_idx)
-                if not fcurve:
-                    fcurve = action.fcurves.new(property_path_str, index=prop_idx, action_group=target_obj.name)
-
-                kf_point = fcurve.keyframe_points.insert(frame, current_value)
-                kf_point.interpolation = interpolation_str
+                frames, values = curve_for((prop_idx, to_rad), ([], []))
+                frames.append(frame); values.append(current_value)
             except ValueError:
-                print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Invalid scalar VALUE '{value_input}'. Skipping KF.")
-            except Exception as e:
-                print(f"    [Error] PROPERTY_ANIM for '{target_obj.name}': Failed to insert scalar keyframe for {property_path_str}[{prop_idx}]: {e}")
+                _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': Invalid scalar VALUE '{value_input}'. Skipping KF.")
 
         else: # Vector/tuple (e.g., location, scale, color) or property without explicit index
-            value_tuple = safe_eval(str(value_input), None) # safe_eval expects string
+            value_tuple = parse_value(value_input if isinstance(value_input, (str, tuple, list)) else str(value_input), None)
 
             if not isinstance(value_tuple, (tuple, list)):
                 # Could be a single float for a property that is non-array but not explicitly indexed (e.g. "energy" for light)
                 try:
                     current_value = float(value_input)
                     # No unit conversion here unless property_path_str implies it universally
-                    fcurve = action.fcurves.find(property_path_str) # No index
-                    if not fcurve:
-                        fcurve = action.fcurves.new(property_path_str, action_group=target_obj.name)
-                    kf_point = fcurve.keyframe_points.insert(frame, current_value)
-                    kf_point.interpolation = interpolation_str
+                    frames, values = curve_for((0, False), ([], [])) # Non-indexed property: F-Curve index 0
+                    frames.append(frame); values.append(current_value)
                 except ValueError:
-                    print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': VALUE '{value_input}' is not a valid tuple/list or single float. Skipping KF.")
-                except Exception as e:
-                    print(f"    [Error] PROPERTY_ANIM for '{target_obj.name}': Failed to insert non-indexed keyframe for {property_path_str}: {e}")
+                    _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': VALUE '{value_input}' is not a valid tuple/list or single float. Skipping KF.")
                 continue # Move to next keyframe_data
 
             # If it was a tuple/list from safe_eval
@@ -430,45 +685,43 @@ def handle_property_anim_track(target_obj: bpy.types.Object, track_data: dict):
                 for i, component_val in enumerate(value_tuple):
                     try:
                         current_comp_value = float(component_val) # Ensure component is float
-                        if unit_str == "degrees" and "rotation" in property_path_str.lower():
-                            current_comp_value = math.radians(current_comp_value)
+                        frames, values = curve_for((i, to_rad), ([], []))
+                        frames.append(frame); values.append(current_comp_value)
+                    except (ValueError, TypeError):
+                        _log.warning(f"    [Warning] PROPERTY_ANIM for '{obj_name}': Invalid component VALUE '{component_val}' in '{value_tuple}'. Skipping component.")
 
-                        fcurve = action.fcurves.find(property_path_str, index=i)
-                        if not fcurve:
-                            fcurve = action.fcurves.new(property_path_str, index=i, action_group=target_obj.name)
-
-                        kf_point = fcurve.keyframe_points.insert(frame, current_comp_value)
-                        kf_point.interpolation = interpolation_str
-                    except ValueError:
-                        print(f"    [Warning] PROPERTY_ANIM for '{target_obj.name}': Invalid component VALUE '{component_val}' in '{value_tuple}'. Skipping component.")
-                    except Exception as e:
-                        print(f"    [Error] PROPERTY_ANIM for '{target_obj.name}': Failed to insert component keyframe for {property_path_str}[{i}]: {e}")
+    for (i, in_degrees), (frames, values) in curve_keys.items():
+        try:
+            insert_keyframes_bulk(action, property_path_str, i, obj_name, frames, values, interpolation_str, in_degrees)
+        except Exception as e:
+            _log.error(f"    [Error] PROPERTY_ANIM for '{target_obj.name}': Failed to insert keyframes for {property_path_str}[{i}]: {e}")
 
-    print(f"    ✅ Finished property animation for: {target_obj.name}.{property_path_str}")
+    _debug_print(f"    ✅ Finished property animation for: {target_obj.name}.{property_path_str}")
 
-def handle_material_override_track(target_obj: bpy.types.Object, track_data: dict):
+def handle_material_override_track(target_obj: bpy.types.Object, track_data: dict, start_frame_override=None, end_frame_override=None):
     """
     Handles a material override track, changing an object's material at a specific frame
     and optionally restoring it, using keyframes with CONSTANT interpolation.
+    The frame overrides, when not None, take precedence over START_FRAME/END_FRAME.
     """
     if not bpy: return
     if not target_obj:
-        print(f"    [!] MATERIAL_OVERRIDE: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
+        _log.warning(f"    [!] MATERIAL_OVERRIDE: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
         return
 
     material_name_to_assign_str = track_data.get("MATERIAL_NAME")
-    start_frame_str = track_data.get("START_FRAME", "0") # Default to 0 if not specified
-    end_frame_int_str = track_data.get("END_FRAME") # Optional
+    start_frame_str = track_data.get("START_FRAME", "0") if start_frame_override is None else start_frame_override # Default to 0 if not specified
+    end_frame_int_str = track_data.get("END_FRAME") if end_frame_override is None else end_frame_override # Optional
     restore_on_end_str = str(track_data.get("RESTORE_ON_END", "false")).lower()
 
     if not material_name_to_assign_str:
-        print(f"    [!] MATERIAL_OVERRIDE for '{target_obj.name}': Missing MATERIAL_NAME. Skipping.")
+        _log.warning(f"    [!] MATERIAL_OVERRIDE for '{target_obj.name}': Missing MATERIAL_NAME. Skipping.")
         return
 
     try:
         start_frame_int = int(start_frame_str)
     except ValueError:
-        print(f"    [Warning] MATERIAL_OVERRIDE for '{target_obj.name}': Invalid START_FRAME '{start_frame_str}'. Using 0.")
+        _log.warning(f"    [Warning] MATERIAL_OVERRIDE for '{target_obj.name}': Invalid START_FRAME '{start_frame_str}'. Using 0.")
         start_frame_int = 0
 
     end_frame_int = None
@@ -476,13 +729,13 @@ def handle_material_override_track(target_obj: bpy.types.Object, track_data: dic
         try:
             end_frame_int = int(end_frame_int_str)
         except ValueError:
-            print(f"    [Warning] MATERIAL_OVERRIDE for '{target_obj.name}': Invalid END_FRAME '{end_frame_int_str}'. Restoration at end might not occur.")
+            _log.warning(f"    [Warning] MATERIAL_OVERRIDE for '{target_obj.name}': Invalid END_FRAME '{end_frame_int_str}'. Restoration at end might not occur.")
 
     restore = (restore_on_end_str == 'true')
 
     # Ensure the object has a material slot (typically operates on the first slot)
     if not target_obj.material_slots:
-        print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Object has no material slots. Appending one.")
+        _debug_print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Object has no material slots. Appending one.")
         # This adds a new empty slot. If using .data.materials, it's slightly different.
         # For simplicity and direct slot animation, ensuring a slot object exists is key.
         target_obj.material_slots.new('') # Create an empty slot if none exist.
@@ -490,26 +743,27 @@ def handle_material_override_track(target_obj: bpy.types.Object, track_data: dic
         # if not target_obj.data.materials: target_obj.data.materials.append(None)
 
     if not target_obj.material_slots: # Should not happen if the above worked
-        print(f"    [!] MATERIAL_OVERRIDE for '{target_obj.name}': Failed to ensure material slot. Skipping.")
+        _log.warning(f"    [!] MATERIAL_OVERRIDE for '{target_obj.name}': Failed to ensure material slot. Skipping.")
         return
+    slot = target_obj.material_slots[0] # Bound once; every read/write below goes through it
 
     # Get or create the new material
     new_mat = bpy.data.materials.get(material_name_to_assign_str)
     if not new_mat:
         new_mat = bpy.data.materials.new(name=material_name_to_assign_str)
         new_mat.use_nodes = True # Good practice for newly created materials
-        print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Created new material '{material_name_to_assign_str}'.")
+        _debug_print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Created new material '{material_name_to_assign_str}'.")
     else:
-        print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Using existing material '{material_name_to_assign_str}'.")
+        _debug_print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Using existing material '{material_name_to_assign_str}'.")
 
-    original_mat = None
-    if restore and target_obj.material_slots[0].material:
-        original_mat = target_obj.material_slots[0].material
-        print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Original material '{original_mat.name}' stored for restoration.")
+    original_mat = slot.material if restore else None
+    if original_mat:
+        _debug_print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Original material '{original_mat.name}' stored for restoration.")
     elif restore:
-        print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Restoration requested, but no original material in slot 0.")
+        _debug_print(f"    [*] MATERIAL_OVERRIDE for '{target_obj.name}': Restoration requested, but no original material in slot 0.")
 
     slot_path = "material_slots[0].material"
+    switch_events = [] # (frame, material, log label): collected first, then keyed in one pass below
 
     # Keyframe original material before the switch, if restoring and not starting at the very beginning
     if restore and original_mat and start_frame_int > 0: # Frame 0 is a bit special, use >0
@@ -519,63 +773,67 @@ def handle_material_override_track(target_obj: bpy.types.Object, track_data: dic
         if pre_switch_frame < 0: pre_switch_frame = 0 # Clamp if start_frame_int was 0
 
         # Only insert if different from new_mat or if it's the first keyframe in a restore sequence
-        if target_obj.material_slots[0].material != original_mat or \
-           (target_obj.material_slots[0].material == original_mat and not target_obj.animation_data): # crude check
-            target_obj.material_slots[0].material = original_mat
-            try:
-                kp = target_obj.keyframe_insert(data_path=slot_path, frame=pre_switch_frame)
-                if kp: kp.interpolation = 'CONSTANT'
-                print(f"    Keyframed original material '{original_mat.name}' at frame {pre_switch_frame} for '{target_obj.name}'.")
-            except RuntimeError as e:
-                 print(f"    [Warning] Failed to keyframe original material at pre-switch frame for '{target_obj.name}': {e}")
-
+        if slot.material != original_mat or \
+           (slot.material == original_mat and not target_obj.animation_data): # crude check
+            switch_events.append((pre_switch_frame, original_mat, "Keyframed original material"))
 
     # Keyframe the new material at the start frame
-    target_obj.material_slots[0].material = new_mat
-    try:
-        kp = target_obj.keyframe_insert(data_path=slot_path, frame=start_frame_int)
-        if kp: kp.interpolation = 'CONSTANT'
-        print(f"    Set and keyframed material of '{target_obj.name}' to '{new_mat.name}' at frame {start_frame_int}.")
-    except RuntimeError as e:
-        print(f"    [Warning] Failed to keyframe new material for '{target_obj.name}': {e}")
-
+    switch_events.append((start_frame_int, new_mat, "Set and keyframed material"))
 
     # Keyframe original material at the end frame, if restoring
     if restore and original_mat and end_frame_int is not None and end_frame_int > start_frame_int:
-        target_obj.material_slots[0].material = original_mat
-        try:
-            kp = target_obj.keyframe_insert(data_path=slot_path, frame=end_frame_int)
-            if kp: kp.interpolation = 'CONSTANT'
-            print(f"    Restored and keyframed material of '{target_obj.name}' to '{original_mat.name}' at frame {end_frame_int}.")
-        except RuntimeError as e:
-            print(f"    [Warning] Failed to keyframe restored material for '{target_obj.name}': {e}")
+        switch_events.append((end_frame_int, original_mat, "Restored and keyframed material"))
 
-    print(f"    ✅ Finished material override for: {target_obj.name}")
-
-def handle_shader_switch_track(target_obj: bpy.types.Object, track_data: dict):
+    keyed_any = False
+    for frame, mat, label in switch_events:
+        if slot.material != mat: slot.material = mat # bpy wrappers are rebuilt per access, so compare with != (pointer equality), not "is"
+        try:
+            keyed_any |= target_obj.keyframe_insert(data_path=slot_path, frame=frame)
+            _debug_print(f"    {label} of '{target_obj.name}' to '{mat.name}' at frame {frame}.")
+        except (RuntimeError, TypeError) as e:
+            _log.warning(f"    [Warning] Failed to keyframe material '{mat.name}' at frame {frame} for '{target_obj.name}': {e}")
+
+    # keyframe_insert() returns a bool, not the key; make the switch keys CONSTANT in one write
+    if keyed_any and target_obj.animation_data and target_obj.animation_data.action:
+        fc = target_obj.animation_data.action.fcurves.find(slot_path)
+        if fc: set_constant_interpolation(fc)
+
+    _debug_print(f"    ✅ Finished material override for: {target_obj.name}")
+
+# NEW_VALUE parser per node socket type (socket.type -> callable); unknown types are skipped
+_SOCKET_PARSERS = {
+    'RGBA': parse_color,
+    'VALUE': float,
+    'VECTOR': lambda v: safe_eval(v if isinstance(v, (tuple, list)) else str(v), _ZERO3),
+    'INT': int,
+    'BOOLEAN': lambda v: v.lower() == 'true' if isinstance(v, str) else bool(v),
+}
+
+def handle_shader_switch_track(target_obj: bpy.types.Object, track_data: dict, frame_override=None):
     """
     Handles a shader switch track, changing an input value on a specified shader node
     within a material associated with the target object, and keyframes it.
+    frame_override, when not None, is used if the track has no FRAME of its own.
     """
     if not bpy: return
     if not target_obj:
-        print(f"    [!] SHADER_SWITCH: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
+        _log.warning(f"    [!] SHADER_SWITCH: Target object is None. Skipping track: {track_data.get('NAME','Unnamed')}")
         return
 
     material_name_str = track_data.get("MATERIAL_NAME") # Optional, specifies which material if multiple or not on object
     target_node_name_str = track_data.get("TARGET_NODE")
     input_name_str = track_data.get("INPUT_NAME")
     new_value_any_type = track_data.get("NEW_VALUE")
-    frame_str = track_data.get("FRAME", "0")
+    frame_str = track_data.get("FRAME", "0" if frame_override is None else frame_override)
 
     if not all([target_node_name_str, input_name_str, new_value_any_type is not None]): # new_value can be False or 0
-        print(f"    [!] SHADER_SWITCH for '{target_obj.name}': Missing TARGET_NODE, INPUT_NAME, or NEW_VALUE. Skipping.")
+        _log.warning(f"    [!] SHADER_SWITCH for '{target_obj.name}': Missing TARGET_NODE, INPUT_NAME, or NEW_VALUE. Skipping.")
         return
 
     try:
         frame_int = int(frame_str)
     except ValueError:
-        print(f"    [Warning] SHADER_SWITCH for '{target_obj.name}': Invalid FRAME '{frame_str}'. Using 0.")
+        _log.warning(f"    [Warning] SHADER_SWITCH for '{target_obj.name}': Invalid FRAME '{frame_str}'. Using 0.")
         frame_int = 0
 
     mat_to_modify = None
@@ -583,118 +841,114 @@ def handle_shader_switch_track(target_obj: bpy.types.Object, track_data: dict):
     if material_name_str:
         mat_candidate = bpy.data.materials.get(material_name_str)
         if mat_candidate:
-            # Check if this material is actually on the object
-            is_on_object = False
-            for slot in target_obj.material_slots:
-                if slot.material == mat_candidate:
-                    mat_to_modify = mat_candidate
-                    is_on_object = True
-                    break
-            if not is_on_object:
-                print(f"    [Warning] SHADER_SWITCH: Material '{material_name_str}' found but not on object '{target_obj.name}'. Will try object's active/first material.")
+            # Check if this material is actually on the object. bpy structs hash and compare by
+            # datablock pointer (id() would not work: every slot.material read makes a new wrapper).
+            slot_mats = _SLOT_MATS_CACHE.get(target_obj.name)
+            if slot_mats is None:
+                slot_mats = _SLOT_MATS_CACHE[target_obj.name] = frozenset(slot.material for slot in target_obj.material_slots)
+            is_on_object = mat_candidate in slot_mats
+            if is_on_object: mat_to_modify = mat_candidate
+            else:
+                _log.warning(f"    [Warning] SHADER_SWITCH: Material '{material_name_str}' found but not on object '{target_obj.name}'. Will try object's active/first material.")
         else:
-            print(f"    [Warning] SHADER_SWITCH: Specified MATERIAL_NAME '{material_name_str}' not found. Will try object's active/first material.")
+            _log.warning(f"    [Warning] SHADER_SWITCH: Specified MATERIAL_NAME '{material_name_str}' not found. Will try object's active/first material.")
 
     # 2. If not found by name or name not given, try active material
     if not mat_to_modify and target_obj.active_material:
         mat_to_modify = target_obj.active_material
-        print(f"    [*] SHADER_SWITCH: Using active material '{mat_to_modify.name}' of '{target_obj.name}'.")
+        _debug_print(f"    [*] SHADER_SWITCH: Using active material '{mat_to_modify.name}' of '{target_obj.name}'.")
 
     # 3. Else, try first material slot
-    if not mat_to_modify and target_obj.material_slots and target_obj.material_slots[0].material:
+    if not mat_to_modify and target_obj.material_slots:
         mat_to_modify = target_obj.material_slots[0].material
-        print(f"    [*] SHADER_SWITCH: Using material '{mat_to_modify.name}' from slot 0 of '{target_obj.name}'.")
+        if mat_to_modify:
+            _debug_print(f"    [*] SHADER_SWITCH: Using material '{mat_to_modify.name}' from slot 0 of '{target_obj.name}'.")
 
     if not mat_to_modify:
-        print(f"    [!] SHADER_SWITCH for '{target_obj.name}': No suitable material found. Skipping.")
+        _log.warning(f"    [!] SHADER_SWITCH for '{target_obj.name}': No suitable material found. Skipping.")
         return
 
-    if not mat_to_modify.use_nodes or not mat_to_modify.node_tree:
-        print(f"    [Warning] SHADER_SWITCH: Material '{mat_to_modify.name}' on '{target_obj.name}' does not use nodes or has no node tree. Skipping.")
+    node_tree = mat_to_modify.node_tree
+    if not mat_to_modify.use_nodes or not node_tree:
+        _log.warning(f"    [Warning] SHADER_SWITCH: Material '{mat_to_modify.name}' on '{target_obj.name}' does not use nodes or has no node tree. Skipping.")
         return
 
-    target_node = mat_to_modify.node_tree.nodes.get(target_node_name_str)
+    target_node = node_tree.nodes.get(target_node_name_str)
     if not target_node:
-        print(f"    [Warning] SHADER_SWITCH: Target node '{target_node_name_str}' not found in material '{mat_to_modify.name}'. Skipping.")
+        _log.warning(f"    [Warning] SHADER_SWITCH: Target node '{target_node_name_str}' not found in material '{mat_to_modify.name}'. Skipping.")
         return
 
     socket_input = target_node.inputs.get(input_name_str)
     if not socket_input:
-        print(f"    [Warning] SHADER_SWITCH: Input socket '{input_name_str}' not found on node '{target_node_name_str}' in material '{mat_to_modify.name}'. Skipping.")
+        _log.warning(f"    [Warning] SHADER_SWITCH: Input socket '{input_name_str}' not found on node '{target_node_name_str}' in material '{mat_to_modify.name}'. Skipping.")
         return
 
-    parsed_value = None
+    parser = _SOCKET_PARSERS.get(socket_input.type)
+    if parser is None:
+        _log.warning(f"    [Warning] SHADER_SWITCH: Unsupported socket type '{socket_input.type}' for input '{input_name_str}'. Skipping.")
+        return
     try:
-        if socket_input.type == 'RGBA':
-            parsed_value = parse_color(str(new_value_any_type)) # parse_color expects string
-        elif socket_input.type == 'VALUE': # Float
-            parsed_value = float(new_value_any_type)
-        elif socket_input.type == 'VECTOR': # Usually expects tuple (X,Y,Z)
-            parsed_value = safe_eval(str(new_value_any_type), (0,0,0)) # safe_eval expects string
-        elif socket_input.type == 'INT':
-            parsed_value = int(new_value_any_type)
-        elif socket_input.type == 'BOOLEAN':
-            if isinstance(new_value_any_type, str):
-                parsed_value = new_value_any_type.lower() == 'true'
-            else:
-                parsed_value = bool(new_value_any_type)
-        else:
-            print(f"    [Warning] SHADER_SWITCH: Unsupported socket type '{socket_input.type}' for input '{input_name_str}'. Skipping.")
-            return
-    except ValueError as e:
-        print(f"    [Warning] SHADER_SWITCH: Error parsing NEW_VALUE '{new_value_any_type}' for socket type '{socket_input.type}': {e}. Skipping.")
+        parsed_value = parser(new_value_any_type)
+    except (TypeError, ValueError) as e:
+        _log.warning(f"    [Warning] SHADER_SWITCH: Error parsing NEW_VALUE '{new_value_any_type}' for socket type '{socket_input.type}': {e}. Skipping.")
         return
 
     if parsed_value is None and socket_input.type != 'BOOLEAN': # Boolean can correctly parse to False which is like None
-         print(f"    [Warning] SHADER_SWITCH: Parsed value is None for NEW_VALUE '{new_value_any_type}' and socket type '{socket_input.type}'. This might be an error or intended. Proceeding with None if socket allows.")
+         _log.warning(f"    [Warning] SHADER_SWITCH: Parsed value is None for NEW_VALUE '{new_value_any_type}' and socket type '{socket_input.type}'. This might be an error or intended. Proceeding with None if socket allows.")
          # Some sockets might accept None, others might error. Default_value assignment will handle this.
 
     try:
         socket_input.default_value = parsed_value
-        kp = socket_input.keyframe_insert(data_path="default_value", frame=frame_int)
-        if kp:
-            kp.interpolation = 'CONSTANT' # Switches are typically constant
-        print(f"    Set and keyframed material '{mat_to_modify.name}' node '{target_node_name_str}'.{input_name_str} to {parsed_value} at frame {frame_int}.")
+        # Key the node tree's F-Curves directly (one per component) with CONSTANT interpolation;
+        # switches are typically constant. keyframe_insert() returned a bool, so the old per-key
+        # interpolation write never took effect.
+        anim_data = node_tree.animation_data or node_tree.animation_data_create()
+        action = anim_data.action or bpy.data.actions.new(name=f"{mat_to_modify.name}_NodeTreeAction")
+        anim_data.action = action
+        data_path = socket_input.path_from_id("default_value")
+        components = parsed_value if isinstance(parsed_value, (tuple, list)) else (parsed_value,)
+        for i, comp_value in enumerate(components):
+            insert_keyframes_bulk(action, data_path, i, mat_to_modify.name, (float(frame_int),), (float(comp_value),), 'CONSTANT')
+        _debug_print(f"    Set and keyframed material '{mat_to_modify.name}' node '{target_node_name_str}'.{input_name_str} to {parsed_value} at frame {frame_int}.")
     except Exception as e:
-        print(f"    [Error] SHADER_SWITCH: Failed to set/keyframe socket '{input_name_str}' on node '{target_node_name_str}': {e}")
+        _log.error(f"    [Error] SHADER_SWITCH: Failed to set/keyframe socket '{input_name_str}' on node '{target_node_name_str}': {e}")
 
-    print(f"    ✅ Finished shader switch for: {target_obj.name} on material {mat_to_modify.name}")
+    _debug_print(f"    ✅ Finished shader switch for: {target_obj.name} on material {mat_to_modify.name}")
 
 def handle_zw_camera_block(camera_data: dict, current_bpy_collection: bpy.types.Collection):
     if not bpy: return
     name = camera_data.get("NAME","ZWCamera"); loc_str=camera_data.get("LOCATION","(0,0,0)"); rot_str=camera_data.get("ROTATION","(0,0,0)")
     fov=float(camera_data.get("FOV",50.0)); clip_start=float(camera_data.get("CLIP_START",0.1)); clip_end=float(camera_data.get("CLIP_END",1000.0))
     track_tgt_name=camera_data.get("TRACK_TARGET"); explicit_coll=camera_data.get("COLLECTION")
-    loc=safe_eval(loc_str,(0,0,0)); rot_deg=safe_eval(rot_str,(0,0,0)); rot_rad=tuple(math.radians(a) for a in rot_deg)
-    print(f"[*] Creating Camera '{name}': LOC={loc}, ROT_RAD={rot_rad}, FOV_MM={fov}")
+    loc=_fast_tuple(loc_str,_ZERO3); rot_deg=_fast_tuple(rot_str,_ZERO3); rot_rad=_radians3(rot_deg)
+    _debug_print(f"[*] Creating Camera '{name}': LOC={loc}, ROT_RAD={rot_rad}, FOV_MM={fov}")
     try:
-        bpy.ops.object.camera_add(location=loc,rotation=rot_rad); cam_obj=bpy.context.active_object
-        if not cam_obj: print(f"    [Error] Failed to create camera object '{name}'."); return
-        cam_obj.name=name; cam_data=cam_obj.data; cam_data.lens=fov; cam_data.clip_start=clip_start; cam_data.clip_end=clip_end
-        print(f"    Set camera data for '{name}'.")
+        cam_data=bpy.data.cameras.new(name=name); cam_data.lens=fov; cam_data.clip_start=clip_start; cam_data.clip_end=clip_end
+        cam_obj=bpy.data.objects.new(name=name,object_data=cam_data)
+        cam_obj.location=loc; cam_obj.rotation_euler=rot_rad
+        _debug_print(f"    Set camera data for '{name}'.")
         final_coll = get_or_create_collection(explicit_coll, bpy.context.scene.collection) if explicit_coll else current_bpy_collection
-        if final_coll:
-            for c in cam_obj.users_collection: c.objects.unlink(cam_obj)
-            final_coll.objects.link(cam_obj); print(f"    Linked '{name}' to collection '{final_coll.name}'")
+        (final_coll or bpy.context.collection).objects.link(cam_obj)
+        if final_coll: _debug_print(f"    Linked '{name}' to collection '{final_coll.name}'")
         if track_tgt_name:
             track_to=bpy.data.objects.get(track_tgt_name)
             if track_to:
                 constr=cam_obj.constraints.new(type='TRACK_TO'); constr.target=track_to
-                constr.track_axis='TRACK_NEGATIVE_Z'; constr.up_axis='UP_Y'; print(f"    Added 'TRACK_TO' constraint to '{track_tgt_name}'")
-            else: print(f"    [Warning] Track target '{track_tgt_name}' not found.")
-        print(f"    ✅ Successfully created camera '{name}'.")
-    except Exception as e: print(f"    [Error] Failed to create/configure camera '{name}': {e}")
+                constr.track_axis='TRACK_NEGATIVE_Z'; constr.up_axis='UP_Y'; _debug_print(f"    Added 'TRACK_TO' constraint to '{track_tgt_name}'")
+            else: _log.warning(f"    [Warning] Track target '{track_tgt_name}' not found.")
+        _debug_print(f"    ✅ Successfully created camera '{name}'.")
+    except Exception as e: _log.error(f"    [Error] Failed to create/configure camera '{name}': {e}")
 
 def handle_zw_light_block(light_data: dict, current_bpy_collection: bpy.types.Collection):
     if not bpy: return
     name=light_data.get("NAME","ZWLight"); loc_str=light_data.get("LOCATION","(0,0,0)"); rot_str=light_data.get("ROTATION","(0,0,0)")
-    type_str=light_data.get("TYPE","POINT").upper(); color_str=light_data.get("COLOR","#FFFFFF")
+    type_str=light_data.get("TYPE","POINT").upper(); color_str=light_data.get("COLOR")
     energy=float(light_data.get("ENERGY",100.0 if type_str=="POINT" else 10.0 if type_str=="SPOT" else 1.0))
     shadow=str(light_data.get("SHADOW","true")).lower()=="true"
     size=float(light_data.get("SIZE",0.25 if type_str in ["POINT","SPOT"] else (0.1 if type_str=="SUN" else 1.0)))
-    explicit_coll=light_data.get("COLLECTION"); loc=safe_eval(loc_str,(0,0,0)); rot_deg=safe_eval(rot_str,(0,0,0))
-    rot_rad=tuple(math.radians(a) for a in rot_deg); color_rgb=parse_color(color_str)[:3]
-    print(f"[*] Creating Light '{name}': TYPE={type_str}, LOC={loc}, ROT_RAD={rot_rad}, COLOR={color_rgb}, ENERGY={energy}")
+    explicit_coll=light_data.get("COLLECTION"); loc=_fast_tuple(loc_str,_ZERO3); rot_deg=_fast_tuple(rot_str,_ZERO3)
+    rot_rad=_radians3(rot_deg); color_rgb=_WHITE if color_str is None else parse_color_rgb(color_str)
+    _debug_print(f"[*] Creating Light '{name}': TYPE={type_str}, LOC={loc}, ROT_RAD={rot_rad}, COLOR={color_rgb}, ENERGY={energy}")
     try:
         bpy_light_data=bpy.data.lights.new(name=f"{name}_data",type=type_str)
         bpy_light_data.color=color_rgb; bpy_light_data.energy=energy
@@ -705,310 +959,311 @@ def handle_zw_light_block(light_data: dict, current_bpy_collection: bpy.types.Co
         light_obj=bpy.data.objects.new(name=name,object_data=bpy_light_data)
         light_obj.location=loc; light_obj.rotation_euler=rot_rad
         final_coll=get_or_create_collection(explicit_coll,bpy.context.scene.collection) if explicit_coll else current_bpy_collection
-        if final_coll: final_coll.objects.link(light_obj); print(f"    Linked '{name}' to collection '{final_coll.name}'")
-        else: print(f"    [Warning] No target collection for light '{name}'.")
-        print(f"    ✅ Successfully created light '{name}'.")
-    except Exception as e: print(f"    [Error] Failed to create/configure light '{name}': {e}")
+        if final_coll: final_coll.objects.link(light_obj); _debug_print(f"    Linked '{name}' to collection '{final_coll.name}'")
+        else: _log.warning(f"    [Warning] No target collection for light '{name}'.")
+        _debug_print(f"    ✅ Successfully created light '{name}'.")
+    except Exception as e: _log.error(f"    [Error] Failed to create/configure light '{name}': {e}")
+
+# --- ZW-STAGE track handlers ---
+# All take (track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys)
+# and are dispatched by TYPE through STAGE_TRACK_HANDLERS below. Plain-value keys go into
+# pending_keys via _queue_stage_key and are written per F-Curve once the whole stage is read.
+def _queue_stage_key(pending_keys: dict, id_data, data_path: str, frame, value, interp_str: str):
+    frames, values, _ = pending_keys.setdefault((id_data, data_path), ([], [], interp_str))
+    frames.append(float(frame)); values.append(float(value))
+
+def _flush_stage_keys(pending_keys: dict):
+    """Writes queued ZW-STAGE keys with one insert_keyframes_bulk call per (datablock, data path)."""
+    for (id_data, data_path), (frames, values, interp_str) in pending_keys.items():
+        anim_data = id_data.animation_data or id_data.animation_data_create()
+        action = anim_data.action or _action_for(id_data, f"{id_data.name}Action")
+        insert_keyframes_bulk(action, data_path, 0, id_data.name, frames, values, interp_str)
+    pending_keys.clear()
+
+def _stage_camera_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj and target_obj.type == 'CAMERA':
+        scene.camera = target_obj
+        scene.keyframe_insert(data_path="camera", frame=start_frame)
+        _debug_print(f"    Set active camera to '{target_obj.name}' at frame {start_frame}")
+    else: _log.warning(f"    [Warning] Target '{target_name}' for CAMERA track is not valid or not found.")
+
+def _stage_visibility_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj:
+        state_str = str(track_item_dict.get("STATE", "SHOW")).upper()
+        hide_val = True if state_str == "HIDE" else False
+        if target_obj.hide_viewport != hide_val: target_obj.hide_viewport = hide_val
+        if target_obj.hide_render != hide_val: target_obj.hide_render = hide_val
+        # hide_viewport and hide_render always key the same frames and states, so both F-Curves
+        # share one pair of queued lists and each VISIBILITY track appends to them once.
+        queued = pending_keys.get((target_obj, "hide_viewport"))
+        if queued is None:
+            queued = pending_keys[(target_obj, "hide_viewport")] = pending_keys[(target_obj, "hide_render")] = ([], [], 'CONSTANT')
+        queued[0].append(float(start_frame)); queued[1].append(float(hide_val))
+        _debug_print(f"    Set visibility of '{target_obj.name}' to {'HIDDEN' if hide_val else 'VISIBLE'} at frame {start_frame}")
+    else: _log.warning(f"    [Warning] Target object '{target_name}' for VISIBILITY track not found.")
+
+def _stage_light_intensity_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj and target_obj.type == 'LIGHT':
+        light_data_block = target_obj.data; value_at_start_str = track_item_dict.get("VALUE")
+        if value_at_start_str is not None:
+            try:
+                value_at_start = float(value_at_start_str)
+                light_data_block.energy = value_at_start
+                _queue_stage_key(pending_keys, light_data_block, "energy", start_frame, value_at_start, 'BEZIER')
+                _debug_print(f"    Set energy of light '{target_obj.name}' to {value_at_start} at frame {start_frame}")
+            except ValueError: _log.warning(f"    [Warning] Invalid VALUE '{value_at_start_str}' for LIGHT_INTENSITY on '{target_name}'.")
+        else: _log.warning(f"    [Warning] Missing VALUE for LIGHT_INTENSITY on '{target_name}' at frame {start_frame}.")
+        end_value_str = track_item_dict.get("END_VALUE")
+        if end_frame is not None and end_value_str is not None:
+            try:
+                value_at_end = float(end_value_str)
+                light_data_block.energy = value_at_end
+                _queue_stage_key(pending_keys, light_data_block, "energy", end_frame, value_at_end, 'BEZIER')
+                _debug_print(f"    Animated energy of light '{target_obj.name}' to {value_at_end} at frame {end_frame}")
+            except ValueError: _log.warning(f"    [Warning] Invalid END_VALUE '{end_value_str}' for LIGHT_INTENSITY on '{target_name}'.")
+    else: _log.warning(f"    [Warning] Target '{target_name}' for LIGHT_INTENSITY track is not valid or not found.")
+
+def _stage_property_anim_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj: # Ensure target_obj was found
+        _debug_print(f"    Dispatching to handle_property_anim_track for {target_name}")
+        # Pass the whole track_item_dict as it contains all necessary params for the handler
+        handle_property_anim_track(target_obj, track_item_dict)
+    else:
+        _log.warning(f"    [Warning] Target object '{target_name}' not found for PROPERTY_ANIM track.")
+
+def _stage_material_override_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj: # Ensure target_obj was found
+        _debug_print(f"    Dispatching to handle_material_override_track for {target_name}")
+        # track_item_dict carries "MATERIAL_NAME" and "RESTORE_ON_END"; the stage's START/END
+        # frames are passed as overrides instead of being written into a copy of the dict.
+        _SLOT_MATS_CACHE.pop(target_obj.name, None) # Slot 0 changes below
+        handle_material_override_track(target_obj, track_item_dict, start_frame, end_frame)
+    else:
+        _log.warning(f"    [Warning] Target object '{target_name}' not found for MATERIAL_OVERRIDE track.")
+
+def _stage_shader_switch_track(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys):
+    if target_obj: # Ensure target_obj was found
+        _debug_print(f"    Dispatching to handle_shader_switch_track for {target_name}")
+        # track_item_dict carries "TARGET_NODE", "INPUT_NAME", "NEW_VALUE" and an optional "FRAME",
+        # which defaults to the track's START
+        handle_shader_switch_track(target_obj, track_item_dict, start_frame)
+    else:
+        _log.warning(f"    [Warning] Target object '{target_name}' not found for SHADER_SWITCH track.")
+
+@contextlib.contextmanager
+def _batched_updates(scene):
+    """
+    Groups a burst of property writes and keyframe inserts: nothing inside asks for an
+    evaluated depsgraph, and the view layer is synced once on the way out. The current
+    frame is restored in case a handler moved it.
+    """
+    orig_frame = scene.frame_current
+    try:
+        yield
+    finally:
+        if scene.frame_current != orig_frame: scene.frame_current = orig_frame
+        bpy.context.view_layer.update()
+
+STAGE_TRACK_HANDLERS = {
+    "CAMERA": _stage_camera_track,
+    "VISIBILITY": _stage_visibility_track,
+    "LIGHT_INTENSITY": _stage_light_intensity_track,
+    "PROPERTY_ANIM": _stage_property_anim_track,
+    "MATERIAL_OVERRIDE": _stage_material_override_track,
+    "SHADER_SWITCH": _stage_shader_switch_track,
+}
 
 def handle_zw_stage_block(stage_data: dict):
     if not bpy: return
     tracks_list = stage_data.get("TRACKS")
     stage_name = stage_data.get('NAME', 'UnnamedStage')
-    print(f"[*] Processing stage: {stage_name}")
+    _debug_print(f"[*] Processing stage: {stage_name}")
     if not isinstance(tracks_list, list) or not tracks_list:
-        print(f"    [Warning] No TRACKS found or TRACKS is not a list in ZW-STAGE '{stage_name}'. Skipping.")
+        _log.warning(f"    [Warning] No TRACKS found or TRACKS is not a list in ZW-STAGE '{stage_name}'. Skipping.")
         return
-    for track_item_dict in tracks_list:
-        if not isinstance(track_item_dict, dict):
-            print(f"    [Warning] Track item is not a dictionary in ZW-STAGE '{stage_name}'. Skipping track: {track_item_dict}")
-            continue
-        track_type = track_item_dict.get("TYPE")
-        target_name = track_item_dict.get("TARGET")
-        start_frame_str = track_item_dict.get("START", "1")
-        try: start_frame = int(start_frame_str)
-        except ValueError: print(f"    [Warning] Invalid START frame '{start_frame_str}'. Defaulting to 1."); start_frame = 1
-        end_frame_str = track_item_dict.get("END"); end_frame = None
-        if end_frame_str is not None:
-            try: end_frame = int(end_frame_str)
-            except ValueError: print(f"    [Warning] Invalid END frame '{end_frame_str}'. END frame ignored.")
-        target_obj = bpy.data.objects.get(target_name) if target_name else None
-        print(f"  Processing track: TYPE='{track_type}', TARGET='{target_name}', START={start_frame}")
-
-        if track_type == "CAMERA":
-            if target_obj and target_obj.type == 'CAMERA':
-                bpy.context.scene.camera = target_obj
-                bpy.context.scene.keyframe_insert(data_path="camera", frame=start_frame)
-                print(f"    Set active camera to '{target_obj.name}' at frame {start_frame}")
-            else: print(f"    [Warning] Target '{target_name}' for CAMERA track is not valid or not found.")
-        elif track_type == "VISIBILITY":
-            if target_obj:
-                state_str = str(track_item_dict.get("STATE", "SHOW")).upper()
-                hide_val = True if state_str == "HIDE" else False
-                target_obj.hide_viewport = hide_val; target_obj.keyframe_insert(data_path="hide_viewport", frame=start_frame)
-                target_obj.hide_render = hide_val; target_obj.keyframe_insert(data_path="hide_render", frame=start_frame)
-                print(f"    Set visibility of '{target_obj.name}' to {'HIDDEN' if hide_val else 'VISIBLE'} at frame {start_frame}")
-            else: print(f"    [Warning] Target object '{target_name}' for VISIBILITY track not found.")
-        elif track_type == "LIGHT_INTENSITY":
-            if target_obj and target_obj.type == 'LIGHT':
-                light_data_block = target_obj.data; value_at_start_str = track_item_dict.get("VALUE")
-                if value_at_start_str is not None:
-                    try:
-                        value_at_start = float(value_at_start_str)
-                        light_data_block.energy = value_at_start
-                        light_data_block.keyframe_insert(data_path="energy", frame=start_frame)
-                        print(f"    Set energy of light '{target_obj.name}' to {value_at_start} at frame {start_frame}")
-                    except ValueError: print(f"    [Warning] Invalid VALUE '{value_at_start_str}' for LIGHT_INTENSITY on '{target_name}'.")
-                else: print(f"    [Warning] Missing VALUE for LIGHT_INTENSITY on '{target_name}' at frame {start_frame}.")
-                end_value_str = track_item_dict.get("END_VALUE")
-                if end_frame is not None and end_value_str is not None:
-                    try:
-                        value_at_end = float(end_value_str)
-                        light_data_block.energy = value_at_end
-                        light_data_block.keyframe_insert(data_path="energy", frame=end_frame)
-                        print(f"    Animated energy of light '{target_obj.name}' to {value_at_end} at frame {end_frame}")
-                    except ValueError: print(f"    [Warning] Invalid END_VALUE '{end_value_str}' for LIGHT_INTENSITY on '{target_name}'.")
-            else: print(f"    [Warning] Target '{target_name}' for LIGHT_INTENSITY track is not valid or not found.")
-
-        elif track_type == "PROPERTY_ANIM":
-            if target_obj: # Ensure target_obj was found
-                print(f"    Dispatching to handle_property_anim_track for {target_name}")
-                # Pass the whole track_item_dict as it contains all necessary params for the handler
-                handle_property_anim_track(target_obj, track_item_dict)
-            else:
-                print(f"    [Warning] Target object '{target_name}' not found for PROPERTY_ANIM track.")
-
-        elif track_type == "MATERIAL_OVERRIDE":
-            if target_obj: # Ensure target_obj was found
-                print(f"    Dispatching to handle_material_override_track for {target_name}")
-                # Pass relevant parts or the whole dict. Handler expects specific keys.
-                # track_item_dict contains "MATERIAL_NAME", "START_FRAME", "END_FRAME", "RESTORE_ON_END"
-                # Need to make sure START_FRAME is passed if not already part of base extraction
-                track_data_for_handler = track_item_dict.copy()
-                track_data_for_handler["START_FRAME"] = start_frame # Ensure start_frame from loop is used
-                if end_frame is not None: # Ensure end_frame from loop is used
-                    track_data_for_handler["END_FRAME"] = end_frame
-                handle_material_override_track(target_obj, track_data_for_handler)
-            else:
-                print(f"    [Warning] Target object '{target_name}' not found for MATERIAL_OVERRIDE track.")
-
-        elif track_type == "SHADER_SWITCH":
-            if target_obj: # Ensure target_obj was found
-                print(f"    Dispatching to handle_shader_switch_track for {target_name}")
-                # Pass relevant parts or the whole dict. Handler expects specific keys.
-                # track_item_dict contains "TARGET_NODE", "INPUT_NAME", "NEW_VALUE", "FRAME" (optional, defaults to start_frame)
-                # Need to make sure FRAME is passed correctly.
-                track_data_for_handler = track_item_dict.copy()
-                track_data_for_handler["FRAME"] = track_item_dict.get("FRAME", start_frame) # Use specific FRAME or default to track's START
-                handle_shader_switch_track(target_obj, track_data_for_handler)
+    # Resolved once per stage rather than once (or several times) per track
+    objects_get = bpy.data.objects.get; scene = bpy.context.scene; handlers_get = STAGE_TRACK_HANDLERS.get
+    pending_keys = {} # (datablock, data path) -> ([frames], [values], interpolation)
+    _SLOT_MATS_CACHE.clear()
+    with _batched_updates(scene):
+        for track_item_dict in tracks_list:
+            if not isinstance(track_item_dict, dict):
+                _log.warning(f"    [Warning] Track item is not a dictionary in ZW-STAGE '{stage_name}'. Skipping track: {track_item_dict}")
+                continue
+            track_type = track_item_dict.get("TYPE")
+            target_name = track_item_dict.get("TARGET")
+            start_frame_str = track_item_dict.get("START", "1")
+            try: start_frame = int(start_frame_str)
+            except ValueError: _log.warning(f"    [Warning] Invalid START frame '{start_frame_str}'. Defaulting to 1."); start_frame = 1
+            end_frame_str = track_item_dict.get("END"); end_frame = None
+            if end_frame_str is not None:
+                try: end_frame = int(end_frame_str)
+                except ValueError: _log.warning(f"    [Warning] Invalid END frame '{end_frame_str}'. END frame ignored.")
+            target_obj = objects_get(target_name) if target_name else None
+            _debug_print(f"  Processing track: TYPE='{track_type}', TARGET='{target_name}', START={start_frame}")
+
+            track_handler = handlers_get(track_type)
+            if track_handler: track_handler(track_item_dict, target_obj, target_name, start_frame, end_frame, scene, pending_keys)
             else:
-                print(f"    [Warning] Target object '{target_name}' not found for SHADER_SWITCH track.")
-        else:
-            print(f"    [Warning] Unknown ZW-STAGE track TYPE: '{track_type}'")
-    print(f"[*] Finished processing stage: {stage_name}")
-
-def handle_zw_camera_block(camera_data: dict, current_bpy_collection: bpy.types.Collection):
-    if not bpy: return
-    name = camera_data.get("NAME","ZWCamera"); loc_str=camera_data.get("LOCATION","(0,0,0)"); rot_str=camera_data.get("ROTATION","(0,0,0)")
-    fov=float(camera_data.get("FOV",50.0)); clip_start=float(camera_data.get("CLIP_START",0.1)); clip_end=float(camera_data.get("CLIP_END",1000.0))
-    track_tgt_name=camera_data.get("TRACK_TARGET"); explicit_coll=camera_data.get("COLLECTION")
-    loc=safe_eval(loc_str,(0,0,0)); rot_deg=safe_eval(rot_str,(0,0,0)); rot_rad=tuple(math.radians(a) for a in rot_deg)
-    print(f"[*] Creating Camera '{name}': LOC={loc}, ROT_RAD={rot_rad}, FOV_MM={fov}")
-    try:
-        bpy.ops.object.camera_add(location=loc,rotation=rot_rad); cam_obj=bpy.context.active_object
-        if not cam_obj: print(f"    [Error] Failed to create camera object '{name}'."); return
-        cam_obj.name=name; cam_data=cam_obj.data; cam_data.lens=fov; cam_data.clip_start=clip_start; cam_data.clip_end=clip_end
-        print(f"    Set camera data for '{name}'.")
-        final_coll = get_or_create_collection(explicit_coll, bpy.context.scene.collection) if explicit_coll else current_bpy_collection
-        if final_coll:
-            for c in cam_obj.users_collection: c.objects.unlink(cam_obj)
-            final_coll.objects.link(cam_obj); print(f"    Linked '{name}' to collection '{final_coll.name}'")
-        if track_tgt_name:
-            track_to=bpy.data.objects.get(track_tgt_name)
-            if track_to:
-                constr=cam_obj.constraints.new(type='TRACK_TO'); constr.target=track_to
-                constr.track_axis='TRACK_NEGATIVE_Z'; constr.up_axis='UP_Y'; print(f"    Added 'TRACK_TO' constraint to '{track_tgt_name}'")
-            else: print(f"    [Warning] Track target '{track_tgt_name}' not found.")
-        print(f"    ✅ Successfully created camera '{name}'.")
-    except Exception as e: print(f"    [Error] Failed to create/configure camera '{name}': {e}")
-
-def handle_zw_light_block(light_data: dict, current_bpy_collection: bpy.types.Collection):
-    if not bpy: return
-    name=light_data.get("NAME","ZWLight"); loc_str=light_data.get("LOCATION","(0,0,0)"); rot_str=light_data.get("ROTATION","(0,0,0)")
-    type_str=light_data.get("TYPE","POINT").upper(); color_str=light_data.get("COLOR","#FFFFFF")
-    energy=float(light_data.get("ENERGY",100.0 if type_str=="POINT" else 10.0 if type_str=="SPOT" else 1.0))
-    shadow=str(light_data.get("SHADOW","true")).lower()=="true"
-    size=float(light_data.get("SIZE",0.25 if type_str in ["POINT","SPOT"] else (0.1 if type_str=="SUN" else 1.0)))
-    explicit_coll=light_data.get("COLLECTION"); loc=safe_eval(loc_str,(0,0,0)); rot_deg=safe_eval(rot_str,(0,0,0))
-    rot_rad=tuple(math.radians(a) for a in rot_deg); color_rgb=parse_color(color_str)[:3]
-    print(f"[*] Creating Light '{name}': TYPE={type_str}, LOC={loc}, ROT_RAD={rot_rad}, COLOR={color_rgb}, ENERGY={energy}")
-    try:
-        bpy_light_data=bpy.data.lights.new(name=f"{name}_data",type=type_str)
-        bpy_light_data.color=color_rgb; bpy_light_data.energy=energy
-        if hasattr(bpy_light_data,'use_shadow'): bpy_light_data.use_shadow=shadow
-        if type_str in ['POINT','SPOT']: bpy_light_data.shadow_soft_size=size
-        elif type_str=='AREA': bpy_light_data.size=size
-        elif type_str=='SUN': bpy_light_data.angle=size
-        light_obj=bpy.data.objects.new(name=name,object_data=bpy_light_data)
-        light_obj.location=loc; light_obj.rotation_euler=rot_rad
-        final_coll=get_or_create_collection(explicit_coll,bpy.context.scene.collection) if explicit_coll else current_bpy_collection
-        if final_coll: final_coll.objects.link(light_obj); print(f"    Linked '{name}' to collection '{final_coll.name}'")
-        else: print(f"    [Warning] No target collection for light '{name}'.")
-        print(f"    ✅ Successfully created light '{name}'.")
-    except Exception as e: print(f"    [Error] Failed to create/configure light '{name}': {e}")
+                _log.warning(f"    [Warning] Unknown ZW-STAGE track TYPE: '{track_type}'")
+        _flush_stage_keys(pending_keys)
+    _debug_print(f"[*] Finished processing stage: {stage_name}")
 
 # --- Main Processing Logic ---
-def process_zw_structure(data_dict: dict, parent_bpy_obj=None, current_bpy_collection=None):
+# Upper-cased block key -> (handler(value, collection), "processing" log line, fallback NAME,
+# "not a dictionary" warning). The lambdas adapt each handler's signature and resolve it at call time.
+BLOCK_DISPATCH = {
+    "ZW-FUNCTION": (lambda value, coll: handle_zw_function_block(value), "[*] Processing ZW-FUNCTION block: {}", "Unnamed Function",
+                    "[!] Warning: ZW-FUNCTION value is not a dictionary: {}"),
+    "ZW-DRIVER": (lambda value, coll: handle_zw_driver_block(value), "[*] Processing ZW-DRIVER block: {}", "Unnamed Driver",
+                  "[!] Warning: ZW-DRIVER value is not a dictionary: {}"),
+    "ZW-ANIMATION": (lambda value, coll: handle_zw_animation_block(value), "  Processing ZW-ANIMATION block: {}", "UnnamedAnimation",
+                     "    [Warning] Value for 'ZW-ANIMATION' key is not a dictionary. Value: {}"),
+    "ZW-CAMERA": (lambda value, coll: handle_zw_camera_block(value, coll), "  Processing ZW-CAMERA block for: {}", "UnnamedCamera",
+                  "    [Warning] Value for 'ZW-CAMERA' key is not a dictionary. Value: {}"),
+    "ZW-LIGHT": (lambda value, coll: handle_zw_light_block(value, coll), "  Processing ZW-LIGHT block for: {}", "UnnamedLight",
+                 "    [Warning] Value for 'ZW-LIGHT' key is not a dictionary. Value: {}"),
+    "ZW-STAGE": (lambda value, coll: handle_zw_stage_block(value), "  Processing ZW-STAGE block: {}", "UnnamedStage",
+                 "    [Warning] Value for 'ZW-STAGE' key is not a dictionary. Value: {}"),
+}
+
+def _child_block_items(children: list, warn_non_dict: bool):
+    """(key, value) pairs of every dict in a CHILDREN list, in order, for process_zw_structure's worklist."""
+    for child_item_definition in children:
+        if isinstance(child_item_definition, dict): yield from child_item_definition.items()
+        elif warn_non_dict: _log.warning(f"    [!] Warning: Item in CHILDREN list is not a dictionary: {child_item_definition}")
+
+def process_zw_structure(data_dict: dict, parent_bpy_obj=None, current_bpy_collection=None, scene_collection=None):
     if not bpy: return
-    if current_bpy_collection is None: current_bpy_collection = bpy.context.scene.collection
+    if scene_collection is None: scene_collection = bpy.context.scene.collection
+    if current_bpy_collection is None: current_bpy_collection = scene_collection
     if not isinstance(data_dict, dict): return
-    for key, value in data_dict.items():
+    # Walked with an explicit stack of (items iterator, parent object, collection) frames instead of
+    # recursing per nested dict: deep ZW files don't hit the recursion limit, and since each frame
+    # is drained before the one below it resumes, blocks are still handled in document order.
+    stack = [(iter(data_dict.items()), parent_bpy_obj, current_bpy_collection)]
+    while stack:
+        items, parent_bpy_obj, current_bpy_collection = stack[-1]
+        item = next(items, None)
+        if item is None: stack.pop(); continue
+        key, value = item
         created_bpy_object_for_current_zw_object = None
         obj_attributes_for_current_zw_object = None
         target_collection_for_this_object = current_bpy_collection
-        if key.upper().startswith("ZW-COLLECTION"):
+        key_upper = key.upper() # Once per key; the dispatch below compares against it
+        if key_upper.startswith("ZW-COLLECTION"):
             collection_name = key.split(":", 1)[1].strip() if ":" in key else key.replace("ZW-COLLECTION", "").strip()
             if not collection_name: collection_name = "Unnamed_ZW_Collection"
-            print(f"[*] Processing ZW-COLLECTION block: '{collection_name}' under '{current_bpy_collection.name}'")
+            _debug_print(f"[*] Processing ZW-COLLECTION block: '{collection_name}' under '{current_bpy_collection.name}'")
             block_bpy_collection = get_or_create_collection(collection_name, parent_collection=current_bpy_collection)
             if isinstance(value, dict) and "CHILDREN" in value and isinstance(value["CHILDREN"], list):
-                for child_def_item in value["CHILDREN"]:
-                    if isinstance(child_def_item, dict):
-                        process_zw_structure(child_def_item, parent_bpy_obj=parent_bpy_obj, current_bpy_collection=block_bpy_collection)
+                stack.append((_child_block_items(value["CHILDREN"], False), parent_bpy_obj, block_bpy_collection))
             elif isinstance(value, dict) :
-                process_zw_structure(value, parent_bpy_obj=parent_bpy_obj, current_bpy_collection=block_bpy_collection)
-            continue
-        elif key.upper() == "ZW-FUNCTION":
-            if isinstance(value, dict):
-                print(f"[*] Processing ZW-FUNCTION block: {value.get('NAME', 'Unnamed Function')}")
-                handle_zw_function_block(value)
-            else: print(f"[!] Warning: ZW-FUNCTION value is not a dictionary: {value}")
-            continue
-        elif key.upper() == "ZW-DRIVER":
-            if isinstance(value, dict):
-                print(f"[*] Processing ZW-DRIVER block: {value.get('NAME', 'Unnamed Driver')}")
-                handle_zw_driver_block(value)
-            else: print(f"[!] Warning: ZW-DRIVER value is not a dictionary: {value}")
+                stack.append((iter(value.items()), parent_bpy_obj, block_bpy_collection))
             continue
-        elif key.upper() == "ZW-ANIMATION":
+        block_entry = BLOCK_DISPATCH.get(key_upper)
+        if block_entry:
+            handler, processing_msg, unnamed, warning_msg = block_entry
             if isinstance(value, dict):
-                print(f"  Processing ZW-ANIMATION block: {value.get('NAME', 'UnnamedAnimation')}")
-                handle_zw_animation_block(value)
-            else: print(f"    [Warning] Value for 'ZW-ANIMATION' key is not a dictionary. Value: {value}")
+                _debug_print(processing_msg.format(value.get('NAME', unnamed)))
+                handler(value, current_bpy_collection)
+            else: _log.warning(warning_msg.format(value))
             continue
-        elif key.upper() == "ZW-CAMERA":
+        if key == "ZW-MESH": # Assuming ZW-MESH is a key, and its value is the definition dictionary
             if isinstance(value, dict):
-                print(f"  Processing ZW-CAMERA block for: {value.get('NAME', 'UnnamedCamera')}")
-                handle_zw_camera_block(value, current_bpy_collection)
-            else: print(f"    [Warning] Value for 'ZW-CAMERA' key is not a dictionary. Value: {value}")
-            continue
-        elif key.upper() == "ZW-LIGHT":
-            if isinstance(value, dict):
-                print(f"  Processing ZW-LIGHT block for: {value.get('NAME', 'UnnamedLight')}")
-                handle_zw_light_block(value, current_bpy_collection)
-            else: print(f"    [Warning] Value for 'ZW-LIGHT' key is not a dictionary. Value: {value}")
-            continue
-        elif key.upper() == "ZW-STAGE":
-            if isinstance(value, dict):
-                print(f"  Processing ZW-STAGE block: {value.get('NAME', 'UnnamedStage')}")
-                handle_zw_stage_block(value)
-            else: print(f"    [Warning] Value for 'ZW-STAGE' key is not a dictionary. Value: {value}")
-            continue
-        elif key == "ZW-MESH": # Assuming ZW-MESH is a key, and its value is the definition dictionary
-            if isinstance(value, dict):
-                if ZW_MESH_IMPORTED and HANDLE_ZW_MESH_BLOCK_FUNC:
-                    print(f"  Processing ZW-MESH block: {value.get('NAME', 'UnnamedZWMesh')}")
+                handle_zw_mesh_block = _zw_mesh_func("handle_zw_mesh_block")
+                if handle_zw_mesh_block:
+                    _debug_print(f"  Processing ZW-MESH block: {value.get('NAME', 'UnnamedZWMesh')}")
                     # Pass the current_bpy_collection so zw_mesh.py can link the new object correctly
-                    HANDLE_ZW_MESH_BLOCK_FUNC(value, current_bpy_collection)
+                    handle_zw_mesh_block(value, current_bpy_collection)
                 else:
-                    print("    [Error] ZW-MESH block found, but zw_mesh.handle_zw_mesh_block function was not imported.")
+                    _log.error("    [Error] ZW-MESH block found, but zw_mesh.handle_zw_mesh_block function was not imported.")
             else:
-                print(f"    [Warning] Value for 'ZW-MESH' key is not a dictionary. Value: {value}")
+                _log.warning(f"    [Warning] Value for 'ZW-MESH' key is not a dictionary. Value: {value}")
             continue # Added continue to ensure it doesn't fall through to ZW-OBJECT or generic dict processing
-        if key.upper() == "ZW-OBJECT":
+        if key_upper == "ZW-OBJECT":
             if isinstance(value, dict): obj_attributes_for_current_zw_object = value
             elif isinstance(value, str): obj_attributes_for_current_zw_object = {"TYPE": value}
         elif key.lower() in ["sphere", "cube", "plane", "cone", "cylinder", "torus"] and isinstance(value, dict):
             obj_attributes_for_current_zw_object = value.copy()
             obj_attributes_for_current_zw_object["TYPE"] = key
         if obj_attributes_for_current_zw_object:
-            created_bpy_object_for_current_zw_object = handle_zw_object_creation(obj_attributes_for_current_zw_object, parent_bpy_obj)
+            created_bpy_object_for_current_zw_object = handle_zw_object_creation(obj_attributes_for_current_zw_object, parent_bpy_obj, defer_active=True)
             if created_bpy_object_for_current_zw_object:
                 explicit_collection_name = obj_attributes_for_current_zw_object.get("COLLECTION")
                 if explicit_collection_name:
-                    target_collection_for_this_object = get_or_create_collection(explicit_collection_name, parent_collection=bpy.context.scene.collection)
+                    target_collection_for_this_object = get_or_create_collection(explicit_collection_name, parent_collection=scene_collection)
                 if target_collection_for_this_object:
-                    for coll in created_bpy_object_for_current_zw_object.users_collection:
-                        coll.objects.unlink(created_bpy_object_for_current_zw_object)
-                    target_collection_for_this_object.objects.link(created_bpy_object_for_current_zw_object)
-                    print(f"    Linked '{created_bpy_object_for_current_zw_object.name}' to collection '{target_collection_for_this_object.name}'")
+                    swap_collection(created_bpy_object_for_current_zw_object, target_collection_for_this_object)
+                    _debug_print(f"    Linked '{created_bpy_object_for_current_zw_object.name}' to collection '{target_collection_for_this_object.name}'")
                 children_list = obj_attributes_for_current_zw_object.get("CHILDREN")
                 if children_list and isinstance(children_list, list):
-                    print(f"[*] Processing CHILDREN for '{created_bpy_object_for_current_zw_object.name}' in collection '{target_collection_for_this_object.name}'")
-                    for child_item_definition in children_list:
-                        if isinstance(child_item_definition, dict):
-                            process_zw_structure(child_item_definition,
-                                                 parent_bpy_obj=created_bpy_object_for_current_zw_object,
-                                                 current_bpy_collection=target_collection_for_this_object)
-                        else: print(f"    [!] Warning: Item in CHILDREN list is not a dictionary: {child_item_definition}")
-                elif children_list is not None: print(f"    [!] Warning: CHILDREN attribute for an object is not a list: {type(children_list)}")
+                    _debug_print(f"[*] Processing CHILDREN for '{created_bpy_object_for_current_zw_object.name}' in collection '{target_collection_for_this_object.name}'")
+                    stack.append((_child_block_items(children_list, True), created_bpy_object_for_current_zw_object, target_collection_for_this_object))
+                elif children_list is not None: _log.warning(f"    [!] Warning: CHILDREN attribute for an object is not a list: {type(children_list)}")
             continue
         elif isinstance(value, dict):
-            if key.upper() == "ZW-NESTED-DETAILS":
-                print(f"[*] Processing ZW-NESTED-DETAILS (semantic parent link: {value.get('PARENT')}). Using collection '{current_bpy_collection.name}'")
-            process_zw_structure(value, parent_bpy_obj=parent_bpy_obj, current_bpy_collection=current_bpy_collection)
+            if key_upper == "ZW-NESTED-DETAILS":
+                _debug_print(f"[*] Processing ZW-NESTED-DETAILS (semantic parent link: {value.get('PARENT')}). Using collection '{current_bpy_collection.name}'")
+            stack.append((iter(value.items()), parent_bpy_obj, current_bpy_collection))
+
+def build_zw_scene(parsed_zw_data: dict):
+    """Build already-parsed ZW data into the current scene. Shared by run_blender_adapter and
+    callers running inside Blender's Python (the engine adapter's in-process path); raises on failure."""
+    context = bpy.context; active_obj = context.object # Context members bound once for the run
+    if active_obj and active_obj.mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
+    _reset_scene_caches()
+    scene_collection = context.scene.collection
+    process_zw_structure(parsed_zw_data, current_bpy_collection=scene_collection, scene_collection=scene_collection)
+    _apply_deferred_selection()
+    context.view_layer.update() # One depsgraph/view-layer sync for the whole build
 
 def run_blender_adapter():
     print("--- Starting ZW Blender Adapter ---")
-    if not bpy: print("[X] Blender Python environment (bpy) not detected. Cannot proceed."); print("--- ZW Blender Adapter Finished (with errors) ---"); return
-    if bpy.context.object and bpy.context.object.mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
+    if not bpy: _log.error("[X] Blender Python environment (bpy) not detected. Cannot proceed."); print("--- ZW Blender Adapter Finished (with errors) ---"); return
     try:
         with open(ZW_INPUT_FILE_PATH, "r", encoding="utf-8") as f: zw_text_content = f.read()
-        print(f"[*] Successfully read ZW file: {ZW_INPUT_FILE_PATH}")
-    except FileNotFoundError: print(f"[X] Error: ZW input file not found at '{ZW_INPUT_FILE_PATH}'"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
-    except Exception as e: print(f"[X] Error reading ZW file '{ZW_INPUT_FILE_PATH}': {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
-    if not zw_text_content.strip(): print("[X] Error: ZW input file is empty."); print("--- ZW Blender Adapter Finished (with errors) ---"); return
+        _debug_print(f"[*] Successfully read ZW file: {ZW_INPUT_FILE_PATH}")
+    except FileNotFoundError: _log.error(f"[X] Error: ZW input file not found at '{ZW_INPUT_FILE_PATH}'"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
+    except Exception as e: _log.error(f"[X] Error reading ZW file '{ZW_INPUT_FILE_PATH}': {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
+    if not zw_text_content.strip(): _log.error("[X] Error: ZW input file is empty."); print("--- ZW Blender Adapter Finished (with errors) ---"); return
     try:
-        print("[*] Parsing ZW text..."); parsed_zw_data = parse_zw(zw_text_content)
-        if not parsed_zw_data: print("[!] Warning: Parsed ZW data is empty. No objects will be created.")
-    except Exception as e: print(f"[X] Error parsing ZW text: {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
+        _debug_print("[*] Parsing ZW text..."); parsed_zw_data = parse_zw(zw_text_content)
+        if not parsed_zw_data: _log.warning("[!] Warning: Parsed ZW data is empty. No objects will be created.")
+    except Exception as e: _log.error(f"[X] Error parsing ZW text: {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
     try:
-        print("[*] Processing ZW structure for Blender object creation...")
-        process_zw_structure(parsed_zw_data, current_bpy_collection=bpy.context.scene.collection)
-        print("[*] Finished processing ZW structure.")
-    except Exception as e: print(f"[X] Error during ZW structure processing for Blender: {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
+        _debug_print("[*] Processing ZW structure for Blender object creation...")
+        build_zw_scene(parsed_zw_data)
+        _debug_print("[*] Finished processing ZW structure.")
+    except Exception as e: _log.error(f"[X] Error during ZW structure processing for Blender: {e}"); print("--- ZW Blender Adapter Finished (with errors) ---"); return
     print("--- ZW Blender Adapter Finished Successfully ---")
 
 # --- ZW-COMPOSE Handler ---
 def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Collection):
     if not bpy:
-        print("[Error] bpy module not available in handle_zw_compose_block. Cannot process ZW-COMPOSE.")
+        _log.error("[Error] bpy module not available in handle_zw_compose_block. Cannot process ZW-COMPOSE.")
         return
+    from mathutils import Euler # Deferred with bpy-side imports; only ZW-COMPOSE transforms need it
+    scene_collection = bpy.context.scene.collection; view_layer = bpy.context.view_layer # Bound once per composition
 
     compose_name = compose_data.get("NAME", "ZWComposition")
-    print(f"    Creating ZW-COMPOSE assembly: {compose_name}")
+    _debug_print(f"    Creating ZW-COMPOSE assembly: {compose_name}")
 
-    # Create parent Empty for the composition
-    bpy.ops.object.empty_add(type='PLAIN_AXES')
-    parent_empty = bpy.context.active_object
-    if not parent_empty: # Should not happen if ops.empty_add worked
-        print(f"      [Error] Failed to create parent Empty for {compose_name}. Aborting ZW-COMPOSE.")
-        return
-    parent_empty.name = compose_name
+    # Create parent Empty for the composition (object_data=None makes an Empty). Built through
+    # bpy.data rather than empty_add, so it isn't linked anywhere until we link it below.
+    parent_empty = bpy.data.objects.new(name=compose_name, object_data=None)
+    parent_empty.empty_display_type = 'PLAIN_AXES'
+    composition_children = [] # Base model and attachments as created; exported without a children_recursive scan
 
     # Handle transform for the parent_empty itself
     loc_str = compose_data.get("LOCATION", "(0,0,0)")
     rot_str = compose_data.get("ROTATION", "(0,0,0)")
     scale_str = compose_data.get("SCALE", "(1,1,1)")
-    parent_empty.location = safe_eval(loc_str, (0,0,0))
-    rot_deg = safe_eval(rot_str, (0,0,0))
-    parent_empty.rotation_euler = Euler([math.radians(a) for a in rot_deg], 'XYZ')
-
-    scale_eval = safe_eval(scale_str, (1,1,1))
-    if isinstance(scale_eval, (int, float)): # Uniform scale
-        parent_empty.scale = (float(scale_eval), float(scale_eval), float(scale_eval))
-    else: # Tuple scale
-        parent_empty.scale = scale_eval
-    print(f"      Parent Empty '{parent_empty.name}' transform: L={parent_empty.location}, R={parent_empty.rotation_euler}, S={parent_empty.scale}")
+    parent_empty.location = _fast_tuple(loc_str, _ZERO3)
+    rot_deg = _fast_tuple(rot_str, _ZERO3)
+    parent_empty.rotation_euler = Euler(_radians3(rot_deg), 'XYZ')
+    parent_empty.scale = _fast_scale(scale_str)
+    _debug_print(f"      Parent Empty '{parent_empty.name}' transform: L={parent_empty.location}, R={parent_empty.rotation_euler}, S={parent_empty.scale}")
 
 
     # Assign parent_empty to a collection
@@ -1016,15 +1271,10 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
     target_collection_for_empty = default_collection # Default to the collection context from process_zw_structure
 
     if comp_coll_name: # If a specific collection is named for the ZW-COMPOSE root
-        target_collection_for_empty = get_or_create_collection(comp_coll_name, parent_collection=bpy.context.scene.collection)
+        target_collection_for_empty = get_or_create_collection(comp_coll_name, parent_collection=scene_collection)
 
-    # Link parent_empty to its target collection, ensure it's not in others (like default scene collection)
-    current_collections = [coll for coll in parent_empty.users_collection]
-    for coll in current_collections:
-        coll.objects.unlink(parent_empty)
-    if parent_empty.name not in target_collection_for_empty.objects: # Check to avoid duplicate link error
-        target_collection_for_empty.objects.link(parent_empty)
-    print(f"      Parent Empty '{parent_empty.name}' linked to collection '{target_collection_for_empty.name}'")
+    # parent_empty, the base model and attachments are all linked to target_collection_for_empty
+    # together once the assembly is built (see below)
 
 
     # Process BASE_MODEL
@@ -1038,36 +1288,46 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
             if original_base_obj.data:
                 base_model_obj.data = original_base_obj.data.copy()
             base_model_obj.name = f"{base_model_name}_base_of_{compose_name}"
-
-            # Link duplicated base_model_obj to the same collection as parent_empty
-            target_collection_for_empty.objects.link(base_model_obj)
+            composition_children.append(base_model_obj)
 
             base_model_obj.parent = parent_empty
             base_model_obj.location = (0,0,0) # Reset local transforms relative to parent_empty
             base_model_obj.rotation_euler = (0,0,0)
             base_model_obj.scale = (1,1,1)
-            print(f"      Added BASE_MODEL: '{base_model_name}' as '{base_model_obj.name}', parented to '{parent_empty.name}'")
+            _debug_print(f"      Added BASE_MODEL: '{base_model_name}' as '{base_model_obj.name}', parented to '{parent_empty.name}'")
         else:
-            print(f"      [Warning] BASE_MODEL object '{base_model_name}' not found in scene.")
+            _log.warning(f"      [Warning] BASE_MODEL object '{base_model_name}' not found in scene.")
 
     # Process ATTACHMENTS
     attachments_list = compose_data.get("ATTACHMENTS", [])
     if not isinstance(attachments_list, list): attachments_list = []
+    # Compositions often repeat one source (e.g. many bolts): look each source up once, and let
+    # attachments without a MATERIAL_OVERRIDE share a single copy of its data. Overridden ones
+    # keep their own copy, since apply_material writes to the data's material slots.
+    source_names = {a.get("OBJECT") for a in attachments_list if isinstance(a, dict)}
+    source_cache = {name: bpy.data.objects.get(name) for name in source_names if name}
+    data_cache = {}
 
     for i, attach_def in enumerate(attachments_list):
         if not isinstance(attach_def, dict):
-            print(f"        [Warning] Attachment item {i} is not a dictionary, skipping.")
+            _log.warning(f"        [Warning] Attachment item {i} is not a dictionary, skipping.")
             continue
 
         attach_obj_source_name = attach_def.get("OBJECT")
-        original_attach_obj = bpy.data.objects.get(attach_obj_source_name)
+        original_attach_obj = source_cache.get(attach_obj_source_name)
 
         if original_attach_obj:
             attached_obj = original_attach_obj.copy()
             if original_attach_obj.data:
-                attached_obj.data = original_attach_obj.data.copy()
+                if isinstance(attach_def.get("MATERIAL_OVERRIDE"), dict):
+                    attached_obj.data = original_attach_obj.data.copy()
+                else:
+                    shared_data = data_cache.get(attach_obj_source_name)
+                    if shared_data is None:
+                        shared_data = data_cache[attach_obj_source_name] = original_attach_obj.data.copy()
+                    attached_obj.data = shared_data
             attached_obj.name = f"{attach_obj_source_name}_attach{i}_to_{compose_name}"
-            target_collection_for_empty.objects.link(attached_obj) # Link to same collection as parent_empty
+            composition_children.append(attached_obj)
 
             attached_obj.parent = parent_empty # Parent to the main composition Empty
 
@@ -1076,31 +1336,43 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
             attach_rot_str = attach_def.get("ROTATION", "(0,0,0)")
             attach_scale_str = attach_def.get("SCALE", "(1,1,1)")
 
-            attached_obj.location = safe_eval(attach_loc_str, (0,0,0))
-            attach_rot_deg = safe_eval(attach_rot_str, (0,0,0))
-            attached_obj.rotation_euler = Euler([math.radians(a) for a in attach_rot_deg], 'XYZ')
-
-            attach_scale_eval = safe_eval(attach_scale_str, (1,1,1))
-            if isinstance(attach_scale_eval, (int, float)):
-                attached_obj.scale = (float(attach_scale_eval), float(attach_scale_eval), float(attach_scale_eval))
-            else:
-                attached_obj.scale = attach_scale_eval
-            print(f"        Added ATTACHMENT: '{attach_obj_source_name}' as '{attached_obj.name}', parented to '{parent_empty.name}'")
-            print(f"          Local Transform: L={attached_obj.location}, R={attached_obj.rotation_euler}, S={attached_obj.scale}")
+            attached_obj.location = _fast_tuple(attach_loc_str, _ZERO3)
+            attach_rot_deg = _fast_tuple(attach_rot_str, _ZERO3)
+            attached_obj.rotation_euler = Euler(_radians3(attach_rot_deg), 'XYZ')
+            attached_obj.scale = _fast_scale(attach_scale_str)
+            _debug_print(f"        Added ATTACHMENT: '{attach_obj_source_name}' as '{attached_obj.name}', parented to '{parent_empty.name}'")
+            _debug_print(f"          Local Transform: L={attached_obj.location}, R={attached_obj.rotation_euler}, S={attached_obj.scale}")
 
 
             # Handle MATERIAL_OVERRIDE for this attachment
             material_override_def = attach_def.get("MATERIAL_OVERRIDE")
             if isinstance(material_override_def, dict):
-                if ZW_MESH_UTILS_IMPORTED and APPLY_ZW_MESH_MATERIAL_FUNC:
-                    print(f"          Applying MATERIAL_OVERRIDE to '{attached_obj.name}'")
+                apply_material = _zw_mesh_func("apply_material")
+                override_key = json.dumps(material_override_def, sort_keys=True, default=str)
+                shared_mat = _OVERRIDE_MAT_CACHE.get(override_key)
+                if shared_mat is not None:
+                    # Same slot-0 assignment apply_material ends with, minus rebuilding the node setup
+                    mats = attached_obj.data.materials
+                    if mats: mats[0] = shared_mat
+                    else: mats.append(shared_mat)
+                    _debug_print(f"          Reusing MATERIAL_OVERRIDE material '{shared_mat.name}' for '{attached_obj.name}'")
+                elif apply_material:
+                    _debug_print(f"          Applying MATERIAL_OVERRIDE to '{attached_obj.name}'")
                     if 'NAME' not in material_override_def:
                         material_override_def['NAME'] = f"{attached_obj.name}_OverrideMat"
-                    APPLY_ZW_MESH_MATERIAL_FUNC(attached_obj, material_override_def)
+                    apply_material(attached_obj, material_override_def)
+                    if attached_obj.data.materials: _OVERRIDE_MAT_CACHE[override_key] = attached_obj.data.materials[0]
                 else:
-                    print(f"          [Warning] MATERIAL_OVERRIDE found for '{attached_obj.name}', but zw_mesh.apply_material function was not imported.")
+                    _log.warning(f"          [Warning] MATERIAL_OVERRIDE found for '{attached_obj.name}', but zw_mesh.apply_material function was not imported.")
         else:
-            print(f"        [Warning] ATTACHMENT source object '{attach_obj_source_name}' not found.")
+            _log.warning(f"        [Warning] ATTACHMENT source object '{attach_obj_source_name}' not found.")
+    # Everything above was built unlinked with plain property writes (no operators, nothing read
+    # back through bpy.context); link the assembly in one pass and sync the view layer once.
+    link_to_target = target_collection_for_empty.objects.link
+    link_to_target(parent_empty)
+    for child in composition_children: link_to_target(child)
+    view_layer.update()
+    _debug_print(f"      Linked '{parent_empty.name}' and {len(composition_children)} part(s) to collection '{target_collection_for_empty.name}'")
 
     # Process EXPORT for the entire assembly
     export_def = compose_data.get("EXPORT")
@@ -1108,7 +1380,7 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
         export_format = export_def.get("FORMAT", "").lower()
         export_file_str = export_def.get("FILE")
         if export_format == "glb" and export_file_str:
-            print(f"      Exporting composition '{compose_name}' to GLB: {export_file_str}")
+            _debug_print(f"      Exporting composition '{compose_name}' to GLB: {export_file_str}")
 
             export_path = Path(export_file_str)
             # Attempt to make path absolute relative to a project root if not already.
@@ -1120,21 +1392,23 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
             try:
                 export_path.parent.mkdir(parents=True, exist_ok=True)
             except Exception as e_mkdir_export:
-                print(f"        [Warning] Could not create directory for GLB export '{export_path.parent}': {e_mkdir_export}")
-
-            # Select parent_empty and all its children for export
-            bpy.ops.object.select_all(action='DESELECT')
-            parent_empty.select_set(True) # Select the parent empty
-            # Also select all children recursively
-            for child in parent_empty.children_recursive:
-                child.select_set(True)
-            bpy.context.view_layer.objects.active = parent_empty # Ensure parent is active for some export options
+                _log.warning(f"        [Warning] Could not create directory for GLB export '{export_path.parent}': {e_mkdir_export}")
+
+            # Export through a temporary collection holding just this assembly, made the active
+            # collection, instead of clearing and rebuilding the scene-wide selection.
+            export_coll = bpy.data.collections.new(f"__export_{compose_name}")
+            scene_collection.children.link(export_coll)
+            export_coll.objects.link(parent_empty)
+            for child in composition_children:
+                export_coll.objects.link(child)
+            prev_active_layer_coll = view_layer.active_layer_collection
+            view_layer.active_layer_collection = view_layer.layer_collection.children[export_coll.name]
 
             try:
                 bpy.ops.export_scene.gltf(
                     filepath=str(export_path), # Use str() for older Blender versions if Path object not fully supported by op
                     export_format='GLB',
-                    use_selection=True,
+                    use_active_collection=True,
                     export_apply=True,  # Apply modifiers
                     export_materials='EXPORT',
                     export_texcoords=True,
@@ -1142,12 +1416,15 @@ def handle_zw_compose_block(compose_data: dict, default_collection: bpy.types.Co
                     export_cameras=False, # Usually False for component exports
                     export_lights=False   # Usually False for component exports
                 )
-                print(f"        Successfully exported composition '{compose_name}' to '{export_path.resolve() if export_path.exists() else export_path}'") # Check if resolve() is safe if file creation failed
+                _debug_print(f"        Successfully exported composition '{compose_name}' to '{export_path.resolve() if export_path.exists() else export_path}'") # Check if resolve() is safe if file creation failed
             except RuntimeError as e_export:
-                print(f"        [Error] Failed to export composition '{compose_name}' to GLB: {e_export}")
+                _log.error(f"        [Error] Failed to export composition '{compose_name}' to GLB: {e_export}")
+            finally:
+                view_layer.active_layer_collection = prev_active_layer_coll
+                bpy.data.collections.remove(export_coll) # Objects stay linked to their real collection
         else:
-            print(f"      [Warning] EXPORT block for '{compose_name}' is missing format/file or format not 'glb'.")
-    print(f"    ✅ Finished ZW-COMPOSE assembly: {compose_name}")
+            _log.warning(f"      [Warning] EXPORT block for '{compose_name}' is missing format/file or format not 'glb'.")
+    _debug_print(f"    ✅ Finished ZW-COMPOSE assembly: {compose_name}")
 
 
 if __name__ == "__main__":
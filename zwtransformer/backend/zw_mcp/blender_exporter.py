@@ -1,8 +1,10 @@
 # zw_mcp/blender_exporter.py
 import sys
+import functools
 import json # For potential pretty printing if needed, not directly for to_zw
 from pathlib import Path
 import argparse
+import numpy as np
 
 try:
     import bpy
@@ -36,11 +38,20 @@ except ImportError:
             return error_message.strip()
         # sys.exit(1) # Or exit if to_zw is critical
 
+ZW_EXPORT_HEADER = "# Exported from Blender by ZW Exporter v0.1"
+
+@functools.lru_cache(maxsize=8)
+def _vec3_format(precision: int) -> str:
+    """%-format template for a ZW vector at the given precision, e.g. "(%.3f, %.3f, %.3f)"."""
+    return "(%.{0}f, %.{0}f, %.{0}f)".format(precision)
+
+_VEC3_FMT = _vec3_format(3)
+
 def format_vector_to_zw(vector, precision=3) -> str:
     if vector is None:
         return ""
     try:
-        return f"({vector[0]:.{precision}f}, {vector[1]:.{precision}f}, {vector[2]:.{precision}f})"
+        return (_VEC3_FMT if precision == 3 else _vec3_format(precision)) % (vector[0], vector[1], vector[2])
     except Exception: # Catch potential issues if vector is not as expected
         return ""
 
@@ -53,6 +64,22 @@ def format_color_to_zw_hex(rgba_color) -> str:
     except Exception:
         return ""
 
+# Material name -> exported COLOR string ("" if none) for the current export; materials are
+# shared by many objects, so each node tree is inspected once per export
+_MATERIAL_COLOR_CACHE = {}
+
+def material_color_to_zw_hex(mat) -> str:
+    """Base Color of a material's Principled BSDF as a ZW hex string, or "" if it has none."""
+    if mat.use_nodes and mat.node_tree:
+        principled_bsdf = mat.node_tree.nodes.get("Principled BSDF")
+        if principled_bsdf:
+            base_color_input = principled_bsdf.inputs.get("Base Color")
+            if base_color_input:
+                return format_color_to_zw_hex(base_color_input.default_value)
+            # Could add more BSDF properties here if needed
+            # e.g. METALLIC: principled_bsdf.inputs.get("Metallic").default_value
+    return ""
+
 def get_object_zw_type(blender_obj) -> str:
     if not blender_obj:
         return "Mesh" # Default
@@ -65,15 +92,98 @@ def get_object_zw_type(blender_obj) -> str:
 
     # If no custom property, try to infer from mesh data name (common primitives)
     if blender_obj.data and hasattr(blender_obj.data, 'name'):
-        data_name_lower = blender_obj.data.name.lower()
-        # Check for common primitive names (case-insensitive prefix)
-        primitives = ["cube", "sphere", "plane", "cone", "cylinder", "torus"]
-        for p_type in primitives:
-            if data_name_lower.startswith(p_type):
-                return p_type.capitalize() # Return in capitalized form
+        return zw_type_for_data_name(blender_obj.data.name)
 
     return "Mesh" # Generic fallback if no specific type is found
 
+PRIMITIVE_PREFIXES = ("cube", "sphere", "plane", "cone", "cylinder", "torus")
+
+@functools.lru_cache(maxsize=1024)
+def zw_type_for_data_name(data_name: str) -> str:
+    """
+    ZW TYPE inferred from a mesh data-block name by common primitive prefix (case-insensitive),
+    e.g. "Cube.001" -> "Cube"; "Mesh" if none matches. Cached per name, so linked duplicates
+    sharing one mesh are classified once.
+    """
+    data_name_lower = data_name.lower()
+    p_type = next((p for p in PRIMITIVE_PREFIXES if data_name_lower.startswith(p)), None)
+    return p_type.capitalize() if p_type else "Mesh"
+
+def read_object_transforms(objects):
+    """
+    Location, scale and Euler rotation (radians) of each object, as three lists of [x, y, z].
+    Read for the whole scene with one foreach_get per property instead of three Python
+    attribute reads per object, then picked out for the requested objects.
+    """
+    scene_objects = bpy.context.scene.objects
+    count = len(scene_objects)
+    index_of = {obj: i for i, obj in enumerate(scene_objects)} # bpy structs hash by pointer
+    rows = [index_of[obj] for obj in objects]
+    transforms = []
+    for prop in ("location", "scale", "rotation_euler"):
+        buf = np.empty(count * 3, dtype=np.float32)
+        scene_objects.foreach_get(prop, buf)
+        transforms.append(buf.reshape(count, 3)[rows].tolist())
+    return transforms
+
+# Attributes exported after the per-object ones, in this order; see object_to_zw_block
+ZW_STATIC_ATTRIBUTES = ("MATERIAL", "COLOR", "PARENT", "COLLECTION")
+
+@functools.lru_cache(maxsize=1024)
+def static_zw_lines(static_items: tuple) -> str:
+    """to_zw text (at ZW-OBJECT body indent) of a tuple of (key, value) attribute pairs."""
+    return to_zw(dict(static_items), 2)
+
+def object_to_zw_block(obj, location, scale, rotation) -> str:
+    """ZW-OBJECT block text for one exported mesh object (transforms as read by read_object_transforms)."""
+    attributes_dict = {}
+    attributes_dict["TYPE"] = get_object_zw_type(obj)
+    attributes_dict["NAME"] = obj.name
+
+    loc_str = format_vector_to_zw(location)
+    if loc_str: attributes_dict["LOCATION"] = loc_str
+
+    scale_str = format_vector_to_zw(scale)
+    if scale_str: attributes_dict["SCALE"] = scale_str
+
+    rot_str = format_vector_to_zw(rotation) # Radians
+    if rot_str: attributes_dict["ROTATION_EULER_XYZ_RADIANS"] = rot_str # Clarify unit
+
+    if obj.data.materials and obj.data.materials[0]:
+        mat = obj.data.materials[0]
+        attributes_dict["MATERIAL"] = mat.name
+        color_hex = _MATERIAL_COLOR_CACHE.get(mat.name)
+        if color_hex is None:
+            color_hex = _MATERIAL_COLOR_CACHE[mat.name] = material_color_to_zw_hex(mat)
+        if color_hex: attributes_dict["COLOR"] = color_hex
+
+    if obj.parent:
+        attributes_dict["PARENT"] = obj.parent.name
+
+    if obj.users_collection and obj.users_collection[0]:
+        # Only export collection if it's not the scene's master collection
+        # (or handle this logic based on how collections are typically used)
+        # For now, let's just export the first collection's name.
+        # More sophisticated logic might be needed for multi-collection objects
+        # or to decide which collection is "primary".
+        # Also, ensure it's not the default "Scene Collection" if that's not desired.
+        # For simplicity:
+        attributes_dict["COLLECTION"] = obj.users_collection[0].name
+
+    # Same text as to_zw({"ZW-OBJECT": attributes_dict}), built in two parts: TYPE/NAME/transforms
+    # differ per object, while the trailing lines are usually shared by linked duplicates and
+    # come from a cache.
+    static_items = tuple((key, attributes_dict[key]) for key in ZW_STATIC_ATTRIBUTES if key in attributes_dict)
+    per_object_attributes = {key: value for key, value in attributes_dict.items() if key not in ZW_STATIC_ATTRIBUTES}
+
+    try:
+        zw_block_str = "ZW-OBJECT:\n" + to_zw(per_object_attributes, 2)
+        if static_items: zw_block_str += "\n" + static_zw_lines(static_items)
+        return zw_block_str
+    except Exception as e_to_zw:
+        print(f"[!] Error converting object '{obj.name}' to ZW: {e_to_zw}")
+        return f"# ERROR: Could not convert object {obj.name} to ZW.\n# Attributes: {attributes_dict}"
+
 def export_scene_to_zw(output_filepath_str: str, export_all_meshes: bool = False):
     if not bpy:
         print("[X] Blender (bpy) not available. Cannot export scene.")
@@ -81,8 +191,7 @@ def export_scene_to_zw(output_filepath_str: str, export_all_meshes: bool = False
 
     output_filepath = Path(output_filepath_str)
     output_filepath.parent.mkdir(parents=True, exist_ok=True)
-
-    zw_blocks = ["# Exported from Blender by ZW Exporter v0.1"]
+    _MATERIAL_COLOR_CACHE.clear() # Materials may have been edited since the last export
 
     objects_to_export = []
     if not export_all_meshes and bpy.context.selected_objects:
@@ -99,69 +208,26 @@ def export_scene_to_zw(output_filepath_str: str, export_all_meshes: bool = False
 
     if not objects_to_export:
         print("[!] No mesh objects found to export.")
-        zw_blocks.append("# No mesh objects found in the scene to export.")
     else:
         print(f"[*] Found {len(objects_to_export)} mesh objects to export.")
 
-    for obj in objects_to_export:
-        attributes_dict = {}
-        attributes_dict["TYPE"] = get_object_zw_type(obj)
-        attributes_dict["NAME"] = obj.name
-
-        loc_str = format_vector_to_zw(obj.location)
-        if loc_str: attributes_dict["LOCATION"] = loc_str
-
-        scale_str = format_vector_to_zw(obj.scale)
-        if scale_str: attributes_dict["SCALE"] = scale_str
-
-        rot_str = format_vector_to_zw(obj.rotation_euler) # Radians
-        if rot_str: attributes_dict["ROTATION_EULER_XYZ_RADIANS"] = rot_str # Clarify unit
-
-        if obj.data.materials and obj.data.materials[0]:
-            mat = obj.data.materials[0]
-            attributes_dict["MATERIAL"] = mat.name
-            if mat.use_nodes and mat.node_tree:
-                principled_bsdf = mat.node_tree.nodes.get("Principled BSDF")
-                if principled_bsdf:
-                    base_color_input = principled_bsdf.inputs.get("Base Color")
-                    if base_color_input:
-                        color_hex = format_color_to_zw_hex(base_color_input.default_value)
-                        if color_hex: attributes_dict["COLOR"] = color_hex
-                    # Could add more BSDF properties here if needed
-                    # e.g. METALLIC: principled_bsdf.inputs.get("Metallic").default_value
-
-        if obj.parent:
-            attributes_dict["PARENT"] = obj.parent.name
-
-        if obj.users_collection and obj.users_collection[0]:
-            # Only export collection if it's not the scene's master collection
-            # (or handle this logic based on how collections are typically used)
-            # For now, let's just export the first collection's name.
-            # More sophisticated logic might be needed for multi-collection objects
-            # or to decide which collection is "primary".
-            # Also, ensure it's not the default "Scene Collection" if that's not desired.
-            # For simplicity:
-            attributes_dict["COLLECTION"] = obj.users_collection[0].name
-
-        zw_object_data_for_to_zw = {"ZW-OBJECT": attributes_dict}
-
-        try:
-            zw_block_str = to_zw(zw_object_data_for_to_zw)
-            zw_blocks.append(zw_block_str)
-        except Exception as e_to_zw:
-            print(f"[!] Error converting object '{obj.name}' to ZW: {e_to_zw}")
-            zw_blocks.append(f"# ERROR: Could not convert object {obj.name} to ZW.\n# Attributes: {attributes_dict}")
-
-    final_zw_string = "\n///\n".join(zw_blocks)
-    if not final_zw_string.endswith("///") and zw_blocks: # Add trailing /// if content exists
-        if len(zw_blocks) > 1 or (len(zw_blocks) == 1 and zw_blocks[0].strip() != "# Exported from Blender by ZW Exporter v0.1"):
-             final_zw_string += "\n///"
-    elif not zw_blocks: # If only the initial comment was there
-        final_zw_string = "# No content exported."
+    # Group linked duplicates (objects sharing a mesh) next to each other, by mesh then object name,
+    # so the output order is stable between runs and shared attribute lines hit the cache in runs.
+    objects_to_export.sort(key=lambda o: (o.data.name, o.name))
+
+    locations, scales, rotations = read_object_transforms(objects_to_export) if objects_to_export else ([], [], [])
 
+    # Blocks are streamed to the file as they are converted rather than collected and joined,
+    # so only one object's text is held in memory at a time.
     try:
         with open(output_filepath, "w", encoding="utf-8") as f:
-            f.write(final_zw_string)
+            f.write(ZW_EXPORT_HEADER)
+            if not objects_to_export:
+                f.write("\n///\n# No mesh objects found in the scene to export.")
+            for obj, location, scale, rotation in zip(objects_to_export, locations, scales, rotations):
+                f.write("\n///\n")
+                f.write(object_to_zw_block(obj, location, scale, rotation))
+            f.write("\n///")
         print(f"[*] Successfully exported ZW data to: {output_filepath.resolve()}")
     except Exception as e:
         print(f"[X] Error writing ZW output to file '{output_filepath}': {e}")
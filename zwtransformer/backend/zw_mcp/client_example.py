@@ -1,5 +1,5 @@
 # zw_mcp/client_example.py
-import socket
+import asyncio
 import sys
 from pathlib import Path
 
@@ -8,6 +8,33 @@ BUFFER_SIZE = 4096
 DEFAULT_PORT = 7421
 DEFAULT_HOST = "127.0.0.1"
 
+async def _exchange_prompt(host: str, port: int, zw_file_path: str, prompt_bytes: bytes) -> bytearray:
+    """
+    Sends the prompt and collects the raw response bytes. The transport flushes the prompt
+    in the background while we read, so a server that starts answering before a large
+    prompt is fully sent isn't left waiting on a client stuck in sendall().
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        print(f"[*] Connected. Sending prompt from '{zw_file_path}'...")
+        writer.write(prompt_bytes)
+        writer.write_eof() # Signal that sending is done (sent once the buffer is flushed)
+
+        # Raw bytes, decoded once at the end: a multi-byte UTF-8 character may be split across chunks
+        response_buf = bytearray()
+        while True:
+            try:
+                chunk = await reader.read(BUFFER_SIZE)
+                if not chunk:
+                    break
+                response_buf.extend(chunk)
+            except Exception as e:
+                print(f"[!] Error receiving response chunk: {e}")
+                break
+        return response_buf
+    finally:
+        writer.close()
+
 def send_prompt(host: str, port: int, zw_file_path: str):
     try:
         with open(zw_file_path, "r", encoding="utf-8") as f:
@@ -28,38 +55,19 @@ def send_prompt(host: str, port: int, zw_file_path: str):
 
     print(f"[*] Connecting to ZW MCP Daemon at {host}:{port}...")
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((host, port))
-            print(f"[*] Connected. Sending prompt from '{zw_file_path}'...")
-            s.sendall(prompt.encode("utf-8"))
-            s.shutdown(socket.SHUT_WR) # Signal that sending is done
-
-            response_parts = []
-            while True:
-                try:
-                    chunk = s.recv(BUFFER_SIZE)
-                    if not chunk:
-                        break
-                    response_parts.append(chunk.decode("utf-8"))
-                except socket.timeout:
-                    print("[!] Socket timeout waiting for response.")
-                    break
-                except Exception as e:
-                    print(f"[!] Error receiving response chunk: {e}")
-                    break
-
-            if not response_parts:
-                print("[!] No response received from server.")
-                return
+        response_buf = asyncio.run(_exchange_prompt(host, port, zw_file_path, prompt.encode("utf-8")))
+        if not response_buf:
+            print("[!] No response received from server.")
+            return
 
-    except socket.error as e:
+    except OSError as e:
         print(f"[!] Socket error: {e}")
         return
     except Exception as e:
         print(f"[!] An unexpected error occurred: {e}")
         return
 
-    full_response = "".join(response_parts)
+    full_response = response_buf.decode("utf-8", errors="replace")
     print("\n🧠 ZW MCP Response:\n")
     print(full_response)
 
@@ -1,10 +1,97 @@
 # backend/zw_mcp/engine_router.py
+import asyncio
+import copy
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
-from .base_adapter import BaseEngineAdapter
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Any, Mapping, Optional, Tuple
+from .base_adapter import EngineAdapterProtocol, canonical_block_type
 
 logger = logging.getLogger(__name__)
 
+# Most routing results kept by the opt-in result cache
+RESULT_CACHE_SIZE = 256
+
+# Worker threads per engine for adapters that do not set MAX_CONCURRENCY
+MAX_DISPATCH_WORKERS = 8
+
+# Most distinct top-level packet keys remembered per rules snapshot
+MAX_KEY_ROUTES = 4096
+
+# (routing rules, block index, key routes). The first two map lowercase capability ->
+# engine names and are published as read-only proxies; key routes memoizes raw packet
+# key -> engines for that snapshot only.
+RulesSnapshot = Tuple[Mapping[str, Tuple[str, ...]], Mapping[str, Tuple[str, ...]],
+                      Dict[str, Tuple[str, ...]]]
+
+
+class CacheStats:
+    """Hit/miss counters for the router's result cache."""
+    
+    __slots__ = ('hits', 'misses', '_lock')
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+
+def _empty_rules_snapshot() -> RulesSnapshot:
+    return MappingProxyType({}), MappingProxyType({}), {}
+
+
+def _rules_with_adapter(snapshot: RulesSnapshot, adapter: EngineAdapterProtocol) -> RulesSnapshot:
+    """Return a new rules snapshot that also routes to adapter; snapshot is left untouched."""
+    rules, block_index = dict(snapshot[0]), dict(snapshot[1])
+    engine_name = adapter.name.lower()
+    for capability in adapter.get_capabilities():
+        cap_lower = capability.lower()
+        engines = block_index.get(cap_lower, ())
+        if engine_name not in engines:
+            block_index[cap_lower] = engines + (engine_name,)
+        names = rules.get(cap_lower, ())
+        if adapter.name not in names:
+            rules[cap_lower] = names + (adapter.name,)
+    return MappingProxyType(rules), MappingProxyType(block_index), {}
+
+
+def _engines_for_normalized(block_index: Mapping[str, Tuple[str, ...]],
+                            adapters: Mapping[str, EngineAdapterProtocol],
+                            block_type: str) -> Tuple[str, ...]:
+    """
+    Engines for a lowercase block type. Plain types are a single index
+    probe. Dotted types (e.g., "mesh.skinned.cloth") go through each
+    adapter's own can_process_normalized, so hierarchical matching is
+    decided by the adapter's capability trie and never disagrees with it.
+    """
+    if '.' not in block_type:
+        return block_index.get(block_type, ())
+    return tuple(
+        name for name, adapter in list(adapters.items())
+        if adapter.can_process_normalized(block_type)
+    )
+
 
 class EngineRouter:
     """
@@ -12,18 +99,59 @@ class EngineRouter:
     Routes ZW data to appropriate engines based on content and capabilities.
     """
     
-    def __init__(self):
-        self.adapters: Dict[str, BaseEngineAdapter] = {}
+    def __init__(self, max_dispatch_workers: int = MAX_DISPATCH_WORKERS,
+                 result_cache_ttl: Optional[float] = None,
+                 dispatch_timeout: Optional[float] = None,
+                 result_cache_size: int = RESULT_CACHE_SIZE):
+        """
+        Args:
+            max_dispatch_workers: Worker threads per engine, for adapters that
+                do not declare MAX_CONCURRENCY
+            result_cache_ttl: Seconds to reuse the result of an identical packet
+                routed to the same engines; None (default) disables the cache
+            dispatch_timeout: Seconds to wait for all engines of one packet;
+                None (default) waits indefinitely
+            result_cache_size: Most results the result cache holds; the least
+                recently used entry is evicted first
+        """
+        self.adapters: Dict[str, EngineAdapterProtocol] = {}
         self.default_engine: Optional[str] = None
-        self.routing_rules: Dict[str, List[str]] = {}  # ZW block type -> engine names
+        # Routing rules (capability -> adapter names) and the block index (capability ->
+        # lowercase engine names, in registration order). Writers build a new pair under
+        # _write_lock and swap it in whole; readers take one reference and need no lock.
+        self._rules_snapshot: RulesSnapshot = _empty_rules_snapshot()
+        # Lowercase names of registered engines, swapped the same way as the rules
+        self._adapter_names_lower: FrozenSet[str] = frozenset()
+        self._write_lock = threading.Lock()
+        # One job queue and worker pool per engine, so a packet costs the max rather than the
+        # sum of its engine latencies and a backlog on one engine (e.g. Blender jobs) never
+        # delays packets bound for another
+        self.max_dispatch_workers = max_dispatch_workers
+        self.dispatch_timeout = dispatch_timeout
+        self._engine_executors: Dict[str, ThreadPoolExecutor] = {}
+        # LRU of (packet digest, engines) -> (result, expires_at); only successful results
+        # are kept, and callers always get their own deep copy
+        self.result_cache_ttl = result_cache_ttl
+        self.result_cache_size = result_cache_size
+        self._result_cache: "OrderedDict[Tuple[bytes, Tuple[str, ...]], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = CacheStats()
+    
+    @property
+    def routing_rules(self) -> Mapping[str, Tuple[str, ...]]:
+        """ZW block type -> engine names (read-only snapshot)."""
+        return self._rules_snapshot[0]
         
-    def register_adapter(self, adapter: BaseEngineAdapter, is_default: bool = False) -> bool:
+    def register_adapter(self, adapter: EngineAdapterProtocol, is_default: bool = False,
+                         lazy: bool = False) -> bool:
         """
         Register an engine adapter with the router.
         
         Args:
             adapter: Engine adapter instance
             is_default: Whether this should be the default engine
+            lazy: Defer adapter initialization until it is first routed to
+                (or until initialize_adapters_async runs)
             
         Returns:
             True if registration successful
@@ -32,26 +160,52 @@ class EngineRouter:
             engine_name = adapter.name.lower()
             
             # Initialize the adapter
-            if not adapter.initialize():
+            if not lazy and not adapter.ensure_initialized():
                 logger.error(f"Failed to initialize adapter: {engine_name}")
                 return False
             
-            self.adapters[engine_name] = adapter
-            
-            # Set as default if requested or if no default exists
-            if is_default or self.default_engine is None:
-                self.default_engine = engine_name
-            
-            # Update routing rules based on adapter capabilities
-            self._update_routing_rules(adapter)
+            with self._write_lock:
+                self.adapters[engine_name] = adapter
+                self._adapter_names_lower = frozenset(self.adapters)
+                previous = self._engine_executors.get(engine_name)
+                self._engine_executors[engine_name] = self._new_engine_executor(engine_name, adapter)
+                if previous is not None:
+                    previous.shutdown(wait=False)
+                
+                # Set as default if requested or if no default exists
+                if is_default or self.default_engine is None:
+                    self.default_engine = engine_name
+                
+                # Update routing rules based on adapter capabilities
+                self._update_routing_rules(adapter)
             
-            logger.info(f"Registered engine adapter: {engine_name} (capabilities: {adapter.get_capabilities()})")
+            logger.info("Registered engine adapter: %s (capabilities: %s)", engine_name, adapter.get_capabilities())
             return True
             
         except Exception as e:
             logger.error(f"Error registering adapter {adapter.name}: {e}")
             return False
     
+    async def initialize_adapters_async(self) -> Dict[str, bool]:
+        """
+        Initialize all registered adapters concurrently.
+        
+        Returns:
+            Dictionary mapping engine names to initialization success
+        """
+        names = list(self.adapters)
+        outcomes = await asyncio.gather(
+            *(self.adapters[name].initialize_async() for name in names),
+            return_exceptions=True
+        )
+        results = {}
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error initializing adapter {name}: {outcome}")
+                outcome = False
+            results[name] = bool(outcome)
+        return results
+    
     def unregister_adapter(self, engine_name: str) -> bool:
         """
         Unregister an engine adapter.
@@ -71,14 +225,20 @@ class EngineRouter:
         try:
             adapter = self.adapters[engine_name]
             adapter.shutdown()
-            del self.adapters[engine_name]
-            
-            # Update default if needed
-            if self.default_engine == engine_name:
-                self.default_engine = next(iter(self.adapters.keys())) if self.adapters else None
-            
-            # Rebuild routing rules
-            self._rebuild_routing_rules()
+            with self._write_lock:
+                del self.adapters[engine_name]
+                self._adapter_names_lower = frozenset(self.adapters)
+                executor = self._engine_executors.pop(engine_name, None)
+                if executor is not None:
+                    executor.shutdown(wait=False)
+                
+                # Update default if needed
+                if self.default_engine == engine_name:
+                    self.default_engine = next(iter(self.adapters.keys())) if self.adapters else None
+                
+                # Rebuild routing rules
+                self._rebuild_routing_rules()
+            self.invalidate_prefix(engine_name)
             
             logger.info(f"Unregistered engine adapter: {engine_name}")
             return True
@@ -96,58 +256,115 @@ class EngineRouter:
             zw_data: Raw ZW string
             parsed_zw: Parsed ZW dictionary
             target_engines: Specific engines to use (optional)
-            **kwargs: Additional parameters for engines
+            **kwargs: Additional parameters for engines, forwarded as the
+                adapters' ``options`` dict
             
         Returns:
             Dictionary with routing results from all engines
         """
         if not self.adapters:
-            return {
-                "status": "error",
-                "message": "No engine adapters registered",
-                "results": {},
-                "engines_used": [],
-                "successful_engines": 0,
-                "total_engines": 0
-            }
+            return self._routing_error("No engine adapters registered")
         
         # Determine which engines to use
         engines_to_use = self._determine_target_engines(parsed_zw, target_engines)
         
         if not engines_to_use:
-            return {
-                "status": "error", 
-                "message": "No suitable engines found for the provided ZW data",
-                "results": {},
-                "engines_used": [],
-                "successful_engines": 0,
-                "total_engines": 0
-            }
+            return self._routing_error("No suitable engines found for the provided ZW data")
         
-        # Route to each selected engine
-        results = {}
-        successful_count = 0
+        cache_key = None
+        if self.result_cache_ttl is not None:
+            cache_key = self._result_cache_key(zw_data, engines_to_use, kwargs)
+            cached = self._cache_get(cache_key)
+            self.cache_stats.record(cached is not None)
+            if cached is not None:
+                return cached
         
-        for engine_name in engines_to_use:
-            try:
-                adapter = self.adapters[engine_name]
-                logger.info(f"Routing ZW data to engine: {engine_name}")
-                
-                # Process with the specific engine
-                result = adapter.process_zw_data(zw_data, parsed_zw, **kwargs)
-                results[engine_name] = result
-                
-                # Count successes
-                if result.get("status") == "success":
-                    successful_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error processing ZW data with engine {engine_name}: {e}")
-                results[engine_name] = {
-                    "status": "error",
-                    "message": f"Exception during processing: {str(e)}",
-                    "results": []
-                }
+        # Queue the packet on each selected engine; engines run concurrently.
+        # Inline engines run last, on this thread, once the others are queued
+        options = kwargs or None
+        futures = {
+            engine_name: self._submit_to_engine(engine_name, zw_data, parsed_zw, options)
+            for engine_name in sorted(engines_to_use, key=self._runs_inline)
+        }
+        wait(futures.values(), timeout=self.dispatch_timeout)
+        engine_results = [self._engine_result(futures[engine_name]) for engine_name in engines_to_use]
+        
+        return self._combine_engine_results(engines_to_use, engine_results, cache_key)
+    
+    def route_zw_packets(self, packets: List[Tuple[str, Dict[str, Any]]],
+                         target_engines: Optional[List[str]] = None, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Route several ZW packets at once. The packets bound for one engine are
+        handed to it together, so adapters with a process_zw_batch method
+        can serve them in a single invocation.
+        
+        Args:
+            packets: (raw ZW string, parsed ZW dictionary) pairs
+            target_engines: Specific engines to use for every packet (optional)
+            **kwargs: Additional parameters for engines, forwarded as the
+                adapters' ``options`` dict
+            
+        Returns:
+            One routing result per packet, in order, shaped like route_zw_packet's
+        """
+        if not self.adapters:
+            return [self._routing_error("No engine adapters registered") for _ in packets]
+        
+        routed: List[Optional[Dict[str, Any]]] = [None] * len(packets)
+        pending = []  # (packet index, engines, cache key)
+        indices_by_engine: Dict[str, List[int]] = {}
+        for index, (zw_data, parsed_zw) in enumerate(packets):
+            engines_to_use = self._determine_target_engines(parsed_zw, target_engines)
+            if not engines_to_use:
+                routed[index] = self._routing_error("No suitable engines found for the provided ZW data")
+                continue
+            cache_key = None
+            if self.result_cache_ttl is not None:
+                cache_key = self._result_cache_key(zw_data, engines_to_use, kwargs)
+                cached = self._cache_get(cache_key)
+                self.cache_stats.record(cached is not None)
+                if cached is not None:
+                    routed[index] = cached
+                    continue
+            pending.append((index, engines_to_use, cache_key))
+            for engine_name in engines_to_use:
+                indices_by_engine.setdefault(engine_name, []).append(index)
+        
+        # One job per engine carrying all of its packets; engines run concurrently,
+        # inline engines last
+        options = kwargs or None
+        futures = {
+            engine_name: self._submit_batch_to_engine(
+                engine_name, [packets[index] for index in indices_by_engine[engine_name]], options)
+            for engine_name in sorted(indices_by_engine, key=self._runs_inline)
+        }
+        wait(futures.values(), timeout=self.dispatch_timeout)
+        results_by_engine = {
+            engine_name: dict(zip(indices, self._engine_batch_result(futures[engine_name], len(indices))))
+            for engine_name, indices in indices_by_engine.items()
+        }
+        
+        for index, engines_to_use, cache_key in pending:
+            engine_results = [results_by_engine[engine_name][index] for engine_name in engines_to_use]
+            routed[index] = self._combine_engine_results(engines_to_use, engine_results, cache_key)
+        return routed
+    
+    @staticmethod
+    def _routing_error(message: str) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "message": message,
+            "results": {},
+            "engines_used": [],
+            "successful_engines": 0,
+            "total_engines": 0
+        }
+    
+    def _combine_engine_results(self, engines_to_use: List[str], engine_results: List[Dict[str, Any]],
+                                cache_key: Optional[Tuple[bytes, Tuple[str, ...]]]) -> Dict[str, Any]:
+        """Merge per-engine results into one routing result, caching it if successful."""
+        results = dict(zip(engines_to_use, engine_results))
+        successful_count = sum(1 for result in engine_results if result.get("status") == "success")
         
         # Determine overall status
         total_engines = len(engines_to_use)
@@ -158,7 +375,7 @@ class EngineRouter:
         else:
             overall_status = "error"
         
-        return {
+        routed = {
             "status": overall_status,
             "message": f"Processed by {successful_count}/{total_engines} engines successfully",
             "results": results,
@@ -166,6 +383,218 @@ class EngineRouter:
             "successful_engines": successful_count,
             "total_engines": total_engines
         }
+        if cache_key is not None and overall_status == "success":
+            self._cache_put(cache_key, routed)
+        return routed
+    
+    @staticmethod
+    def _result_cache_key(zw_data: str, engines: List[str],
+                          options: Dict[str, Any]) -> Tuple[bytes, Tuple[str, ...]]:
+        digest = hashlib.blake2b(zw_data.encode("utf-8"), digest_size=16)
+        if options:
+            # Engine options change the output, so they are part of the packet identity
+            digest.update(repr(sorted(options.items())).encode("utf-8"))
+        return digest.digest(), tuple(sorted(engines))
+    
+    def _cache_get(self, key: Tuple[bytes, Tuple[str, ...]]) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._result_cache.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._result_cache[key]
+                return None
+            self._result_cache.move_to_end(key)
+        return copy.deepcopy(result)
+    
+    def _cache_put(self, key: Tuple[bytes, Tuple[str, ...]], result: Dict[str, Any]):
+        # Stored as a private copy so the caller may modify the result it was handed
+        result = copy.deepcopy(result)
+        now = time.monotonic()
+        with self._cache_lock:
+            cache = self._result_cache
+            # Expired entries go on every insert, so unread keys cannot pile up
+            for stale_key in [k for k, (_, expires_at) in cache.items() if expires_at <= now]:
+                del cache[stale_key]
+            cache[key] = (result, now + self.result_cache_ttl)
+            cache.move_to_end(key)
+            while len(cache) > self.result_cache_size:
+                cache.popitem(last=False)
+    
+    def invalidate(self, key: Optional[Tuple[bytes, Tuple[str, ...]]] = None) -> int:
+        """
+        Drop one cached result, or the whole result cache when no key is given.
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._cache_lock:
+            if key is None:
+                removed = len(self._result_cache)
+                self._result_cache.clear()
+                return removed
+            return 1 if self._result_cache.pop(key, None) is not None else 0
+    
+    def invalidate_prefix(self, engine_name: str) -> int:
+        """
+        Drop every cached result that involved the given engine.
+        
+        Returns:
+            Number of entries removed
+        """
+        engine_name = engine_name.lower()
+        with self._cache_lock:
+            stale = [key for key in self._result_cache if engine_name in key[1]]
+            for key in stale:
+                del self._result_cache[key]
+        return len(stale)
+    
+    def _new_engine_executor(self, engine_name: str, adapter: EngineAdapterProtocol) -> ThreadPoolExecutor:
+        workers = getattr(adapter, "MAX_CONCURRENCY", None) or self.max_dispatch_workers
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"zw-{engine_name}")
+    
+    def _runs_inline(self, engine_name: str) -> bool:
+        """True if the engine must run on the routing thread rather than its workers."""
+        return bool(getattr(self.adapters.get(engine_name), "runs_inline", False))
+    
+    @staticmethod
+    def _completed(result: Any) -> Future:
+        future: Future = Future()
+        future.set_result(result)
+        return future
+    
+    def _submit_to_engine(self, engine_name: str, zw_data: str, parsed_zw: Dict[str, Any],
+                          options: Optional[Dict[str, Any]]) -> Future:
+        """
+        Queue one packet on an engine's own workers, or run it right away on
+        this thread for an inline engine (dispatch_timeout does not apply).
+        """
+        if self._runs_inline(engine_name):
+            return self._completed(self._process_with_engine(engine_name, zw_data, parsed_zw, options))
+        try:
+            return self._engine_executors[engine_name].submit(
+                self._process_with_engine, engine_name, zw_data, parsed_zw, options)
+        except (KeyError, RuntimeError):
+            # Unregistered while this packet was being routed
+            return self._completed({
+                "status": "error",
+                "message": f"Engine {engine_name} is no longer registered",
+                "results": []
+            })
+    
+    def _submit_batch_to_engine(self, engine_name: str, batch: List[Tuple[str, Dict[str, Any]]],
+                                options: Optional[Dict[str, Any]]) -> Future:
+        """Queue several packets on an engine's own workers as one job (inline engines run now)."""
+        if self._runs_inline(engine_name):
+            return self._completed(self._process_batch_with_engine(engine_name, batch, options))
+        try:
+            return self._engine_executors[engine_name].submit(
+                self._process_batch_with_engine, engine_name, batch, options)
+        except (KeyError, RuntimeError):
+            # Unregistered while these packets were being routed
+            return self._completed([{
+                "status": "error",
+                "message": f"Engine {engine_name} is no longer registered",
+                "results": []
+            } for _ in batch])
+    
+    def _engine_batch_result(self, future: Future, size: int) -> List[Dict[str, Any]]:
+        """
+        One result per packet of a batch job: timeout errors if it has not
+        finished, per-packet errors if the engine answered the wrong number
+        of packets.
+        """
+        if not future.done():
+            future.cancel()
+            return [self._timeout_error() for _ in range(size)]
+        results = future.result()
+        if not isinstance(results, list) or len(results) != size:
+            count = len(results) if isinstance(results, list) else type(results).__name__
+            logger.error("Engine batch returned %s results for %d packets", count, size)
+            return [{
+                "status": "error",
+                "message": f"Engine returned {count} results for a batch of {size} packets",
+                "results": []
+            } for _ in range(size)]
+        return results
+    
+    def _engine_result(self, future: Future) -> Dict[str, Any]:
+        if future.done():
+            return future.result()
+        future.cancel()
+        return self._timeout_error()
+    
+    def _timeout_error(self) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "message": f"Engine did not finish within {self.dispatch_timeout} seconds",
+            "results": []
+        }
+    
+    def _process_with_engine(self, engine_name: str, zw_data: str, parsed_zw: Dict[str, Any],
+                             options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Run one engine on a packet. Never raises: failures come back as that
+        engine's error result, so one engine cannot fail the whole dispatch.
+        
+        Returns:
+            The engine's result dictionary
+        """
+        try:
+            adapter = self.adapters[engine_name]
+            if not adapter.ensure_initialized():
+                return {
+                    "status": "error",
+                    "message": f"Engine {engine_name} failed to initialize",
+                    "results": []
+                }
+            
+            logger.info("Routing ZW data to engine: %s", engine_name)
+            
+            # Process with the specific engine
+            return adapter.process_zw_data(zw_data, parsed_zw, options)
+            
+        except Exception as e:
+            logger.error(f"Error processing ZW data with engine {engine_name}: {e}")
+            return {
+                "status": "error",
+                "message": f"Exception during processing: {str(e)}",
+                "results": []
+            }
+    
+    def _process_batch_with_engine(self, engine_name: str, batch: List[Tuple[str, Dict[str, Any]]],
+                                   options: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run one engine on several packets, through its process_zw_batch when
+        it has one. Never raises, like _process_with_engine.
+        
+        Returns:
+            One result dictionary per packet, in order
+        """
+        adapter = self.adapters.get(engine_name)
+        process_batch = getattr(adapter, "process_zw_batch", None)
+        if process_batch is None or len(batch) == 1:
+            return [self._process_with_engine(engine_name, zw_data, parsed_zw, options)
+                    for zw_data, parsed_zw in batch]
+        try:
+            if not adapter.ensure_initialized():
+                return [{
+                    "status": "error",
+                    "message": f"Engine {engine_name} failed to initialize",
+                    "results": []
+                } for _ in batch]
+            
+            logger.info("Routing %d ZW packets to engine: %s", len(batch), engine_name)
+            return process_batch(batch, options)
+            
+        except Exception as e:
+            logger.error(f"Error processing ZW batch with engine {engine_name}: {e}")
+            return [{
+                "status": "error",
+                "message": f"Exception during processing: {str(e)}",
+                "results": []
+            } for _ in batch]
     
     def get_router_status(self) -> Dict[str, Any]:
         """
@@ -187,10 +616,17 @@ class EngineRouter:
             "default_engine": self.default_engine,
             "engines": engines_status,
             "total_capabilities": total_capabilities,
-            "routing_rules": self.routing_rules
+            "routing_rules": {cap: list(names) for cap, names in self.routing_rules.items()},
+            "result_cache": {
+                "enabled": self.result_cache_ttl is not None,
+                "ttl": self.result_cache_ttl,
+                "entries": len(self._result_cache),
+                "max_entries": self.result_cache_size,
+                **self.cache_stats.to_dict()
+            }
         }
     
-    def get_all_capabilities(self) -> Dict[str, List[str]]:
+    def get_all_capabilities(self) -> Dict[str, Tuple[str, ...]]:
         """
         Get capabilities of all registered engines.
         
@@ -209,11 +645,7 @@ class EngineRouter:
         Returns:
             List of engine names that can process this block type
         """
-        capable_engines = []
-        for name, adapter in self.adapters.items():
-            if adapter.can_process(block_type):
-                capable_engines.append(name)
-        return capable_engines
+        return list(_engines_for_normalized(self._rules_snapshot[1], self.adapters, block_type.lower()))
     
     def _determine_target_engines(self, parsed_zw: Dict[str, Any], 
                                  target_engines: Optional[List[str]] = None) -> List[str]:
@@ -229,53 +661,76 @@ class EngineRouter:
         """
         if target_engines:
             # Use explicitly requested engines (if they exist)
-            valid_engines = []
-            for engine in target_engines:
-                engine_lower = engine.lower()
-                if engine_lower in self.adapters:
-                    valid_engines.append(engine_lower)
-                else:
-                    logger.warning(f"Requested engine '{engine}' not registered")
+            known = self._adapter_names_lower
+            requested = [engine.lower() for engine in target_engines]
+            valid_engines = [engine for engine in requested if engine in known]
+            if len(valid_engines) != len(requested):
+                unknown = [engine for engine in target_engines if engine.lower() not in known]
+                logger.warning(f"Requested engines not registered: {', '.join(unknown)}")
             return valid_engines
         
-        # Auto-detect based on ZW content and engine capabilities
-        suitable_engines = set()
-        
-        # Check what ZW blocks are present
-        for key in parsed_zw.keys():
-            if key.upper().startswith('ZW-'):
-                block_type = key.upper().replace('ZW-', '').lower()
-                capable_engines = self.get_engines_for_block_type(block_type)
-                suitable_engines.update(capable_engines)
+        # Auto-detect based on ZW content and the capability index; a key seen
+        # before under the current rules costs a single dict probe
+        _, block_index, key_routes = self._rules_snapshot
+        suitable_engines: Dict[str, None] = {}
+        for key in parsed_zw:
+            engines = key_routes.get(key)
+            if engines is None:
+                block_type = canonical_block_type(key)
+                engines = (_engines_for_normalized(block_index, self.adapters, block_type)
+                           if block_type is not None else ())
+                if len(key_routes) < MAX_KEY_ROUTES:
+                    key_routes[key] = engines
+            if engines:
+                suitable_engines.update(dict.fromkeys(engines))
         
         # If no specific blocks found or no capable engines, use default
         if not suitable_engines and self.default_engine:
-            suitable_engines.add(self.default_engine)
+            return [self.default_engine]
         
         return list(suitable_engines)
     
-    def _update_routing_rules(self, adapter: BaseEngineAdapter):
+    def _update_routing_rules(self, adapter: EngineAdapterProtocol):
         """
         Update routing rules when a new adapter is registered.
+        Caller holds _write_lock.
         
         Args:
             adapter: The newly registered adapter
         """
-        for capability in adapter.get_capabilities():
-            cap_lower = capability.lower()
-            if cap_lower not in self.routing_rules:
-                self.routing_rules[cap_lower] = []
-            
-            if adapter.name not in self.routing_rules[cap_lower]:
-                self.routing_rules[cap_lower].append(adapter.name)
+        self._rules_snapshot = _rules_with_adapter(self._rules_snapshot, adapter)
     
     def _rebuild_routing_rules(self):
         """
-        Rebuild all routing rules from current adapters.
+        Rebuild all routing rules from current adapters. Caller holds
+        _write_lock; call this after changing a registered adapter's capabilities.
         """
-        self.routing_rules = {}
+        snapshot = _empty_rules_snapshot()
         for adapter in self.adapters.values():
-            self._update_routing_rules(adapter)
+            snapshot = _rules_with_adapter(snapshot, adapter)
+        self._rules_snapshot = snapshot
     
+    def close(self, wait: bool = True):
+        """
+        Shut down every engine's dispatch workers. Adapters stay registered;
+        packets routed afterwards come back as per-engine errors until the
+        engine is registered again.
+
+        Args:
+            wait: Block until queued engine jobs have finished
+        """
+        with self._write_lock:
+            executors = list(self._engine_executors.values())
+            self._engine_executors = {}
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "EngineRouter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def __repr__(self) -> str:
         return f"<EngineRouter(engines={len(self.adapters)}, default='{self.default_engine}')>"
+
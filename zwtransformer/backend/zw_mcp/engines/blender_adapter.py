@@ -1,62 +1,142 @@
 # backend/zw_mcp/engines/blender_adapter.py
 import os
+import queue
 import subprocess
 import tempfile
 import json
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from types import ModuleType
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from ..base_adapter import BaseEngineAdapter
+try:
+    import orjson  # Optional; several times faster on large mesh results
+except ImportError:
+    orjson = None
 
 
 logger = logging.getLogger(__name__)
 
+# Seconds a Blender availability / script-exists check stays valid
+_AVAIL_TTL = 30.0
+
+# Seconds a single Blender job may run
+_JOB_TIMEOUT = 120
+
+# Blender output is parsed straight from bytes; both parsers accept them without a str copy
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# ZW block key -> Blender capability that handles it
+_ZW_TO_BLENDER_CAPABILITY = {
+    "ZW-MESH": "mesh",
+    "ZW-OBJECT": "mesh",
+    "ZW-SCENE": "scene",
+    "ZW-MATERIAL": "material",
+    "ZW-LIGHT": "light",
+    "ZW-CAMERA": "camera",
+    "ZW-ANIMATION": "animation",
+    "ZW-COMPOSE": "compose"
+}
+
+# Builds handed to Blender's main thread by other threads; drained by _run_main_thread_jobs
+_MAIN_THREAD_JOBS: "queue.Queue[Callable[[], None]]" = queue.Queue()
+
+# Seconds between bpy.app.timers polls of _MAIN_THREAD_JOBS
+_MAIN_THREAD_POLL = 0.05
+
+
+def _run_main_thread_jobs() -> float:
+    """bpy.app.timers callback: run the builds queued by other threads on the main thread."""
+    while True:
+        try:
+            job = _MAIN_THREAD_JOBS.get_nowait()
+        except queue.Empty:
+            return _MAIN_THREAD_POLL
+        job()
+
+
+def _load_in_process_processor() -> Optional[ModuleType]:
+    """
+    Return the Blender-side ZW processor when this Python is Blender's own
+    (bpy importable), so packets can be built without a subprocess.
+    """
+    try:
+        import bpy  # noqa: F401
+    except ImportError:
+        return None
+    from .. import blender_adapter as processor
+    return processor
+
 
 class BlenderAdapter(BaseEngineAdapter):
     """
     Blender engine adapter for processing ZW data through Blender.
     Handles 3D mesh generation, scene setup, materials, lighting, and cameras.
-    """
     
+    Inside Blender's own Python the packets are built in-process. bpy may only
+    be used from Blender's main thread, so the adapter then runs inline (the
+    router calls it on the routing thread, not a worker). A build requested
+    from any other thread is queued for the main thread through bpy.app.timers
+    and waited on; that needs the main thread to be running Blender's event
+    loop, which initialize() hooks into when it runs there.
+    """
+
+    __slots__ = ('blender_path', 'blender_script_path', '_avail_cache', '_script_cache', '_processor')
+
+    CAPABILITIES = ("mesh", "scene", "material", "light", "camera", "animation", "compose")
+    # Each packet starts a full Blender process; run them one at a time rather than one per worker
+    MAX_CONCURRENCY = 1
+
     def __init__(self, blender_path: str = "blender"):
         super().__init__(name="blender", version="daemon-bridge")
         self.blender_path = blender_path
         self.blender_script_path = "backend/blender_scripts/blender_zw_processor.py"
-        self.capabilities = ["mesh", "scene", "material", "light", "camera", "animation", "compose"]
+        # path -> (result, checked_at); spares a `blender --version` run per packet
+        self._avail_cache: Dict[str, Tuple[bool, float]] = {}
+        self._script_cache: Dict[str, Tuple[bool, float]] = {}
+        # zw_mcp.blender_adapter when running inside Blender; set by initialize()
+        self._processor: Optional[ModuleType] = None
         
-    def get_capabilities(self) -> List[str]:
-        """Return list of ZW block types this adapter can process."""
-        return self.capabilities.copy()
+    @property
+    def runs_inline(self) -> bool:
+        # In-process builds must stay on the caller's (main) thread
+        return self._processor is not None
     
     def get_status(self) -> Dict[str, Any]:
         """Get current adapter status."""
-        # Test if Blender is accessible
-        blender_available = self._test_blender_availability()
+        # Test if Blender is accessible (trivially so when running inside it)
+        blender_available = self._processor is not None or self._test_blender_availability()
         
-        return {
-            "name": self.name,
-            "version": self.version,
-            "capabilities": self.capabilities,
+        status = super().get_status()
+        status.update({
             "status": "active" if blender_available else "error",
             "blender_path": self.blender_path,
             "blender_available": blender_available,
-            "script_path": self.blender_script_path
-        }
+            "script_path": self.blender_script_path,
+            "in_process": self._processor is not None
+        })
+        return status
     
-    def process_zw_data(self, zw_data: str, parsed_zw: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+    def process_zw_data(self, zw_data: str, parsed_zw: Dict[str, Any],
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Process ZW data using Blender.
         
         Args:
             zw_data: Raw ZW string
             parsed_zw: Parsed ZW dictionary  
-            **kwargs: Additional parameters (blender_path override, etc.)
+            options: Additional parameters (blender_path override, etc.)
             
         Returns:
             Processing results dictionary
         """
         # Use custom blender path if provided
-        blender_exec = kwargs.get("blender_path", self.blender_path)
+        blender_exec = options.get("blender_path", self.blender_path) if options else self.blender_path
+        
+        if self._processor is not None and blender_exec == self.blender_path:
+            return self._process_in_process(parsed_zw)
         
         # Validate Blender availability
         if not self._test_blender_availability(blender_exec):
@@ -69,29 +149,143 @@ class BlenderAdapter(BaseEngineAdapter):
             }
         
         try:
-            # Create temporary files for ZW input and JSON output
-            with tempfile.NamedTemporaryFile('w', suffix='.zw', delete=False) as zw_file:
-                zw_file.write(zw_data)
-                zw_input_path = zw_file.name
+            blender_results, return_code, extra = self._run_once(blender_exec, zw_data)
             
-            output_path = zw_input_path + ".json"
-            
-            # Construct Blender command
-            cmd = [
-                blender_exec,
-                "--background",  # Run without UI
-                "--python", self.blender_script_path,
-                "--", zw_input_path, output_path
-            ]
-            
-            logger.info(f"Executing Blender command: {' '.join(cmd)}")
+            return self._summarize_run(blender_results, return_code, extra)
             
+        except subprocess.TimeoutExpired:
+            return self._timeout_result()
+        except Exception as e:
+            logger.error(f"Error during Blender processing: {e}")
+            return self._failure_result(e)
+    
+    @staticmethod
+    def _summarize_run(blender_results: List[Dict[str, Any]], return_code: int,
+                       extra: Dict[str, Any]) -> Dict[str, Any]:
+        # Determine status
+        status = "success" if return_code == 0 else "error"
+        
+        # Count successful operations
+        success_count = len([r for r in blender_results if r.get("status") == "success"])
+        total_count = len(blender_results)
+        
+        return {
+            "status": status,
+            "message": f"Blender processing {'completed' if status == 'success' else 'failed'}: {success_count}/{total_count} operations successful",
+            "results": blender_results,
+            "return_code": return_code,
+            **extra
+        }
+    
+    @staticmethod
+    def _timeout_result() -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "message": "Blender processing timed out after 2 minutes",
+            "results": [],
+            "stdout": "",
+            "stderr": "Process timeout"
+        }
+    
+    @staticmethod
+    def _failure_result(e: Exception) -> Dict[str, Any]:
+        return {
+            "status": "error", 
+            "message": f"Blender processing failed: {str(e)}",
+            "results": [],
+            "stdout": "",
+            "stderr": str(e)
+        }
+    
+    def _process_in_process(self, parsed_zw: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the packet straight into the running Blender session, on the
+        main thread. The result has the same keys as a subprocess run; there
+        is no captured output.
+        """
+        try:
+            if threading.current_thread() is threading.main_thread():
+                self._processor.build_zw_scene(parsed_zw)
+            else:
+                self._build_on_main_thread(parsed_zw)
+        except Exception as e:
+            logger.error(f"Error during in-process Blender processing: {e}")
+            return {
+                "status": "error",
+                "message": f"Blender processing failed: {str(e)}",
+                "results": [{"status": "error", "error": str(e)}],
+                "return_code": 1,
+                "stdout": "",
+                "stderr": "",
+                "in_process": True
+            }
+        return {
+            "status": "success",
+            "message": "Blender processing completed: 1/1 operations successful",
+            "results": [{"status": "success", "blocks": len(parsed_zw)}],
+            "return_code": 0,
+            "stdout": "",
+            "stderr": "",
+            "in_process": True
+        }
+    
+    def _build_on_main_thread(self, parsed_zw: Dict[str, Any]):
+        """Queue a build for Blender's main thread and wait for it; re-raises its error."""
+        import bpy
+        if not bpy.app.timers.is_registered(_run_main_thread_jobs):
+            raise RuntimeError("in-process Blender builds must run on Blender's main thread")
+        done = threading.Event()
+        abandoned = threading.Event()
+        outcome: Dict[str, BaseException] = {}
+        
+        def build():
+            if abandoned.is_set():
+                return
+            try:
+                self._processor.build_zw_scene(parsed_zw)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+        
+        _MAIN_THREAD_JOBS.put(build)
+        if not done.wait(_JOB_TIMEOUT):
+            abandoned.set()
+            raise TimeoutError(f"Blender's main thread did not run the build within {_JOB_TIMEOUT} seconds")
+        if "error" in outcome:
+            raise outcome["error"]
+    
+    def _run_once(self, blender_exec: str, zw_data: str) -> Tuple[List[Dict[str, Any]], int, Dict[str, Any]]:
+        """
+        Process one packet in a fresh Blender process. The ZW text goes in and
+        the results come out through temporary files.
+        
+        Returns:
+            (operation results, return code, extra result fields)
+        """
+        # Create temporary files for ZW input and JSON output
+        with tempfile.NamedTemporaryFile('w', suffix='.zw', delete=False) as zw_file:
+            zw_file.write(zw_data)
+            zw_input_path = zw_file.name
+        
+        output_path = zw_input_path + ".json"
+        
+        # Construct Blender command
+        cmd = [
+            blender_exec,
+            "--background",  # Run without UI
+            "--python", self.blender_script_path,
+            "--", zw_input_path, output_path
+        ]
+        
+        logger.info("Executing Blender command: %s", cmd)
+        
+        try:
             # Execute Blender with timeout
             result = subprocess.run(
                 cmd,
                 capture_output=True,
-                text=True,
-                timeout=120,  # 2 minute timeout
+                timeout=_JOB_TIMEOUT,
                 cwd=os.getcwd()
             )
             
@@ -99,54 +293,29 @@ class BlenderAdapter(BaseEngineAdapter):
             blender_results = []
             if os.path.exists(output_path):
                 try:
-                    with open(output_path, 'r') as f:
-                        blender_results = json.load(f)
-                    os.unlink(output_path)  # Clean up
-                except (json.JSONDecodeError, FileNotFoundError) as e:
+                    with open(output_path, 'rb') as f:
+                        blender_results = _json_loads(f.read())
+                except (ValueError, FileNotFoundError) as e:
                     logger.warning(f"Could not parse Blender output JSON: {e}")
-            
-            # Clean up input file
-            os.unlink(zw_input_path)
-            
-            # Determine status
-            status = "success" if result.returncode == 0 else "error"
-            
-            # Count successful operations
-            success_count = len([r for r in blender_results if r.get("status") == "success"])
-            total_count = len(blender_results)
-            
-            return {
-                "status": status,
-                "message": f"Blender processing {'completed' if status == 'success' else 'failed'}: {success_count}/{total_count} operations successful",
-                "results": blender_results,
-                "return_code": result.returncode,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "temp_input": zw_input_path,
-                "temp_output": output_path
-            }
-            
-        except subprocess.TimeoutExpired:
-            return {
-                "status": "error",
-                "message": "Blender processing timed out after 2 minutes",
-                "results": [],
-                "stdout": "",
-                "stderr": "Process timeout"
-            }
-        except Exception as e:
-            logger.error(f"Error during Blender processing: {e}")
-            return {
-                "status": "error", 
-                "message": f"Blender processing failed: {str(e)}",
-                "results": [],
-                "stdout": "",
-                "stderr": str(e)
-            }
+        finally:
+            # Clean up, including after a timeout
+            for path in (zw_input_path, output_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        
+        return blender_results, result.returncode, {
+            "stdout": result.stdout.decode("utf-8", errors="replace"),
+            "stderr": result.stderr.decode("utf-8", errors="replace"),
+            "temp_input": zw_input_path,
+            "temp_output": output_path
+        }
     
     def _test_blender_availability(self, blender_path: Optional[str] = None) -> bool:
         """
-        Test if Blender is available and accessible.
+        Test if Blender is available and accessible. Results are reused
+        per path for _AVAIL_TTL seconds.
         
         Args:
             blender_path: Optional override for Blender executable path
@@ -155,7 +324,10 @@ class BlenderAdapter(BaseEngineAdapter):
             True if Blender is accessible, False otherwise
         """
         test_path = blender_path or self.blender_path
-        
+        return self._cached_check(self._avail_cache, test_path, self._probe_blender)
+    
+    @staticmethod
+    def _probe_blender(test_path: str) -> bool:
         try:
             # Try to get Blender version (quick test)
             result = subprocess.run(
@@ -168,6 +340,22 @@ class BlenderAdapter(BaseEngineAdapter):
         except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
             return False
     
+    def _script_exists(self) -> bool:
+        """Check that the Blender-side processing script is present."""
+        return self._cached_check(self._script_cache, self.blender_script_path, os.path.exists)
+    
+    @staticmethod
+    def _cached_check(cache: Dict[str, Tuple[bool, float]], key: str,
+                      check: Callable[[str], bool]) -> bool:
+        """Return check(key), reusing a result younger than _AVAIL_TTL."""
+        now = time.monotonic()
+        cached = cache.get(key)
+        if cached is not None and now - cached[1] < _AVAIL_TTL:
+            return cached[0]
+        ok = check(key)
+        cache[key] = (ok, now)
+        return ok
+    
     def validate_config(self, config: Dict[str, Any]) -> bool:
         """
         Validate Blender-specific configuration.
@@ -186,7 +374,7 @@ class BlenderAdapter(BaseEngineAdapter):
                 return False
         
         # Check if Blender script exists
-        if not os.path.exists(self.blender_script_path):
+        if not self._script_exists():
             logger.error(f"Blender script not found: {self.blender_script_path}")
             return False
         
@@ -202,28 +390,14 @@ class BlenderAdapter(BaseEngineAdapter):
         Returns:
             List of ZW block types Blender can process
         """
-        blender_blocks = []
-        
-        # Map ZW block types to Blender capabilities
-        zw_to_blender_map = {
-            "ZW-MESH": "mesh",
-            "ZW-OBJECT": "mesh", 
-            "ZW-SCENE": "scene",
-            "ZW-MATERIAL": "material",
-            "ZW-LIGHT": "light", 
-            "ZW-CAMERA": "camera",
-            "ZW-ANIMATION": "animation",
-            "ZW-COMPOSE": "compose"
-        }
-        
-        for zw_key in parsed_zw.keys():
-            zw_upper = zw_key.upper()
-            if zw_upper in zw_to_blender_map:
-                capability = zw_to_blender_map[zw_upper]
-                if capability in self.capabilities:
-                    blender_blocks.append(capability)
-        
-        return blender_blocks
+        # Capabilities are checked against the adapter's precomputed lookup set,
+        # not by scanning the capabilities list
+        capability_for = _ZW_TO_BLENDER_CAPABILITY.get
+        can_process = self.can_process_normalized
+        return [
+            capability for zw_key in parsed_zw
+            if (capability := capability_for(zw_key.upper())) is not None and can_process(capability)
+        ]
     
     def initialize(self) -> bool:
         """
@@ -232,6 +406,17 @@ class BlenderAdapter(BaseEngineAdapter):
         Returns:
             True if initialization successful
         """
+        # Inside Blender's own Python there is nothing to spawn or probe
+        self._processor = _load_in_process_processor()
+        if self._processor is not None:
+            if threading.current_thread() is threading.main_thread():
+                import bpy
+                if not bpy.app.timers.is_registered(_run_main_thread_jobs):
+                    bpy.app.timers.register(_run_main_thread_jobs, persistent=True)
+            self.status = "active"
+            logger.info("Blender adapter initialized in-process (bpy available)")
+            return True
+        
         # Test Blender availability
         if not self._test_blender_availability():
             logger.error(f"Blender initialization failed: executable not found at {self.blender_path}")
@@ -239,7 +424,7 @@ class BlenderAdapter(BaseEngineAdapter):
             return False
         
         # Check for required Blender script
-        if not os.path.exists(self.blender_script_path):
+        if not self._script_exists():
             logger.error(f"Blender script not found: {self.blender_script_path}")
             self.status = "error"
             return False
@@ -0,0 +1,369 @@
+# zw_mcp/test_engine_router.py
+# Run from backend/: python -m unittest zw_mcp.test_engine_router
+import threading
+import time
+import unittest
+
+from zw_mcp.base_adapter import BaseEngineAdapter
+from zw_mcp.engine_router import EngineRouter
+
+
+class RecordingAdapter(BaseEngineAdapter):
+    """Adapter that records every packet it processes."""
+
+    __slots__ = ('calls',)
+
+    CAPABILITIES = ("mesh",)
+
+    def __init__(self, name: str, capabilities=None):
+        super().__init__(name)
+        if capabilities is not None:
+            self.capabilities = list(capabilities)
+        self.calls = []
+
+    def process_zw_data(self, zw_data, parsed_zw, options=None):
+        self.calls.append(zw_data)
+        return {"status": "success", "message": "ok", "results": [{"zw": zw_data}]}
+
+
+class BatchAdapter(RecordingAdapter):
+    """RecordingAdapter that also records the batches handed to process_zw_batch."""
+
+    __slots__ = ('batches',)
+
+    def __init__(self, name: str, capabilities=None):
+        super().__init__(name, capabilities)
+        self.batches = []
+
+    def process_zw_batch(self, packets, options=None):
+        self.batches.append([zw_data for zw_data, _ in packets])
+        return [self.process_zw_data(zw_data, parsed_zw, options) for zw_data, parsed_zw in packets]
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def make_router(self, ttl=60.0, size=256):
+        router = EngineRouter(result_cache_ttl=ttl, result_cache_size=size)
+        self.addCleanup(router.close)
+        adapter = RecordingAdapter("mesher")
+        router.register_adapter(adapter)
+        return router, adapter
+
+    def test_repeat_packet_is_served_from_cache(self):
+        router, adapter = self.make_router()
+        first = router.route_zw_packet("a", {"ZW-MESH": {}})
+        second = router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(first, second)
+        self.assertEqual(adapter.calls, ["a"])
+        stats = router.get_router_status()["result_cache"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_cache_is_off_by_default(self):
+        router = EngineRouter()
+        self.addCleanup(router.close)
+        adapter = RecordingAdapter("mesher")
+        router.register_adapter(adapter)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(adapter.calls, ["a", "a"])
+
+    def test_entries_expire_after_ttl(self):
+        router, adapter = self.make_router(ttl=0.05)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        time.sleep(0.1)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(adapter.calls, ["a", "a"])
+
+    def test_expired_entries_are_swept_on_insert(self):
+        router, _ = self.make_router(ttl=0.05)
+        for zw in ("a", "b", "c"):
+            router.route_zw_packet(zw, {"ZW-MESH": {}})
+        time.sleep(0.1)
+        router.route_zw_packet("d", {"ZW-MESH": {}})
+        self.assertEqual(len(router._result_cache), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        router, adapter = self.make_router(size=2)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        router.route_zw_packet("b", {"ZW-MESH": {}})
+        router.route_zw_packet("a", {"ZW-MESH": {}})  # hit: "b" is now least recent
+        router.route_zw_packet("c", {"ZW-MESH": {}})
+        self.assertEqual(len(router._result_cache), 2)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        router.route_zw_packet("b", {"ZW-MESH": {}})
+        self.assertEqual(adapter.calls, ["a", "b", "c", "b"])
+
+    def test_mutating_a_result_does_not_corrupt_the_cache(self):
+        router, _ = self.make_router()
+        first = router.route_zw_packet("a", {"ZW-MESH": {}})
+        first["results"]["mesher"]["results"].append("junk")
+        first["results"]["mesher"]["results"][0]["zw"] = "changed"
+        hit = router.route_zw_packet("a", {"ZW-MESH": {}})
+        hit["results"]["mesher"]["results"].clear()
+        again = router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(again["results"]["mesher"]["results"], [{"zw": "a"}])
+
+    def test_invalidate_and_invalidate_prefix(self):
+        router, adapter = self.make_router()
+        router.register_adapter(RecordingAdapter("other", capabilities=("light",)))
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        router.route_zw_packet("b", {"ZW-LIGHT": {}})
+        self.assertEqual(router.invalidate_prefix("MESHER"), 1)
+        self.assertEqual(router.invalidate(), 1)
+        self.assertEqual(router.invalidate(), 0)
+        router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(adapter.calls, ["a", "a"])
+
+
+class BatchRoutingTests(unittest.TestCase):
+
+    PACKETS = [
+        ("m1", {"ZW-MESH": {}}),
+        ("l1", {"ZW-LIGHT": {}}),
+        ("both", {"ZW-MESH": {}, "ZW-LIGHT": {}}),
+        ("m2", {"ZW-MESH": {}}),
+    ]
+
+    def setUp(self):
+        self.router = EngineRouter()
+        self.addCleanup(self.router.close)
+        self.mesher = BatchAdapter("mesher")
+        self.lights = RecordingAdapter("lights", capabilities=("light",))
+        self.router.register_adapter(self.mesher)
+        self.router.register_adapter(self.lights)
+
+    def test_each_engine_gets_its_packets_as_one_batch(self):
+        self.router.route_zw_packets(self.PACKETS)
+        self.assertEqual(self.mesher.batches, [["m1", "both", "m2"]])
+        # No process_zw_batch: the packets are processed one by one
+        self.assertEqual(self.lights.calls, ["l1", "both"])
+
+    def test_results_come_back_in_packet_order(self):
+        routed = self.router.route_zw_packets(self.PACKETS)
+        self.assertEqual([r["engines_used"] for r in routed],
+                         [["mesher"], ["lights"], ["mesher", "lights"], ["mesher"]])
+        self.assertEqual([r["results"]["mesher"]["results"] for r in routed if "mesher" in r["results"]],
+                         [[{"zw": "m1"}], [{"zw": "both"}], [{"zw": "m2"}]])
+
+    def test_batch_results_match_single_packet_routing(self):
+        routed = self.router.route_zw_packets(self.PACKETS)
+        single = [self.router.route_zw_packet(zw, parsed) for zw, parsed in self.PACKETS]
+        self.assertEqual(routed, single)
+
+    def test_target_engines_apply_to_every_packet(self):
+        routed = self.router.route_zw_packets(self.PACKETS, target_engines=["MESHER"])
+        self.assertEqual([r["engines_used"] for r in routed], [["mesher"]] * 4)
+        self.assertEqual(self.mesher.batches, [["m1", "l1", "both", "m2"]])
+        self.assertEqual(self.lights.calls, [])
+
+    def test_unknown_target_engine_is_an_error_per_packet(self):
+        routed = self.router.route_zw_packets(self.PACKETS[:2], target_engines=["nope"])
+        self.assertEqual([r["status"] for r in routed], ["error", "error"])
+
+    def test_cached_packets_are_not_sent_again(self):
+        self.router.result_cache_ttl = 60.0
+        self.router.route_zw_packets(self.PACKETS[:2])
+        self.router.route_zw_packets(self.PACKETS)
+        self.assertEqual(self.mesher.calls, ["m1", "both", "m2"])
+        # A lone packet skips process_zw_batch
+        self.assertEqual(self.mesher.batches, [["both", "m2"]])
+        self.assertEqual(self.lights.calls, ["l1", "both"])
+
+
+class SlowAdapter(BatchAdapter):
+    """BatchAdapter running one job at a time that blocks until released."""
+
+    __slots__ = ('release',)
+
+    MAX_CONCURRENCY = 1
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.release = threading.Event()
+
+    def process_zw_data(self, zw_data, parsed_zw, options=None):
+        self.release.wait(5)
+        return super().process_zw_data(zw_data, parsed_zw, options)
+
+
+class ShortBatchAdapter(BatchAdapter):
+    """BatchAdapter whose process_zw_batch drops the last packet's result."""
+
+    __slots__ = ()
+
+    def process_zw_batch(self, packets, options=None):
+        return super().process_zw_batch(packets, options)[:-1]
+
+
+class BatchFailureTests(unittest.TestCase):
+
+    def test_queued_batch_times_out_with_error_results(self):
+        router = EngineRouter(dispatch_timeout=0.2)
+        adapter = SlowAdapter("mesher")
+        router.register_adapter(adapter)
+        self.addCleanup(router.close)
+        self.addCleanup(adapter.release.set)
+        # Occupies the engine's only worker, so the batch below stays queued
+        busy = threading.Thread(target=router.route_zw_packet, args=("busy", {"ZW-MESH": {}}))
+        busy.start()
+        self.addCleanup(busy.join)
+        time.sleep(0.05)
+        routed = router.route_zw_packets([("a", {"ZW-MESH": {}}), ("b", {"ZW-MESH": {}})])
+        self.assertEqual([r["results"]["mesher"]["status"] for r in routed], ["error", "error"])
+        self.assertIn("did not finish", routed[0]["results"]["mesher"]["message"])
+
+    def test_wrong_length_batch_gives_per_packet_errors(self):
+        router = EngineRouter()
+        self.addCleanup(router.close)
+        router.register_adapter(ShortBatchAdapter("mesher"))
+        routed = router.route_zw_packets([("a", {"ZW-MESH": {}}), ("b", {"ZW-MESH": {}})])
+        self.assertEqual(len(routed), 2)
+        for result in routed:
+            self.assertEqual(result["results"]["mesher"]["status"], "error")
+            self.assertIn("1 results for a batch of 2", result["results"]["mesher"]["message"])
+
+
+class InlineAdapter(RecordingAdapter):
+    """RecordingAdapter that must run on the routing thread."""
+
+    __slots__ = ('threads',)
+
+    def __init__(self, name: str, capabilities=None):
+        super().__init__(name, capabilities)
+        self.threads = []
+
+    @property
+    def runs_inline(self) -> bool:
+        return True
+
+    def process_zw_data(self, zw_data, parsed_zw, options=None):
+        self.threads.append(threading.current_thread())
+        return super().process_zw_data(zw_data, parsed_zw, options)
+
+
+class InlineEngineTests(unittest.TestCase):
+
+    def test_inline_engine_runs_on_the_routing_thread(self):
+        router = EngineRouter()
+        self.addCleanup(router.close)
+        adapter = InlineAdapter("mesher")
+        router.register_adapter(adapter)
+        router.register_adapter(RecordingAdapter("lights", capabilities=("light",)))
+        router.route_zw_packet("a", {"ZW-MESH": {}, "ZW-LIGHT": {}})
+        routed = router.route_zw_packets([("b", {"ZW-MESH": {}}), ("c", {"ZW-MESH": {}})])
+        self.assertEqual([r["status"] for r in routed], ["success", "success"])
+        self.assertEqual(adapter.threads, [threading.current_thread()] * 3)
+
+
+class CountingInitAdapter(RecordingAdapter):
+    """RecordingAdapter whose slow initialize() counts its runs."""
+
+    __slots__ = ('init_runs',)
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.init_runs = 0
+
+    def initialize(self):
+        self.init_runs += 1
+        time.sleep(0.05)
+        return super().initialize()
+
+
+class AdapterInitTests(unittest.TestCase):
+
+    def test_concurrent_ensure_initialized_runs_initialize_once(self):
+        adapter = CountingInitAdapter("mesher")
+        threads = [threading.Thread(target=adapter.ensure_initialized) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(adapter.init_runs, 1)
+        self.assertTrue(adapter.ensure_initialized())
+
+
+class CapabilityCacheTests(unittest.TestCase):
+
+    def test_capability_change_is_seen_by_can_process(self):
+        adapter = RecordingAdapter("mesher")
+        self.assertFalse(adapter.can_process("LIGHT"))
+        adapter.capabilities.append("light")
+        self.assertTrue(adapter.can_process("LIGHT"))
+
+    def test_entry_from_before_a_capability_change_is_not_served(self):
+        adapter = RecordingAdapter("mesher", capabilities=("mesh", "light"))
+        generation = adapter._caps_generation
+        adapter.capabilities.remove("light")
+        # What a thread that computed its answer before the change would publish
+        adapter._pic = (generation, (("LIGHT", True),))
+        self.assertFalse(adapter.can_process("LIGHT"))
+
+
+class PrefixRoutingParityTests(unittest.TestCase):
+    """The router must pick exactly the engines whose adapters accept a block type."""
+
+    BLOCK_TYPES = ("mesh", "mesh.foo", "mesh.skinned", "mesh.skinned.cloth",
+                   "mesh.x.y", "light", "light.spot", "scene.foo")
+
+    def setUp(self):
+        self.router = EngineRouter()
+        self.addCleanup(self.router.close)
+        self.adapters = [
+            RecordingAdapter("flat"),                                   # {"mesh"}
+            RecordingAdapter("tree", capabilities=("mesh", "mesh.skinned")),
+            RecordingAdapter("deep", capabilities=("mesh.skinned",)),
+            RecordingAdapter("lights", capabilities=("light",)),
+        ]
+        for adapter in self.adapters:
+            self.router.register_adapter(adapter)
+
+    def test_root_capability_covers_dotted_type_when_adapter_has_a_trie(self):
+        # {"mesh", "mesh.skinned"} builds a trie in which "mesh" ends a capability
+        self.assertTrue(self.adapters[1].can_process("mesh.foo"))
+        self.assertEqual(self.router.get_engines_for_block_type("mesh.foo"), ["tree"])
+
+    def test_published_rules_are_read_only(self):
+        rules = self.router.routing_rules
+        with self.assertRaises(TypeError):
+            rules["mesh"] = ("nope",)
+        with self.assertRaises(TypeError):
+            self.router._rules_snapshot[1]["mesh"] = ("nope",)
+        self.assertEqual(self.router.get_engines_for_block_type("mesh"), ["flat", "tree"])
+
+    def test_router_matches_adapters_for_every_block_type(self):
+        for block_type in self.BLOCK_TYPES:
+            expected = [a.name for a in self.adapters if a.can_process(block_type)]
+            with self.subTest(block_type=block_type):
+                self.assertEqual(self.router.get_engines_for_block_type(block_type), expected)
+                self.assertEqual(
+                    self.router._determine_target_engines({"ZW-" + block_type.upper(): {}}),
+                    expected or [self.router.default_engine])
+
+
+class ExecutorLifecycleTests(unittest.TestCase):
+
+    def test_reregistering_shuts_down_the_replaced_executor(self):
+        with EngineRouter() as router:
+            router.register_adapter(RecordingAdapter("mesher"))
+            first = router._engine_executors["mesher"]
+            router.register_adapter(RecordingAdapter("mesher"))
+            self.assertIsNot(router._engine_executors["mesher"], first)
+            with self.assertRaises(RuntimeError):
+                first.submit(int)
+
+    def test_close_shuts_down_every_executor(self):
+        with EngineRouter() as router:
+            router.register_adapter(RecordingAdapter("mesher"))
+            router.register_adapter(RecordingAdapter("lights", capabilities=("light",)))
+            executors = list(router._engine_executors.values())
+        self.assertEqual(router._engine_executors, {})
+        for executor in executors:
+            with self.assertRaises(RuntimeError):
+                executor.submit(int)
+        result = router.route_zw_packet("a", {"ZW-MESH": {}})
+        self.assertEqual(result["results"]["mesher"]["status"], "error")
+
+
+if __name__ == "__main__":
+    unittest.main()